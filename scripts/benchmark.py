@@ -0,0 +1,468 @@
+#! /usr/bin/env python3
+
+"""
+Benchmarks the preprocessing pipeline on synthetic datasets that are multiples of the size of the
+real one, timing each stage and measuring its peak memory. Reports are written as JSON and can be
+compared against a report from an earlier run to flag regressions:
+
+    python3 scripts/benchmark.py --scales 1 10 --output benchmark.json
+    python3 scripts/benchmark.py --scales 1 10 --baseline benchmark.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    from scripts.map_layout import compute_map_layout
+    from scripts.preprocess import Preprocess
+except ImportError:  # run directly, as python3 scripts/benchmark.py
+    from map_layout import compute_map_layout
+    from preprocess import Preprocess
+
+SCALES = [1, 10, 100, 1000]
+# Every scale is run by default. The 1000x scale takes several minutes and a few GB of
+# memory; pass --scales to run fewer
+DEFAULT_SCALES = SCALES
+# Approximate size of the real dataset, which is the 1x scale. Countries do not grow with scale
+NODES_PER_SCALE = {
+    "process": 11,
+    "tool_resource": 90,
+    "material_resource": 17,
+    "design_resource": 7,
+}
+STAGES_PER_SCALE = 3
+ORGS_PER_SCALE = 380
+COUNTRIES = [
+    "USA", "CHN", "TWN", "KOR", "JPN", "DEU", "NLD", "GBR", "FRA", "ISR", "SGP", "MYS",
+    "IND", "CAN", "CHE", "AUT", "BEL", "ITA", "IRL", "SWE", "FIN", "RUS", "VNM",
+]  # fmt: skip
+# Share of resources of each type that are variants of another resource
+VARIANT_SHARE = {"tool_resource": 0.8, "material_resource": 0.6, "design_resource": 0.5}
+# Variants are variants of one of this many preceding resources, which produces variant chains
+# up to MAX_VARIANT_DEPTH long
+VARIANT_WINDOW = 20
+MAX_VARIANT_DEPTH = 3
+NUM_SOURCES = 40
+YEARS = ["2019", "2021", "2022", "2025"]
+CSV_FIELDS = {
+    "inputs": [
+        "input_id",
+        "input_name",
+        "type",
+        "stage_name",
+        "stage_id",
+        "description",
+        "year",
+        "market_share_chart_global_market_size_info",
+        "market_share_chart_caption",
+        "market_share_chart_source",
+    ],
+    "stages": [
+        "stage_id",
+        "stage_name",
+        "description",
+        "market_share_chart_global_market_size_info",
+        "market_share_chart_caption",
+        "market_share_chart_source",
+    ],
+    "sequence": [
+        "input_name",
+        "input_id",
+        "goes_into_name",
+        "goes_into_id",
+        "is_type_of_name",
+        "is_type_of_id",
+    ],
+    "providers": ["provider_name", "alias", "provider_id", "provider_type", "country"],
+    "provision": [
+        "provider_name",
+        "provider_id",
+        "provided_name",
+        "provided_id",
+        "share_provided",
+        "year",
+        "source",
+    ],
+}
+
+
+def _mk_shares(rng: random.Random, num: int) -> list:
+    """
+    Split a market between providers, leaving some shares unknown
+
+    :param rng: Random number generator
+    :param num: Number of providers
+    :return: List of share strings, which are empty for unknown shares
+    """
+    cuts = sorted(rng.uniform(0, 100) for _ in range(num - 1))
+    shares = [b - a for a, b in zip([0] + cuts, cuts + [100])]
+    return ["" if rng.random() < 0.15 else f"{share:.1f}" for share in shares]
+
+
+def generate_dataset(output_dir: str, scale: int, seed: int = 0) -> dict:
+    """
+    Write a synthetic dataset shaped like the real one. Processes form a DAG that ends in a
+    single final output, resources feed into processes, and most resources are variants of other
+    resources, in chains. The same scale and seed always produce the same files
+
+    :param output_dir: Directory to write the csvs to
+    :param scale: Size of the dataset, as a multiple of the size of the real dataset
+    :param seed: Random seed
+    :return: Dict mapping each csv's name ("inputs", "stages", "sequence", "providers",
+        "provision") to its path
+    """
+    rng = random.Random(f"{seed}:{scale}")
+    rows = {name: [] for name in CSV_FIELDS}
+    sources = [
+        f"Source {idx}, [report {idx}](https://example.com/reports/{idx})"
+        for idx in range(NUM_SOURCES)
+    ]
+    names = {}
+
+    def add_node(node_type, stage_id=""):
+        node_id = f"N{len(names)}"
+        names[node_id] = f"{node_type} {len(names)}"
+        rows["inputs"].append(
+            {
+                "input_id": node_id,
+                "input_name": names[node_id],
+                "type": node_type,
+                "stage_id": stage_id,
+                "description": f"Description of {names[node_id]}. " * 5,
+                "market_share_chart_global_market_size_info": "$1 billion",
+                "market_share_chart_caption": "",
+                "market_share_chart_source": rng.choice(sources),
+            }
+        )
+        return node_id
+
+    num_stages = STAGES_PER_SCALE * scale
+    for idx in range(num_stages):
+        rows["stages"].append(
+            {
+                "stage_id": f"S{idx + 1}",
+                "stage_name": f"Stage {idx + 1}",
+                "description": f"Description of stage {idx + 1}. " * 5,
+                "market_share_chart_global_market_size_info": "$1 billion",
+                "market_share_chart_caption": "",
+                "market_share_chart_source": rng.choice(sources),
+            }
+        )
+
+    def add_edge(parent, child="", variant_of=""):
+        rows["sequence"].append(
+            {
+                "input_name": names[parent],
+                "input_id": parent,
+                "goes_into_name": names.get(child, ""),
+                "goes_into_id": child,
+                "is_type_of_name": names.get(variant_of, ""),
+                "is_type_of_id": variant_of,
+            }
+        )
+
+    # Processes are created in topological order, so edges only go to later processes
+    num_processes = NODES_PER_SCALE["process"] * scale
+    processes = [
+        add_node("process", f"S{idx * num_stages // num_processes + 1}")
+        for idx in range(num_processes)
+    ]
+    final_output = add_node("ultimate_output")
+    for idx, process in enumerate(processes[:-1]):
+        later = processes[idx + 1 : idx + 6]
+        for child in rng.sample(later, min(len(later), 1 + (rng.random() < 0.6))):
+            add_edge(process, child)
+    add_edge(processes[-1], final_output)
+
+    resources = []
+    for node_type in ["tool_resource", "material_resource", "design_resource"]:
+        # Resources of this type that can have more variants, and the variant depth of each
+        parents = []
+        depths = {}
+        for _ in range(NODES_PER_SCALE[node_type] * scale):
+            node_id = add_node(node_type)
+            depths[node_id] = 0
+            if parents and rng.random() < VARIANT_SHARE[node_type]:
+                parent = rng.choice(parents[-VARIANT_WINDOW:])
+                add_edge(node_id, variant_of=parent)
+                depths[node_id] = depths[parent] + 1
+            else:
+                for child in rng.sample(processes, 1 + (rng.random() < 0.1)):
+                    add_edge(node_id, child)
+            if depths[node_id] < MAX_VARIANT_DEPTH:
+                parents.append(node_id)
+            resources.append(node_id)
+
+    for country in COUNTRIES:
+        rows["providers"].append(
+            {
+                "provider_name": country,
+                "provider_id": f"P{len(rows['providers']) + 1}",
+                "provider_type": "country",
+            }
+        )
+    countries = list(rows["providers"])
+    for idx in range(ORGS_PER_SCALE * scale):
+        rows["providers"].append(
+            {
+                "provider_name": f"Org {idx}",
+                "provider_id": f"P{len(rows['providers']) + 1}",
+                "provider_type": "organization",
+                "country": rng.choice(COUNTRIES),
+            }
+        )
+    orgs = rows["providers"][len(countries) :]
+
+    def add_provision(provider, provided, share, year):
+        rows["provision"].append(
+            {
+                "provider_name": provider["provider_name"],
+                "provider_id": provider["provider_id"],
+                "provided_name": names.get(provided, provided),
+                "provided_id": provided,
+                "share_provided": share,
+                "year": year,
+                "source": "Synthetic data",
+            }
+        )
+
+    stage_ids = [stage["stage_id"] for stage in rows["stages"]]
+    for provided in resources + stage_ids:
+        years = ["2025"] + [year for year in YEARS[:-1] if rng.random() < 0.1]
+        for year in years:
+            providers = rng.sample(countries, rng.randint(1, 6))
+            for provider, share in zip(providers, _mk_shares(rng, len(providers))):
+                add_provision(provider, provided, share, year)
+    for provided in resources + processes:
+        for provider in rng.sample(orgs, rng.randint(0, 8)):
+            share = "" if rng.random() < 0.3 else f"{rng.uniform(0.5, 40):.1f}"
+            add_provision(provider, provided, share, rng.choice(YEARS))
+
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    for name, fieldnames in CSV_FIELDS.items():
+        files[name] = os.path.join(output_dir, f"{name}.csv")
+        with open(files[name], mode="w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+            writer.writeheader()
+            writer.writerows(rows[name])
+    return files
+
+
+def get_stages(files: dict, output_dir: str) -> list:
+    """
+    Get the pipeline stages to benchmark, in the order they run in
+
+    :param files: Dict mapping csv names to paths, from generate_dataset
+    :param output_dir: Directory stages write their output to
+    :return: List of (stage name, function) tuples. Each function takes a Preprocess instance
+        and runs its stage on it
+    """
+
+    def generate_graph(pp):
+        pp.graph, pp.graph_reverse = pp.generate_graph(
+            pp.tables.rows(files["sequence"])
+        )
+
+    def pdf_prep(pp):
+        pp._get_node_to_org_desc_list()
+        pp._get_sub_variants()
+
+    return [
+        ("load_tables", lambda pp: [pp.tables.get(fi) for fi in files.values()]),
+        ("mk_metadata", lambda pp: pp.mk_metadata(files["inputs"], files["stages"])),
+        ("generate_graph", generate_graph),
+        (
+            "compute_map_layout",
+            lambda pp: compute_map_layout(pp.graph, pp.graph_reverse, pp.node_to_meta),
+        ),
+        ("mk_provider_to_meta", lambda pp: pp.mk_provider_to_meta(files["providers"])),
+        (
+            "write_provision",
+            lambda pp: pp.write_provision(files["provision"], output_dir),
+        ),
+        (
+            "get_provision_concentration",
+            lambda pp: pp.get_provision_concentration(pp.country_provision),
+        ),
+        (
+            "_get_node_to_country_provision",
+            lambda pp: pp._get_node_to_country_provision(),
+        ),
+        ("pdf_prep", pdf_prep),
+    ]
+
+
+def run_pipeline(files: dict, output_dir: str, trace_memory: bool = False) -> dict:
+    """
+    Run each stage of the pipeline once, on a fresh Preprocess instance
+
+    :param files: Dict mapping csv names to paths, from generate_dataset
+    :param output_dir: Directory stages write their output to
+    :param trace_memory: If true, measure each stage's peak memory with tracemalloc, which
+        slows the stages down, instead of timing them
+    :return: Dict mapping stage names to seconds taken, or to peak bytes allocated above what
+        was allocated when the stage started
+    """
+    pp = Preprocess(argparse.Namespace(), is_test=True)
+    measurements = {}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        # Stages print warnings about the data, which would swamp the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, stage in get_stages(files, output_dir):
+                if trace_memory:
+                    tracemalloc.reset_peak()
+                    start, _ = tracemalloc.get_traced_memory()
+                    stage(pp)
+                    measurements[name] = tracemalloc.get_traced_memory()[1] - start
+                else:
+                    start = time.perf_counter()
+                    stage(pp)
+                    measurements[name] = time.perf_counter() - start
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return measurements
+
+
+def run_benchmark(
+    scales: list = DEFAULT_SCALES, repeat: int = 3, data_dir: str = None, seed: int = 0
+) -> dict:
+    """
+    Benchmark the pipeline at several scales
+
+    :param scales: Dataset sizes, as multiples of the size of the real dataset
+    :param repeat: Number of times to time each scale. The fastest time of each stage is kept
+    :param data_dir: Directory to generate datasets in; a temporary directory if None
+    :param seed: Random seed for the generated datasets
+    :return: Report, as a dict with the "python" version, "platform", and "scales", a dict
+        mapping each scale to the number of "rows" in each csv and the "seconds" and
+        "peak_bytes" of each stage
+    """
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            dataset_dir = os.path.join(data_dir or tmp_dir, f"scale_{scale}")
+            output_dir = os.path.join(tmp_dir, f"output_{scale}")
+            os.makedirs(output_dir, exist_ok=True)
+            files = generate_dataset(dataset_dir, scale, seed)
+            rows = {}
+            for name, fi in files.items():
+                with open(fi, encoding="utf-8", newline="") as f:
+                    rows[name] = sum(1 for _ in csv.DictReader(f))
+            if not report["scales"]:
+                # Warm up lazy imports and module-level caches, so they are not counted
+                # against the first scale
+                run_pipeline(files, output_dir)
+            timings = [run_pipeline(files, output_dir) for _ in range(repeat)]
+            peak_bytes = run_pipeline(files, output_dir, trace_memory=True)
+            report["scales"][str(scale)] = {
+                "rows": rows,
+                "seconds": {
+                    name: min(timing[name] for timing in timings) for name in peak_bytes
+                },
+                "peak_bytes": peak_bytes,
+            }
+    return report
+
+
+def compare(
+    report: dict,
+    baseline: dict,
+    tolerance: float = 0.25,
+    min_seconds: float = 0.01,
+    min_bytes: int = 1 << 20,
+) -> list:
+    """
+    Find stages that got slower or used more memory than in a baseline report
+
+    :param report: Report, from run_benchmark
+    :param baseline: Earlier report to compare against
+    :param tolerance: Fraction by which a measurement may exceed the baseline
+    :param min_seconds: Time differences smaller than this are ignored as noise
+    :param min_bytes: Memory differences smaller than this are ignored as noise
+    :return: List of descriptions of regressions
+    """
+    regressions = []
+    for scale, result in report["scales"].items():
+        baseline_result = baseline["scales"].get(scale)
+        if baseline_result is None:
+            continue
+        for metric, min_diff in [("seconds", min_seconds), ("peak_bytes", min_bytes)]:
+            for stage, value in result[metric].items():
+                baseline_value = baseline_result[metric].get(stage)
+                if baseline_value is None:
+                    continue
+                if (
+                    value > baseline_value * (1 + tolerance)
+                    and value - baseline_value > min_diff
+                ):
+                    regressions.append(
+                        f"scale {scale}: {stage} {metric} regressed from "
+                        f"{baseline_value:.4g} to {value:.4g} "
+                        f"({value / baseline_value - 1:+.0%})"
+                    )
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    """
+    Format a report as a table
+
+    :param report: Report, from run_benchmark
+    :return: Human-readable table of each stage's time and peak memory at each scale
+    """
+    lines = []
+    for scale, result in report["scales"].items():
+        lines.append(
+            f"scale {scale}x ("
+            + ", ".join(f"{count} {name}" for name, count in result["rows"].items())
+            + ")"
+        )
+        for stage, seconds in result["seconds"].items():
+            peak_mib = result["peak_bytes"][stage] / (1 << 20)
+            lines.append(f"  {stage:<32} {seconds:>9.4f}s {peak_mib:>9.1f} MiB")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scales", type=int, nargs="+", choices=SCALES, default=DEFAULT_SCALES
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data_dir")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = run_benchmark(args.scales, args.repeat, args.data_dir, args.seed)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, mode="w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
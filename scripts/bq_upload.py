@@ -0,0 +1,238 @@
+"""
+Loads csv files into BigQuery tables concurrently. Every load job is submitted up front against a
+shared client and then waited on together, failed jobs are retried with exponential backoff, and
+tables whose content has not changed since they were last loaded are skipped, so re-running an
+interrupted upload only loads what is missing.
+
+The uploader only uses the parts of the client interface implemented by LocalClient, so it can be
+exercised offline.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Table label holding a checksum of the content the table was last loaded from
+CHECKSUM_LABEL = "content_checksum"
+
+
+def file_checksum(fi: str) -> str:
+    """
+    Checksum a file. md5 is used because its hex digest fits in a BigQuery label value
+
+    :param fi: Path to file
+    :return: Hex digest of the file's content
+    """
+    digest = hashlib.md5()
+    with open(fi, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BqUploader:
+    """
+    Loads csv files into tables with a shared client
+    """
+
+    def __init__(
+        self,
+        client,
+        job_config_fn=None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        sleep=time.sleep,
+    ):
+        """
+        :param client: google.cloud.bigquery.Client, or a stand-in such as LocalClient
+        :param job_config_fn: Function taking a table schema and returning the job config to load
+            it with; defaults to passing the schema through unchanged
+        :param max_retries: Number of times a failed load is retried
+        :param backoff: Seconds to wait before the first retry; doubled for each further retry
+        :param sleep: Function used to wait between retries
+        """
+        self.client = client
+        self.job_config_fn = job_config_fn or (lambda schema: schema)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+
+    def get_checksum(self, table_name: str):
+        """
+        Get the checksum of the content a table was last loaded from
+
+        :param table_name: Fully qualified table name
+        :return: Checksum, or None if the table does not exist or has no checksum
+        """
+        try:
+            table = self.client.get_table(table_name)
+        except Exception:
+            return None
+        return (table.labels or {}).get(CHECKSUM_LABEL)
+
+    def set_checksum(self, table_name: str, checksum: str) -> None:
+        """
+        Record the checksum of the content a table was loaded from in the table's labels
+
+        :param table_name: Fully qualified table name
+        :param checksum: Checksum, from file_checksum
+        :return: None
+        """
+        table = self.client.get_table(table_name)
+        table.labels = {**(table.labels or {}), CHECKSUM_LABEL: checksum}
+        self.client.update_table(table, ["labels"])
+
+    def _load(self, load: dict) -> dict:
+        """
+        Load a file into a table, retrying on failure
+
+        :param load: Dict with the "file", "table" and "schema" of the load
+        :return: Dict describing the result of the load
+        """
+        result = {
+            "table": load["table"],
+            "bytes": os.path.getsize(load["file"]),
+            "attempts": 0,
+            "error": None,
+        }
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            result["attempts"] = attempt + 1
+            try:
+                # Each load reads its own handle, as jobs run concurrently
+                with open(load["file"], "rb") as source_file:
+                    job = self.client.load_table_from_file(
+                        source_file,
+                        load["table"],
+                        job_config=self.job_config_fn(load["schema"]),
+                        rewind=True,
+                    )
+                    job.result()
+                self.set_checksum(load["table"], load["checksum"])
+                result["status"] = "loaded"
+                result["error"] = None
+                break
+            except Exception:
+                result["error"] = traceback.format_exc()
+                if attempt < self.max_retries:
+                    self.sleep(self.backoff * 2**attempt)
+        else:
+            result["status"] = "failed"
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def upload(self, loads: list) -> list:
+        """
+        Load files into tables concurrently, skipping tables that already hold the file's content
+
+        :param loads: List of dicts with the "file" to load, the fully qualified "table" to
+            load it into, and the table "schema"
+        :return: List of dicts describing each load, in the order of `loads`, with its "table",
+            "status" ("loaded", "skipped" or "failed"), "bytes", "attempts", "seconds" and
+            "error"
+        """
+        checksums = {}
+        results = [None] * len(loads)
+        pending = []
+        for idx, load in enumerate(loads):
+            if load["file"] not in checksums:
+                checksums[load["file"]] = file_checksum(load["file"])
+            load = {**load, "checksum": checksums[load["file"]]}
+            if self.get_checksum(load["table"]) == load["checksum"]:
+                results[idx] = {
+                    "table": load["table"],
+                    "status": "skipped",
+                    "bytes": 0,
+                    "attempts": 0,
+                    "seconds": 0.0,
+                    "error": None,
+                }
+            else:
+                pending.append((idx, load))
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [
+                    (idx, executor.submit(self._load, load)) for idx, load in pending
+                ]
+                for idx, future in futures:
+                    results[idx] = future.result()
+        return results
+
+    @staticmethod
+    def report(results: list) -> str:
+        """
+        Summarize the results of an upload
+
+        :param results: Results, from upload
+        :return: Human-readable summary with one line per load
+        """
+        lines = []
+        for result in results:
+            line = f"{result['status']} {result['table']}"
+            if result["status"] != "skipped":
+                line += (
+                    f": {result['bytes']} bytes in {result['seconds']:.2f}s"
+                    f" ({result['attempts']} attempt(s))"
+                )
+            lines.append(line)
+            if result["status"] == "failed":
+                lines.append(result["error"])
+        return "\n".join(lines)
+
+
+class LocalTable:
+    def __init__(self, table_name: str, labels: dict = None):
+        self.table_id = table_name
+        self.labels = labels or {}
+
+
+class LocalJob:
+    def result(self):
+        return self
+
+
+class LocalClient:
+    """
+    Stand-in for google.cloud.bigquery.Client that copies loaded files into a local directory,
+    keeping table labels alongside them
+    """
+
+    def __init__(self, output_dir: str):
+        """
+        :param output_dir: Directory tables are written to
+        """
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _table_fi(self, table_name: str) -> str:
+        return os.path.join(self.output_dir, table_name + ".csv")
+
+    def _labels_fi(self, table_name: str) -> str:
+        return os.path.join(self.output_dir, table_name + ".labels.json")
+
+    def get_table(self, table_name: str) -> LocalTable:
+        if not os.path.exists(self._table_fi(table_name)):
+            raise KeyError(f"Not found: Table {table_name}")
+        labels = {}
+        if os.path.exists(self._labels_fi(table_name)):
+            with open(self._labels_fi(table_name)) as f:
+                labels = json.load(f)
+        return LocalTable(table_name, labels)
+
+    def update_table(self, table: LocalTable, fields: list) -> LocalTable:
+        with open(self._labels_fi(table.table_id), mode="w") as f:
+            json.dump(table.labels, f)
+        return table
+
+    def load_table_from_file(
+        self, source_file, table_name: str, job_config=None, rewind: bool = False
+    ) -> LocalJob:
+        if rewind:
+            source_file.seek(0)
+        with open(self._table_fi(table_name), mode="wb") as f:
+            shutil.copyfileobj(source_file, f)
+        return LocalJob()
@@ -0,0 +1,144 @@
+"""
+Serializes the data files the webapp imports in a canonical form, so that the same data always
+produces the same bytes, whatever order it was read in or whatever order Python iterates sets in.
+Unchanged data then leaves build caches, CDN caches and rsync diffs untouched.
+
+Canonical form:
+* Dict keys are sorted, except where the webapp relies on their order (the dicts under
+  ORDERED_KEYS, and any value serialized with sort_keys=False, whose keys keep the order they
+  were read from the csvs in)
+* Sets are written as sorted lists. Lists keep their order, which is part of the data
+* Floats are written as the shortest string that reads back as the same value, -0.0 is written
+  as 0.0, and NaN and infinity are rejected, since they are not valid json
+
+Each artifact can also be written with precompressed companions (.gz, and .br if the optional
+brotli package is installed) and a .sha256 file holding the artifact's content hash, in the
+format read by sha256sum -c.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # optional; .br companions are skipped without it
+    brotli = None
+
+# Keys of dicts whose key order the webapp relies on: image formats are listed in order of
+# preference, with the fallback last, and country shares are listed highest first
+ORDERED_KEYS = {"image_srcset", "countryShares"}
+
+
+def _canonical_key(key) -> str:
+    """
+    Convert a dict key to the string json would write it as
+
+    :param key: Dict key
+    :return: String key
+    """
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, bool):
+        return json.dumps(key)
+    if isinstance(key, float):
+        return json.dumps(_canonical_float(key))
+    return str(key)
+
+
+def _canonical_float(value: float) -> float:
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError(f"{value} can't be written as json")
+    # -0.0 == 0.0, so this replaces it with 0.0
+    return value + 0.0
+
+
+def canonicalize(value, sort_keys: bool = True):
+    """
+    Convert a value to its canonical form
+
+    :param value: Value made of dicts, lists, tuples, sets, strings, numbers, booleans and None
+    :param sort_keys: If False, the keys of this value (but not of the values nested in it) keep
+        their order
+    :return: Canonical copy of the value
+    """
+    if isinstance(value, dict):
+        items = [
+            (
+                _canonical_key(key),
+                canonicalize(item, key not in ORDERED_KEYS),
+            )
+            for key, item in value.items()
+        ]
+        return dict(sorted(items, key=lambda item: item[0]) if sort_keys else items)
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        items = [canonicalize(item) for item in value]
+        try:
+            return sorted(items)
+        except TypeError:  # mixed types
+            return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    if isinstance(value, float):
+        return _canonical_float(value)
+    return value
+
+
+def to_canonical_json(value, sort_keys: bool = True) -> str:
+    """
+    Serialize a value as canonical json
+
+    :param value: Value to serialize, as in canonicalize
+    :param sort_keys: If False, the keys of the top-level dict keep their order
+    :return: Json string
+    """
+    return json.dumps(canonicalize(value, sort_keys), allow_nan=False)
+
+
+def get_companions(output_fi: str, content: str) -> dict:
+    """
+    Get the precompressed versions and content hash of an artifact. Compression is
+    deterministic, so the same content always gives the same companions
+
+    :param output_fi: Path to the artifact
+    :param content: Content of the artifact
+    :return: Dict mapping paths of companion files to their content, as bytes
+    """
+    data = content.encode("utf-8")
+    companions = {
+        output_fi + ".gz": gzip.compress(data, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        companions[output_fi + ".br"] = brotli.compress(data)
+    digest = hashlib.sha256(data).hexdigest()
+    companions[output_fi + ".sha256"] = (
+        f"{digest}  {os.path.basename(output_fi)}\n".encode("utf-8")
+    )
+    return companions
+
+
+def has_companions(output_fi: str) -> bool:
+    """
+    Check whether the companions of an artifact were written
+
+    :param output_fi: Path to the artifact
+    :return: True if its .gz and .sha256 companions exist
+    """
+    return all(os.path.exists(output_fi + suffix) for suffix in [".gz", ".sha256"])
+
+
+def write_companions(output_fi: str, content: str) -> int:
+    """
+    Write the precompressed versions and content hash of an artifact next to it
+
+    :param output_fi: Path to the artifact
+    :param content: Content of the artifact
+    :return: Number of bytes written
+    """
+    num_bytes = 0
+    for companion_fi, data in get_companions(output_fi, content).items():
+        with open(companion_fi, mode="wb") as f:
+            f.write(data)
+        num_bytes += len(data)
+    return num_bytes
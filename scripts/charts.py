@@ -0,0 +1,171 @@
+"""
+Exports the country provision bar charts included in node pdfs. Charts are exported in batches by
+persistent Kaleido renderers, one per worker process, and only charts whose data changed since
+they were last exported, by the hashes kept in CHART_CACHE_FILE, are re-rendered.
+"""
+
+import hashlib
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import kaleido
+import plotly.graph_objects as go
+import plotly.io as pio
+
+CHART_CACHE_FILE = ".chart_hashes.json"
+
+# Layout shared by every country provision chart. Built once, rather than per figure
+CHART_LAYOUT = go.Layout(
+    xaxis=dict(title="Share of global market"),
+    yaxis=dict(categoryorder="total ascending"),
+    margin=dict(t=30, r=30, b=35, l=120, pad=4),
+)
+
+# Set once the current process has started its persistent Kaleido renderer
+_renderer_started = False
+
+
+def mk_country_provision_figure(graph: list) -> go.Figure:
+    """
+    Generate a bar chart representing country provisions for a node
+
+    :param graph: List of dicts with "country" and "value" keys, sorted by value
+    :return: Plotly figure
+    """
+    return go.Figure(
+        data=[
+            go.Bar(
+                x=[e["value"] for e in graph],
+                y=[e["country"] for e in graph],
+                orientation="h",
+                text=[str(e["value"]) + "%" for e in graph],
+                textposition="auto",
+            )
+        ],
+        layout=CHART_LAYOUT,
+    )
+
+
+def _start_renderer() -> None:
+    """
+    Start a Kaleido renderer that stays warm for the lifetime of the current process, so
+    that exports don't each pay the browser startup cost
+
+    :return: None
+    """
+    global _renderer_started
+    if not _renderer_started:
+        kaleido.start_sync_server(silence_warnings=True)
+        _renderer_started = True
+
+
+def _render_chart_shard(charts: list) -> dict:
+    """
+    Export a shard of charts in one batch with this process's renderer
+
+    :param charts: List of (node id, graph, output path) tuples
+    :return: Dict mapping ids of nodes whose chart could not be exported to an error message
+    """
+    try:
+        _start_renderer()
+        pio.write_images(
+            [mk_country_provision_figure(graph) for _, graph, _ in charts],
+            [output_fi for _, _, output_fi in charts],
+        )
+        return {}
+    except Exception:
+        # Fall back to exporting charts one at a time, to find out which ones fail
+        failures = {}
+        for node_id, graph, output_fi in charts:
+            try:
+                mk_country_provision_figure(graph).write_image(output_fi)
+            except Exception:
+                failures[node_id] = traceback.format_exc()
+        return failures
+
+
+class ChartRenderer:
+    """
+    Exports the country provision bar charts included in node pdfs. Charts whose input data
+    is unchanged since they were last exported are not re-rendered
+    """
+
+    def __init__(self, output_dir: str):
+        """
+        :param output_dir: Directory where chart images should be written
+        """
+        self.output_dir = output_dir
+        self.cache_fi = os.path.join(output_dir, CHART_CACHE_FILE)
+        self.hashes = {}
+        if os.path.exists(self.cache_fi):
+            with open(self.cache_fi) as f:
+                self.hashes = json.load(f)
+
+    @staticmethod
+    def chart_hash(graph: list) -> str:
+        """
+        Hash the input data for a chart
+
+        :param graph: List of dicts with "country" and "value" keys, sorted by value
+        :return: Hex digest of the chart data
+        """
+        return hashlib.sha256(
+            json.dumps(graph, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get_output_fi(self, node_id: str) -> str:
+        """
+        Get the path a node's chart is written to
+
+        :param node_id: Node id
+        :return: Path to chart image
+        """
+        return os.path.join(self.output_dir, node_id) + ".jpg"
+
+    def get_stale(self, charts: dict) -> dict:
+        """
+        Find charts that need to be exported
+
+        :param charts: Dict mapping node ids to chart data
+        :return: Dict mapping node ids to chart data, for charts that are missing or whose
+            data has changed since they were last exported
+        """
+        return {
+            node_id: graph
+            for node_id, graph in charts.items()
+            if self.hashes.get(node_id) != self.chart_hash(graph)
+            or not os.path.exists(self.get_output_fi(node_id))
+        }
+
+    def render(self, charts: dict, workers: int = 1) -> dict:  # pragma: no cover
+        """
+        Export all charts that need to be exported, split into one batch per worker
+
+        :param charts: Dict mapping node ids to chart data
+        :param workers: Number of processes to export charts in
+        :return: Dict mapping ids of nodes whose chart could not be exported to an error message
+        """
+        stale = self.get_stale(charts)
+        print(f"Rendering {len(stale)} of {len(charts)} charts...")
+        items = [
+            (node_id, graph, self.get_output_fi(node_id))
+            for node_id, graph in sorted(stale.items())
+        ]
+        if not items:
+            return {}
+        shards = [items[idx::workers] for idx in range(min(workers, len(items)))]
+        if len(shards) == 1:
+            failures = _render_chart_shard(shards[0])
+        else:
+            failures = {}
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                for shard_failures in executor.map(_render_chart_shard, shards):
+                    failures.update(shard_failures)
+        for node_id, graph in stale.items():
+            if node_id not in failures:
+                self.hashes[node_id] = self.chart_hash(graph)
+        with open(self.cache_fi, mode="w") as f:
+            json.dump(self.hashes, f, indent=2, sort_keys=True)
+        return failures
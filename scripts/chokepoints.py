@@ -0,0 +1,152 @@
+"""
+Rolls the country concentration of inputs up the process graph, so that a process's exposure to
+concentrated inputs anywhere upstream of it can be shown, not just the concentration of the
+process's own inputs.
+
+Nodes are visited once, in topological order, and each node's upstream nodes are built from those
+of the processes that go into it. Sets of upstream nodes are stored as bitsets (Python ints, with
+a bit per node), so that merging them and counting the nodes in them that match a condition are a
+few word operations rather than a loop over nodes. Bitsets are only kept for the nodes the rollup
+visits; a bitset with a single high bit set is as large as one with every bit set, so keeping one
+per node would take memory quadratic in the number of nodes.
+"""
+
+import graphlib
+
+try:
+    from scripts.provision_store import MINOR_PROVISION
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from provision_store import MINOR_PROVISION
+
+# Nodes the rollup is computed for
+ROLLUP_TYPES = {"process", "ultimate_output"}
+INPUT_LISTS = ["tools", "materials"]
+
+
+def _to_bitset(positions: list, num_bits: int) -> int:
+    """
+    Build a bitset from bit positions, in time linear in the number of positions and bits
+
+    :param positions: Positions of the bits to set
+    :param num_bits: Size of the bitset
+    :return: Bitset, as an int
+    """
+    bitset = bytearray(num_bits // 8 + 1)
+    for position in positions:
+        bitset[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bitset, "little")
+
+
+def build_upstream_chokepoints(
+    graph_reverse: dict,
+    node_to_meta: dict,
+    variant_descendants: dict,
+    country_provision: dict,
+    concentration: dict,
+) -> dict:
+    """
+    Summarize the country concentration of the nodes upstream of each process and ultimate
+    output. A node's upstream nodes are its tools and materials with all of their variants, and
+    the processes that go into it along with their upstream nodes
+
+    :param graph_reverse: Dict mapping nodes to lists of the processes that go into them
+    :param node_to_meta: Dict mapping node ids to metadata, including the lists of tools and
+        materials that go into each node
+    :param variant_descendants: Dict mapping nodes to all of their variants, from
+        build_variant_index
+    :param country_provision: Dict mapping countries to dicts mapping node ids to provision values
+    :param concentration: Dict mapping node ids to the number of countries providing most of
+        them, from get_provision_concentration
+    :return: Dict mapping each process and ultimate output to a dict with:
+        * "upstream": the number of nodes upstream of it
+        * "measured": the number of upstream nodes with country provision data
+        * "worstConcentration": the lowest concentration of any upstream node, or None
+        * "singleCountry": the number of upstream nodes that a single country provides most of
+        * "countryShares": dict mapping each country providing any upstream node to the
+          percentage of measured upstream nodes it provides, highest first
+    """
+    positions = {node: position for position, node in enumerate(node_to_meta)}
+    num_bits = len(positions)
+    measured = [
+        node
+        for node, num_countries in concentration.items()
+        if node in positions and num_countries is not None
+    ]
+    measured_mask = _to_bitset([positions[node] for node in measured], num_bits)
+    single_country_mask = _to_bitset(
+        [positions[node] for node in measured if concentration[node] == 1], num_bits
+    )
+    country_masks = {}
+    for country in sorted(country_provision):
+        mask = _to_bitset(
+            [
+                positions[node]
+                for node, value in country_provision[country].items()
+                if node in positions and value != MINOR_PROVISION
+            ],
+            num_bits,
+        )
+        country_masks[country] = mask & measured_mask
+
+    # Each input stands for itself and all of its variants
+    input_positions = {}
+    input_worst = {}
+    for node in positions:
+        family = [node] + variant_descendants.get(node, [])
+        input_positions[node] = [positions[m] for m in family if m in positions]
+        values = [concentration[m] for m in family if concentration.get(m) is not None]
+        input_worst[node] = min(values) if values else None
+
+    targets = [
+        node for node, meta in node_to_meta.items() if meta["type"] in ROLLUP_TYPES
+    ]
+    order = graphlib.TopologicalSorter(
+        {node: graph_reverse.get(node, []) for node in targets}
+    ).static_order()
+    upstream = {}
+    worst = {}
+    rollup = {}
+    for node in order:
+        meta = node_to_meta.get(node, {})
+        node_worst = None
+        inputs = [i for input_list in INPUT_LISTS for i in meta.get(input_list, [])]
+        processes = graph_reverse.get(node, [])
+        node_upstream = _to_bitset(
+            [
+                position
+                for upstream_node in inputs
+                for position in input_positions.get(upstream_node, [])
+            ]
+            + [positions[p] for p in processes if p in positions],
+            num_bits,
+        )
+        for upstream_node in processes:
+            node_upstream |= upstream[upstream_node]
+        for value in [input_worst.get(i) for i in inputs] + [
+            worst[p] for p in processes
+        ]:
+            if value is not None and (node_worst is None or value < node_worst):
+                node_worst = value
+        upstream[node] = node_upstream
+        worst[node] = node_worst
+        if meta.get("type") not in ROLLUP_TYPES:
+            continue
+        num_measured = (node_upstream & measured_mask).bit_count()
+        country_counts = {
+            country: (node_upstream & mask).bit_count()
+            for country, mask in country_masks.items()
+        }
+        rollup[node] = {
+            "upstream": node_upstream.bit_count(),
+            "measured": num_measured,
+            "worstConcentration": node_worst,
+            "singleCountry": (node_upstream & single_country_mask).bit_count(),
+            "countryShares": {
+                country: round(100 * count / num_measured, 1)
+                for country, count in sorted(
+                    country_counts.items(), key=lambda item: (-item[1], item[0])
+                )
+                if count
+            },
+        }
+    return {node: rollup[node] for node in targets}
@@ -0,0 +1,278 @@
+"""
+Writes the graph and provision data in a compact, chunked format that the webapp can load
+lazily, as an alternative to the graph.js and provision.js modules.
+
+The output directory contains an index.json, which holds everything needed to draw the map and
+filters, and one file per node under nodes/ with the rest of that node's metadata and its
+providers. Strings used more than once (node ids, country and provider names, repeated captions
+and source links, etc.) are stored once in the index's string table and referenced by position.
+Strings used only once are stored inline in the node chunk, so that long descriptive text is
+only loaded with the node it belongs to.
+
+Encoding conventions:
+* A string value is either a literal string or {"s": <int index into the index's "strings"
+  list>}, so that references can't be confused with int values. Dict values are wrapped as
+  {"d": <dict with encoded values>}, so that they can't be confused with references
+* A metadata dict is a list aligned with the corresponding field list in the index, with false
+  for fields the dict does not have
+* A dict keyed by node or provider id is a list of [key, value] pairs, with the key interned
+"""
+
+import collections
+import json
+import os
+
+CHUNK_FORMAT_VERSION = 2
+CHUNK_DIR = "chunks"
+# Node metadata needed to draw the map; the remaining fields are moved to the node's chunk
+SUMMARY_NODE_FIELDS = ["name", "type", "stage_id"]
+
+
+class StringTable:
+    """
+    Assigns each interned string a stable position in a shared list
+    """
+
+    def __init__(self, strings: list):
+        self.strings = list(strings)
+        self.positions = {string: idx for idx, string in enumerate(self.strings)}
+
+    def encode(self, value):
+        """
+        Encode a value, replacing interned strings (including inside lists and dicts) with
+        references to their position
+
+        :param value: Value to encode
+        :return: Encoded value
+        """
+        if isinstance(value, str):
+            return {"s": self.positions[value]} if value in self.positions else value
+        if isinstance(value, list):
+            return [self.encode(v) for v in value]
+        if isinstance(value, dict):
+            return {"d": {k: self.encode(v) for k, v in value.items()}}
+        return value
+
+    def decode(self, value):
+        """
+        Reverse encode
+
+        :param value: Encoded value
+        :return: Decoded value
+        """
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        if isinstance(value, dict):
+            if "s" in value:
+                return self.strings[value["s"]]
+            return {k: self.decode(v) for k, v in value["d"].items()}
+        return value
+
+
+def _count_strings(value, counts: collections.Counter) -> None:
+    """
+    Count occurrences of strings in a (possibly nested) value
+
+    :param value: Value to count strings in
+    :param counts: Counter to update
+    :return: None
+    """
+    if isinstance(value, str):
+        counts[value] += 1
+    elif isinstance(value, list):
+        for v in value:
+            _count_strings(v, counts)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _count_strings(v, counts)
+
+
+def _encode_meta(meta: dict, fields: list, strings: StringTable) -> list:
+    return [strings.encode(meta[field]) if field in meta else False for field in fields]
+
+
+def _decode_meta(encoded: list, fields: list, strings: StringTable) -> dict:
+    return {
+        field: strings.decode(value)
+        for field, value in zip(fields, encoded)
+        if value is not False
+    }
+
+
+def _encode_mapping(mapping: dict, strings: StringTable, encode_value=None) -> list:
+    return [
+        [strings.encode(key), encode_value(value) if encode_value else value]
+        for key, value in mapping.items()
+    ]
+
+
+def _decode_mapping(encoded: list, strings: StringTable, decode_value=None) -> dict:
+    return {
+        strings.decode(key): decode_value(value) if decode_value else value
+        for key, value in encoded
+    }
+
+
+def build_chunks(
+    graph: dict,
+    graph_reverse: dict,
+    node_to_meta: dict,
+    variants: dict,
+    country_provision: dict,
+    country_flags: dict,
+    country_provision_concentration: dict,
+    org_provision: dict,
+    process_nodes_with_org_provision: list,
+    provider_meta: dict,
+) -> tuple:
+    """
+    Encode graph and provision data as an index and per-node chunks
+
+    :return: Tuple of the index dict and a dict mapping node ids to chunk dicts
+    """
+    node_ids = sorted(node_to_meta)
+    node_fields = sorted({f for meta in node_to_meta.values() for f in meta})
+    detail_fields = [f for f in node_fields if f not in SUMMARY_NODE_FIELDS]
+    provider_fields = sorted({f for meta in provider_meta.values() for f in meta})
+
+    # Ids and names are always interned; other strings only if they are used more than once
+    counts = collections.Counter()
+    _count_strings(list(node_to_meta.values()), counts)
+    _count_strings(list(provider_meta.values()), counts)
+    always_interned = (
+        node_ids
+        + sorted(provider_meta)
+        + sorted(country_provision)
+        + sorted(org_provision)
+    )
+    repeated = sorted(s for s, count in counts.items() if count > 1)
+    strings = StringTable(dict.fromkeys(always_interned + repeated))
+
+    node_country_provision = collections.defaultdict(dict)
+    for country in sorted(country_provision):
+        for node, value in country_provision[country].items():
+            node_country_provision[node][country] = value
+    node_org_provision = collections.defaultdict(dict)
+    for org in sorted(org_provision):
+        for node, value in org_provision[org].items():
+            node_org_provision[node][org] = value
+
+    index = {
+        "version": CHUNK_FORMAT_VERSION,
+        "strings": strings.strings,
+        "nodeFields": SUMMARY_NODE_FIELDS,
+        "detailFields": detail_fields,
+        "providerFields": provider_fields,
+        "nodes": _encode_mapping(
+            {n: node_to_meta[n] for n in node_ids},
+            strings,
+            lambda meta: _encode_meta(meta, SUMMARY_NODE_FIELDS, strings),
+        ),
+        "graph": _encode_mapping(graph, strings, strings.encode),
+        "graphReverse": _encode_mapping(graph_reverse, strings, strings.encode),
+        "variants": _encode_mapping(variants, strings, strings.encode),
+        "countryFlags": _encode_mapping(country_flags, strings),
+        "countryProvisionConcentration": _encode_mapping(
+            country_provision_concentration, strings
+        ),
+        "processNodesWithOrgProvision": strings.encode(
+            sorted(process_nodes_with_org_provision)
+        ),
+        "providerMeta": _encode_mapping(
+            provider_meta,
+            strings,
+            lambda meta: _encode_meta(meta, provider_fields, strings),
+        ),
+    }
+    chunks = {}
+    for node in sorted(
+        set(node_ids) | set(node_country_provision) | set(node_org_provision)
+    ):
+        chunks[node] = {
+            "meta": _encode_meta(node_to_meta.get(node, {}), detail_fields, strings),
+            "countryProvision": _encode_mapping(node_country_provision[node], strings),
+            "orgProvision": _encode_mapping(node_org_provision[node], strings),
+        }
+    return index, chunks
+
+
+def write_chunks(index: dict, chunks: dict, output_dir: str, write_fn=None) -> None:
+    """
+    Write an index and node chunks as compact json
+
+    :param index: Index dict, from build_chunks
+    :param chunks: Dict mapping node ids to chunk dicts, from build_chunks
+    :param output_dir: Directory the chunks directory should be created in
+    :param write_fn: Function taking a path and content that writes a file; defaults to
+        overwriting the file
+    :return: None
+    """
+
+    def overwrite(output_fi, content):
+        with open(output_fi, mode="w", encoding="utf-8") as f:
+            f.write(content)
+
+    write_fn = write_fn or overwrite
+    chunk_dir = os.path.join(output_dir, CHUNK_DIR)
+    os.makedirs(os.path.join(chunk_dir, "nodes"), exist_ok=True)
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    write_fn(os.path.join(chunk_dir, "index.json"), dumps(index))
+    for node, chunk in chunks.items():
+        write_fn(os.path.join(chunk_dir, "nodes", f"{node}.json"), dumps(chunk))
+
+
+def load_chunks(output_dir: str) -> dict:
+    """
+    Read chunks written by write_chunks back into the structures used by graph.js and
+    provision.js
+
+    :param output_dir: Directory containing the chunks directory
+    :return: Dict with the same keys as the variables exported by graph.js and provision.js
+    """
+    chunk_dir = os.path.join(output_dir, CHUNK_DIR)
+    with open(os.path.join(chunk_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    strings = StringTable(index["strings"])
+    node_to_meta = _decode_mapping(
+        index["nodes"],
+        strings,
+        lambda meta: _decode_meta(meta, index["nodeFields"], strings),
+    )
+    country_provision = {}
+    org_provision = {}
+    for node in os.listdir(os.path.join(chunk_dir, "nodes")):
+        with open(os.path.join(chunk_dir, "nodes", node), encoding="utf-8") as f:
+            chunk = json.load(f)
+        node = node[: -len(".json")]
+        meta = _decode_meta(chunk["meta"], index["detailFields"], strings)
+        if node in node_to_meta:
+            node_to_meta[node].update(meta)
+        for country, value in _decode_mapping(
+            chunk["countryProvision"], strings
+        ).items():
+            country_provision.setdefault(country, {})[node] = value
+        for org, value in _decode_mapping(chunk["orgProvision"], strings).items():
+            org_provision.setdefault(org, {})[node] = value
+    return {
+        "graph": _decode_mapping(index["graph"], strings, strings.decode),
+        "graphReverse": _decode_mapping(index["graphReverse"], strings, strings.decode),
+        "nodeToMeta": node_to_meta,
+        "variants": _decode_mapping(index["variants"], strings, strings.decode),
+        "countryProvision": country_provision,
+        "countryFlags": _decode_mapping(index["countryFlags"], strings),
+        "countryProvisionConcentration": _decode_mapping(
+            index["countryProvisionConcentration"], strings
+        ),
+        "orgProvision": org_provision,
+        "processNodesWithOrgProvision": strings.decode(
+            index["processNodesWithOrgProvision"]
+        ),
+        "providerMeta": _decode_mapping(
+            index["providerMeta"],
+            strings,
+            lambda meta: _decode_meta(meta, index["providerFields"], strings),
+        ),
+    }
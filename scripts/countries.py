@@ -0,0 +1,189 @@
+"""
+Normalizes analyst-specified country names and codes, and maps them to flag emoji.
+
+This module has no dependencies on the rest of the preprocessing code, so it can be shared with
+other tools that need the same country normalization.
+"""
+
+import collections
+import json
+import os
+
+# Bump when the layout of the persisted table changes, so stale tables are rebuilt
+TABLE_VERSION = 1
+
+COUNTRY_MAPPING = {
+    "MAL": "Malaysia",
+    "TAN": "Tanzania",
+    "BAH": "Bahamas",
+    "Venezuela, Bolivarian Republic of": "Venezuela",
+    "Macao": "Macau",
+    "Viet Nam": "Vietnam",
+    "Cayman Islands": "Cayman Islands (the)",
+    "China": "China (mainland)",
+    "Eswatini": "Swaziland",
+    "Korea, Republic of": "South Korea",
+    "Korea": "South Korea",
+    "Korea, Democratic People's Republic of": "North Korea",
+    "Lao People's Democratic Republic": "Laos",
+    "Bolivia, Plurinational State of": "Bolivia",
+    "Palestine, State of": "Palestine",
+    "Sao Tome and Principe": "São Tomé and Príncipe",
+    "Syrian Arab Republic": "Syria",
+    "Reunion": "Réunion",
+    "Russian Federation": "Russia",
+    "Iran, Islamic Republic of": "Iran",
+    "Taiwan, Province of China": "Taiwan",
+    "EUR": "Europe",
+    "Various countries": "Various countries",
+}
+
+MANUAL_FLAG_MAPPING = {
+    "EUR": "🇪🇺",
+}
+
+
+def build_table() -> dict:
+    """
+    Build indexes over pycountry's country database. Keys are lowercased, because pycountry
+    lookups are case-insensitive
+
+    :return: Dict with an "alpha_3" index mapping alpha-3 codes to country names, and a "flags"
+        index mapping any code or name pycountry's lookup would accept to a flag emoji
+    """
+    import pycountry
+
+    # Iterating over the database forces pycountry to load it and build its indexes
+    countries = list(pycountry.countries)
+    alpha_3 = {
+        code: country.name
+        for code, country in pycountry.countries.indices["alpha_3"].items()
+    }
+    # Mirror the precedence of pycountry.countries.lookup, which checks each of its indexes
+    # in turn and then falls back to scanning any non-indexed fields
+    flags = {}
+    for index in pycountry.countries.indices.values():
+        for value, country in index.items():
+            flags.setdefault(value, country.flag)
+    for country in countries:
+        for field in pycountry.countries.no_index:
+            value = country._fields.get(field)
+            if value is not None:
+                flags.setdefault(value.lower(), country.flag)
+    return {"version": TABLE_VERSION, "alpha_3": alpha_3, "flags": flags}
+
+
+class CountryResolver:
+    """
+    Resolves country codes and names using a table built from pycountry once, and optionally
+    persisted to disk so later runs don't need to load pycountry at all
+    """
+
+    def __init__(
+        self,
+        table_fi: str = None,
+        country_mapping: dict = None,
+        flag_mapping: dict = None,
+    ):
+        """
+        :param table_fi: Optional path where the lookup table is cached between runs
+        :param country_mapping: Overrides for normalized country names; defaults to COUNTRY_MAPPING
+        :param flag_mapping: Flags for names pycountry does not know; defaults to MANUAL_FLAG_MAPPING
+        """
+        self.table_fi = table_fi
+        self.country_mapping = (
+            COUNTRY_MAPPING if country_mapping is None else country_mapping
+        )
+        self.flag_mapping = (
+            MANUAL_FLAG_MAPPING if flag_mapping is None else flag_mapping
+        )
+        self.table = None
+        self.stats = collections.Counter()
+        # Counts of names with no pycountry match or manual mapping, by lookup type
+        self.unmapped = {
+            "country": collections.Counter(),
+            "flag": collections.Counter(),
+        }
+        self._countries = {}
+
+    def _get_table(self) -> dict:
+        """
+        Load the lookup table from disk if possible, otherwise build (and persist) it
+
+        :return: Lookup table, as returned by build_table
+        """
+        if self.table is None:
+            if self.table_fi and os.path.exists(self.table_fi):
+                with open(self.table_fi, encoding="utf-8") as f:
+                    table = json.load(f)
+                if table.get("version") == TABLE_VERSION:
+                    self.table = table
+            if self.table is None:
+                self.table = build_table()
+                if self.table_fi:
+                    with open(self.table_fi, mode="w", encoding="utf-8") as f:
+                        json.dump(self.table, f, ensure_ascii=False, sort_keys=True)
+        return self.table
+
+    def get_country(self, raw_country_name: str) -> str:
+        """
+        Normalize country names, including mapping from alpha3
+
+        :param raw_country_name: Raw analyst-specified country name
+        :return: Normalized country name
+        """
+        if raw_country_name not in self._countries:
+            clean_country_name = self._get_table()["alpha_3"].get(
+                raw_country_name.lower()
+            )
+            is_unmapped = False
+            if clean_country_name is None:
+                if raw_country_name not in self.country_mapping:
+                    print(f"warning: pycountry could not find {raw_country_name}")
+                    is_unmapped = True
+                clean_country_name = raw_country_name
+            self._countries[raw_country_name] = (
+                self.country_mapping.get(clean_country_name, clean_country_name),
+                is_unmapped,
+            )
+        country, is_unmapped = self._countries[raw_country_name]
+        if is_unmapped:
+            self.stats["country_miss"] += 1
+            self.unmapped["country"][raw_country_name] += 1
+        else:
+            self.stats["country_hit"] += 1
+        return country
+
+    def get_flag(self, country_name: str) -> str:
+        """
+        Return flag emoji for country
+
+        :param country_name: Country name or code
+        :return: Flag emoji (in unicode) for that country or None
+        """
+        flag = None
+        if isinstance(country_name, str):
+            flag = self._get_table()["flags"].get(country_name.lower())
+            if flag is None:
+                flag = self.flag_mapping.get(country_name)
+        if flag is None:
+            self.stats["flag_miss"] += 1
+            self.unmapped["flag"][country_name] += 1
+        else:
+            self.stats["flag_hit"] += 1
+        return flag
+
+    def report(self) -> str:
+        """
+        Summarize lookup statistics
+
+        :return: Human-readable summary of hits, misses and unmapped names
+        """
+        lines = []
+        for lookup_type in ["country", "flag"]:
+            hits = self.stats[f"{lookup_type}_hit"]
+            misses = self.stats[f"{lookup_type}_miss"]
+            lines.append(f"{lookup_type} lookups: {hits} hits, {misses} misses")
+            for name, count in sorted(self.unmapped[lookup_type].items()):
+                lines.append(f"  unmapped {lookup_type}: {name} ({count})")
+        return "\n".join(lines)
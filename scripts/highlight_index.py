@@ -0,0 +1,154 @@
+"""
+Builds the indexes the webapp's filters use to highlight nodes on the map, so that changing a
+filter is a lookup rather than a scan over all provision data.
+"""
+
+try:
+    from scripts.provision_store import MAJOR_PROVISION, MINOR_PROVISION
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from provision_store import MAJOR_PROVISION, MINOR_PROVISION
+
+# Highlight strengths, on the 0-100 scale used by the map's gradient shading. Org providers are
+# treated as providing almost all of a node, and "Major" country providers as providing a small
+# share
+ORG_HIGHLIGHT = 81
+MAJOR_COUNTRY_HIGHLIGHT = 21
+MINOR_COUNTRY_HIGHLIGHT = 0
+HIGH_CONCENTRATION_HIGHLIGHT = 81
+MEDIUM_CONCENTRATION_HIGHLIGHT = 41
+INPUT_TYPES = ["tool_resource", "material_resource"]
+
+
+def get_country_highlight(value):
+    """
+    Get the highlight strength of a country's provision of a node
+
+    :param value: Provision value
+    :return: Highlight strength, or None if the node should not be highlighted
+    """
+    if value == MAJOR_PROVISION:
+        return MAJOR_COUNTRY_HIGHLIGHT
+    if value == MINOR_PROVISION:
+        return MINOR_COUNTRY_HIGHLIGHT
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def get_org_highlight(value) -> int:
+    """
+    Get the highlight strength of an org's provision of a node
+
+    :param value: Provision value
+    :return: Highlight strength
+    """
+    return ORG_HIGHLIGHT
+
+
+def build_provider_index(
+    provision: dict, variant_ancestors: dict, get_highlight
+) -> dict:
+    """
+    Index the nodes each provider should highlight
+
+    :param provision: Dict mapping providers to dicts mapping node ids to provision values
+    :param variant_ancestors: Dict mapping variants to their ancestors, nearest first, as in
+        the "ancestors" of build_variant_index
+    :param get_highlight: Function mapping a provision value to a highlight strength, or None
+    :return: Dict mapping providers to lists of [node, highlight strength] pairs, in provision
+        order, with the node's ancestors appended if it is a variant. The webapp adds the
+        strengths of all selected providers for each node, and shows the highest strength of
+        any variant on its ancestors
+    """
+    index = {}
+    for provider, provided in provision.items():
+        entries = []
+        for node, value in provided.items():
+            highlight = get_highlight(value)
+            if highlight is None:
+                continue
+            entry = [node, highlight]
+            if variant_ancestors.get(node):
+                entry.append(variant_ancestors[node])
+            entries.append(entry)
+        index[provider] = entries
+    return index
+
+
+def build_concentration_index(country_provision_concentration: dict) -> dict:
+    """
+    Index the nodes highlighted by the market concentration filter
+
+    :param country_provision_concentration: Dict mapping nodes to the number of countries it
+        takes to account for most of the market
+    :return: Dict mapping highlight strengths to sorted lists of nodes
+    """
+    index = {HIGH_CONCENTRATION_HIGHLIGHT: [], MEDIUM_CONCENTRATION_HIGHLIGHT: []}
+    for node, num_countries in country_provision_concentration.items():
+        if num_countries == 1:
+            index[HIGH_CONCENTRATION_HIGHLIGHT].append(node)
+        # Nodes with an unknown concentration have always been shown as medium concentrated
+        elif num_countries is None or num_countries <= 3:
+            index[MEDIUM_CONCENTRATION_HIGHLIGHT].append(node)
+    return {highlight: sorted(nodes) for highlight, nodes in index.items()}
+
+
+def build_input_index(node_to_meta: dict, variant_ancestors: dict) -> dict:
+    """
+    Index the nodes highlighted when each input is selected, and the processes that use it
+
+    :param node_to_meta: Dict mapping node ids to metadata
+    :param variant_ancestors: Dict mapping variants to their ancestors, nearest first, as in
+        the "ancestors" of build_variant_index
+    :return: Dict mapping input nodes to dicts with the "nodes" to highlight (the input and the
+        nodes it is a variant of) and the sorted list of "processes" that use any of them
+    """
+    users = {}
+    for node, meta in node_to_meta.items():
+        if meta["type"] == "process":
+            for input_node in meta.get("tools", []) + meta.get("materials", []):
+                users.setdefault(input_node, set()).add(node)
+    index = {}
+    for node, meta in node_to_meta.items():
+        if meta["type"] not in INPUT_TYPES:
+            continue
+        nodes = [node] + variant_ancestors.get(node, [])
+        processes = set()
+        for highlighted in nodes:
+            processes.update(users.get(highlighted, []))
+        index[node] = {"nodes": nodes, "processes": sorted(processes)}
+    return index
+
+
+def build_highlight_index(
+    node_to_meta: dict,
+    variant_ancestors: dict,
+    country_provision: dict,
+    org_provision: dict,
+    country_provision_concentration: dict,
+) -> dict:
+    """
+    Build all of the filter highlight indexes
+
+    :param node_to_meta: Dict mapping node ids to metadata, including their type and the
+        tools and materials processes use
+    :param variant_ancestors: Dict mapping variants to their ancestors, nearest first, as in
+        the "ancestors" of build_variant_index
+    :param country_provision: Dict mapping countries to dicts mapping node ids to provision
+        values
+    :param org_provision: Dict mapping org provider ids to dicts mapping node ids to provision
+        values
+    :param country_provision_concentration: Dict mapping nodes to the number of countries it
+        takes to account for most of the market
+    :return: Dict with the "country", "org", "concentration" and "input" indexes
+    """
+    return {
+        "country": build_provider_index(
+            country_provision, variant_ancestors, get_country_highlight
+        ),
+        "org": build_provider_index(
+            org_provision, variant_ancestors, get_org_highlight
+        ),
+        "concentration": build_concentration_index(country_provision_concentration),
+        "input": build_input_index(node_to_meta, variant_ancestors),
+    }
@@ -0,0 +1,247 @@
+"""
+Generates resized copies of node images in modern formats, so the webapp can serve an image sized
+for the viewport instead of the full-size original. Derivatives are cached by the hash of their
+source image, and only images whose source changed are reprocessed.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image, ImageOps
+
+CACHE_FILE = ".derivatives.json"
+# Bump when the derivatives generated from an image change, so cached derivatives are rebuilt
+DERIVATIVES_VERSION = 1
+DERIVATIVE_WIDTHS = [480, 960, 1600]
+# Formats in order of preference, mapped to the options they are saved with. The last format is
+# the fallback for browsers that support none of the others
+DERIVATIVE_FORMATS = {
+    "avif": {"quality": 50, "speed": 8},
+    "webp": {"quality": 75},
+    "jpeg": {"quality": 80, "optimize": True, "progressive": True},
+}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+PLACEHOLDER_WIDTH = 16
+
+
+def _file_sha256(fi: str) -> str:
+    digest = hashlib.sha256()
+    with open(fi, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_derivative_widths(width: int, widths: list = DERIVATIVE_WIDTHS) -> list:
+    """
+    Get the widths to resize an image to. Images are never scaled up, so images narrower than
+    some of the widths get a derivative at their own width instead
+
+    :param width: Width of the source image
+    :param widths: Target widths
+    :return: Sorted list of widths
+    """
+    return sorted({min(width, w) for w in widths})
+
+
+def mk_placeholder(image: Image.Image) -> str:
+    """
+    Generate a tiny, blurry version of an image that can be inlined and shown while the image
+    loads
+
+    :param image: Source image
+    :return: Data URI of the placeholder
+    """
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    placeholder = image.resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    placeholder.save(buffer, "webp", quality=30)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def mk_derivatives(name: str, source_fi: str, output_dir: str) -> dict:
+    """
+    Generate derivatives of one image
+
+    :param name: Name of the image (node id); derivatives are written to
+        {output_dir}/{name}-{width}.{extension}
+    :param source_fi: Path to source image
+    :param output_dir: Directory to write derivatives to
+    :return: Dict with the source image's "width" and "height" (after applying its EXIF
+        orientation), its "placeholder", and the "files" written, as a dict mapping each format
+        to a list of [file name, width] pairs
+    """
+    with Image.open(source_fi) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+    files = {fmt: [] for fmt in DERIVATIVE_FORMATS}
+    for width in get_derivative_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt, options in DERIVATIVE_FORMATS.items():
+            output_fi = f"{name}-{width}.{EXTENSIONS[fmt]}"
+            resized.save(os.path.join(output_dir, output_fi), fmt, **options)
+            files[fmt].append([output_fi, width])
+    return {
+        "width": image.width,
+        "height": image.height,
+        "placeholder": mk_placeholder(image),
+        "files": files,
+    }
+
+
+class ImageDerivatives:
+    """
+    Generates and caches derivatives of a set of images
+    """
+
+    def __init__(self, output_dir: str, url_prefix: str, workers: int = 1):
+        """
+        :param output_dir: Directory to write derivatives to
+        :param url_prefix: Url the webapp serves output_dir from
+        :param workers: Number of processes to generate derivatives in
+        """
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.workers = workers
+        self.cache_fi = os.path.join(output_dir, CACHE_FILE)
+        self.cache = {}
+        # Dict mapping names of images whose derivatives failed in the last call to process
+        # to an error message
+        self.failures = {}
+        if os.path.exists(self.cache_fi):
+            with open(self.cache_fi) as f:
+                cache = json.load(f)
+            if cache.get("version") == DERIVATIVES_VERSION:
+                self.cache = cache["images"]
+
+    def _is_current(self, name: str, sha256: str) -> bool:
+        cached = self.cache.get(name)
+        return (
+            cached is not None
+            and cached["sha256"] == sha256
+            and all(
+                os.path.exists(os.path.join(self.output_dir, fi))
+                for files in cached["files"].values()
+                for fi, _ in files
+            )
+        )
+
+    def process(self, sources: dict) -> dict:
+        """
+        Generate derivatives for images that changed since the last run, and remove derivatives
+        of images that are no longer present
+
+        :param sources: Dict mapping image names (node ids) to paths to source images
+        :return: Dict mapping image names to the metadata the webapp needs to show them, with
+            their "image_width", "image_height", "image_placeholder" and "image_srcset" (a dict
+            mapping each format to a srcset string). Images whose derivatives could not be
+            generated are left out, and listed with their errors in self.failures
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        hashes = {name: _file_sha256(fi) for name, fi in sources.items()}
+        stale = [name for name in sources if not self._is_current(name, hashes[name])]
+        self.failures = {}
+        if stale:
+            print(f"generating derivatives of {len(stale)} images")
+            if self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = {
+                        name: executor.submit(
+                            mk_derivatives, name, sources[name], self.output_dir
+                        )
+                        for name in stale
+                    }
+                    results = {
+                        name: self._get_result(name, sources[name], future.result)
+                        for name, future in futures.items()
+                    }
+            else:
+                results = {
+                    name: self._get_result(
+                        name,
+                        sources[name],
+                        partial(mk_derivatives, name, sources[name], self.output_dir),
+                    )
+                    for name in stale
+                }
+            for name, result in results.items():
+                if result is None:
+                    # Don't keep serving derivatives of an earlier version of the image
+                    self.cache.pop(name, None)
+                else:
+                    self.cache[name] = {"sha256": hashes[name], **result}
+            if self.failures:
+                print(
+                    f"warning: derivatives of {len(self.failures)} of {len(stale)} "
+                    "images failed"
+                )
+        for name in list(self.cache):
+            if name not in sources:
+                del self.cache[name]
+        self._remove_unused()
+        with open(self.cache_fi, mode="w") as f:
+            json.dump(
+                {"version": DERIVATIVES_VERSION, "images": self.cache},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        return {
+            name: self.get_meta(name) for name in sorted(sources) if name in self.cache
+        }
+
+    def _get_result(self, name: str, source_fi: str, get_result) -> dict:
+        """
+        Get the derivatives generated for an image, recording the error if they could not be
+        generated, so one unreadable image does not stop the others from being processed
+
+        :param name: Image name (node id)
+        :param source_fi: Path to the source image
+        :param get_result: Function returning the result of mk_derivatives for the image
+        :return: Result of mk_derivatives, or None if it failed
+        """
+        try:
+            return get_result()
+        except Exception as error:
+            print(f"failed to generate derivatives of {name} from {source_fi}: {error}")
+            self.failures[name] = str(error)
+            return None
+
+    def _remove_unused(self) -> None:
+        """
+        Delete files in the output directory that are not derivatives of a current image
+
+        :return: None
+        """
+        used = {CACHE_FILE}
+        for cached in self.cache.values():
+            for files in cached["files"].values():
+                used.update(fi for fi, _ in files)
+        for fi in os.listdir(self.output_dir):
+            if fi not in used:
+                os.remove(os.path.join(self.output_dir, fi))
+
+    def get_meta(self, name: str) -> dict:
+        """
+        Get the metadata the webapp needs to show an image
+
+        :param name: Image name (node id)
+        :return: Dict with the image's dimensions, placeholder and srcsets
+        """
+        cached = self.cache[name]
+        return {
+            "image_width": cached["width"],
+            "image_height": cached["height"],
+            "image_placeholder": cached["placeholder"],
+            "image_srcset": {
+                fmt: ", ".join(
+                    f"{self.url_prefix}/{fi} {width}w" for fi, width in files
+                )
+                for fmt, files in cached["files"].items()
+            },
+        }
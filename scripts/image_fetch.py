@@ -0,0 +1,219 @@
+"""
+Downloads node images in parallel into a local content-addressed cache. Each download is a
+conditional request (If-None-Match / If-Modified-Since) against what was fetched last time, so
+images that have not changed are never downloaded again, and output files whose content is
+unchanged are left untouched. Each worker thread keeps one persistent connection per host.
+
+The validators of each download are looked up by a caller-supplied key rather than by url, since
+image urls are signed and change with every export of the image table even when the image
+itself has not.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+INDEX_FILE = "index.json"
+OBJECTS_DIR = "objects"
+MAX_REDIRECTS = 5
+
+
+def _file_sha256(fi: str) -> str:
+    digest = hashlib.sha256()
+    with open(fi, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageFetcher:
+    """
+    Fetches urls into a cache directory, and copies them from the cache to their destinations
+    """
+
+    def __init__(self, cache_dir: str, workers: int = 8, timeout: float = 30):
+        """
+        :param cache_dir: Directory holding downloaded content, keyed by sha256, and an index of
+            the validators (ETag and Last-Modified) of each download, by key
+        :param workers: Maximum number of concurrent downloads
+        :param timeout: Socket timeout, in seconds
+        """
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.timeout = timeout
+        os.makedirs(os.path.join(cache_dir, OBJECTS_DIR), exist_ok=True)
+        self.index_fi = os.path.join(cache_dir, INDEX_FILE)
+        self.index = {}
+        if os.path.exists(self.index_fi):
+            with open(self.index_fi) as f:
+                self.index = json.load(f)
+        self._index_lock = threading.Lock()
+        self._local = threading.local()
+
+    def object_fi(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, OBJECTS_DIR, sha256)
+
+    def _get_connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        """
+        Get this thread's persistent connection to a host, opening it if needed
+
+        :param scheme: "http" or "https"
+        :param netloc: Host, with optional port
+        :return: Connection
+        """
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        key = (scheme, netloc)
+        if key not in self._local.connections:
+            connection_cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            self._local.connections[key] = connection_cls(netloc, timeout=self.timeout)
+        return self._local.connections[key]
+
+    def _request(self, url: str, headers: dict) -> tuple:
+        """
+        Make a GET request on a persistent connection, following redirects
+
+        :param url: Url to request
+        :param headers: Request headers
+        :return: Tuple of the response status, response headers and body
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parsed = urllib.parse.urlsplit(url)
+            path = parsed.path or "/"
+            if parsed.query:
+                path += "?" + parsed.query
+            for retry in range(2):
+                connection = self._get_connection(parsed.scheme, parsed.netloc)
+                try:
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    # The server may have closed an idle connection; reconnect once
+                    connection.close()
+                    del self._local.connections[(parsed.scheme, parsed.netloc)]
+                    if retry:
+                        raise
+            if response.status in (301, 302, 303, 307, 308):
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                continue
+            return response.status, response, body
+        raise RuntimeError(f"Too many redirects fetching {url}")
+
+    def fetch(self, url: str, output_fi: str, key: str = None) -> dict:
+        """
+        Fetch a url into the cache, unless the cached copy is still current, and copy it to
+        output_fi if output_fi does not already have the same content
+
+        :param url: Url to fetch
+        :param output_fi: Path the content should be written to
+        :param key: Stable identifier of the content, which stays the same when the url changes
+            (for instance, because it is signed); defaults to the url
+        :return: Dict describing the fetch, with its "url", "output_fi", "status"
+            ("downloaded", "not_modified" or "failed"), "bytes" downloaded, "seconds" and "error"
+        """
+        start = time.perf_counter()
+        result = {"url": url, "output_fi": output_fi, "bytes": 0, "error": None}
+        try:
+            with self._index_lock:
+                cached = self.index.get(key or url)
+            headers = {}
+            if cached and os.path.exists(self.object_fi(cached["sha256"])):
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+            status, response, body = self._request(url, headers)
+            if status == 304 and headers:
+                result["status"] = "not_modified"
+                sha256 = cached["sha256"]
+            elif status == 200:
+                result["status"] = "downloaded"
+                result["bytes"] = len(body)
+                sha256 = hashlib.sha256(body).hexdigest()
+                if not os.path.exists(self.object_fi(sha256)):
+                    tmp_fi = self.object_fi(sha256) + f".{threading.get_ident()}.tmp"
+                    with open(tmp_fi, "wb") as f:
+                        f.write(body)
+                    os.replace(tmp_fi, self.object_fi(sha256))
+                with self._index_lock:
+                    self.index[key or url] = {
+                        "sha256": sha256,
+                        "etag": response.getheader("ETag"),
+                        "last_modified": response.getheader("Last-Modified"),
+                    }
+            else:
+                raise RuntimeError(f"HTTP {status} fetching {url}")
+            if not (os.path.exists(output_fi) and _file_sha256(output_fi) == sha256):
+                tmp_fi = output_fi + ".tmp"
+                shutil.copyfile(self.object_fi(sha256), tmp_fi)
+                os.replace(tmp_fi, output_fi)
+        except Exception:
+            result["status"] = "failed"
+            result["error"] = traceback.format_exc()
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def fetch_all(self, downloads: list) -> list:
+        """
+        Fetch urls concurrently, then save the cache index
+
+        :param downloads: List of (url, output path) or (url, output path, key) tuples, with
+            keys as in fetch
+        :return: List of results from fetch, in the order of `downloads`
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(
+                executor.map(lambda download: self.fetch(*download), downloads)
+            )
+        self.save_index()
+        return results
+
+    def save_index(self) -> None:
+        """
+        Write the cache index to disk
+
+        :return: None
+        """
+        tmp_fi = self.index_fi + ".tmp"
+        with open(tmp_fi, mode="w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_fi, self.index_fi)
+
+    @staticmethod
+    def report(results: list) -> str:
+        """
+        Summarize the results of fetch_all
+
+        :param results: Results, from fetch_all
+        :return: Human-readable summary with a line per download or failure, and totals
+        """
+        lines = []
+        counts = {"downloaded": 0, "not_modified": 0, "failed": 0}
+        for result in results:
+            counts[result["status"]] += 1
+            if result["status"] == "downloaded":
+                lines.append(
+                    f"downloaded {result['url']} to {result['output_fi']}: "
+                    f"{result['bytes']} bytes in {result['seconds']:.2f}s"
+                )
+            elif result["status"] == "failed":
+                lines.append(f"failed to download {result['url']}")
+                lines.append(result["error"])
+        lines.append(
+            f"images: {counts['downloaded']} downloaded, "
+            f"{counts['not_modified']} not modified, {counts['failed']} failed"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,190 @@
+"""
+Computes the layout of the supply chain map: which nodes are drawn in each row, where stage
+headers go, and how each edge's arrow is routed. The webapp only has to draw the result.
+
+Rows are found with a breadth-first search up the graph from the final output, so every node is
+drawn in the row after the first row that uses it. Each node and edge is visited once.
+"""
+
+# Nodes N59 and N60 get special handling. By default, these nodes would appear near the bottom
+# of stage 2. However, because they are a parent to almost every node in stage 2, it makes more
+# sense if they appear near the top (especially in mobile view where arrows cannot provide
+# guidance to the user). Therefore, they are not placed in the map until we reach the top of
+# stage 2 (DEFERRED_UNTIL), although we still need to assign them a position and row number to
+# make the arrows behave correctly.
+DEFERRED_NODES = {"N59": -1, "N60": 1}
+DEFERRED_UNTIL = "N35"
+
+# Stands in for a stage id that is missing, as distinct from a stage that has not been set yet
+_MISSING = object()
+
+
+def sort_by_out_degree(nodes: list, graph: dict) -> list:
+    """
+    Sort nodes by number of outgoing edges, keeping the order of nodes with the same number
+
+    :param nodes: Nodes to sort
+    :param graph: Dict mapping parent nodes to lists of child nodes
+    :return: Sorted list of nodes
+    """
+    return sorted(nodes, key=lambda node: len(graph.get(node, [])))
+
+
+def get_layer_order(nodes: list, graph: dict) -> list:
+    """
+    Order the nodes in a row so that the nodes with the fewest outgoing edges are in the middle
+
+    :param nodes: Nodes in the row
+    :param graph: Dict mapping parent nodes to lists of child nodes
+    :return: Ordered list of nodes
+    """
+    nodes = sort_by_out_degree(nodes, graph)
+    # Alternate nodes between the two ends of the row, starting from the middle
+    return nodes[1::2][::-1] + nodes[::2]
+
+
+def _gt(a, b) -> bool:
+    # Compare like javascript, where comparisons with undefined are false
+    return a is not None and b is not None and a > b
+
+
+def route_edge(edge: tuple, node_to_position: dict, node_to_row: dict) -> dict:
+    """
+    Decide how an edge's arrow should be drawn
+
+    :param edge: Tuple of parent (start) and child (end) node
+    :param node_to_position: Dict mapping nodes to their offset from the center of their row
+    :param node_to_row: Dict mapping nodes to their row number, counting up from the final output
+    :return: Dict with the edge's "start" and "end" nodes, and the "startAnchor", "endAnchor",
+        "gridBreak" and "path" to draw the arrow with
+    """
+    start, end = edge
+    start_position = node_to_position.get(start)
+    end_position = node_to_position.get(end)
+    start_distance = abs(start_position) if start_position is not None else None
+    end_distance = abs(end_position) if end_position is not None else None
+    from_direction = "bottom"
+    to_direction = "top"
+    grid_break = "50%"
+    path = "grid"
+    # If arrow is going from center to edge
+    if _gt(end_distance, start_distance):
+        # Arrow will leave center on the left or right
+        from_direction = "left" if _gt(start_position, 0) else "right"
+        # Arrow will bend as far as possible from center
+        grid_break = "100%"
+        # Arrow should enter from top if going to a lower row node
+        to_direction = "left" if from_direction == "right" else "right"
+        if _gt(node_to_row.get(start), node_to_row.get(end)):
+            to_direction = "top"
+        elif _gt(node_to_row.get(end), node_to_row.get(start)):
+            to_direction = "bottom"
+        else:  # Same row connection
+            path = "straight"
+    # If arrow is going from edge to center
+    elif _gt(start_distance, end_distance):
+        # Arrow will meet center on the left or right
+        to_direction = "right" if _gt(start_position, 0) else "left"
+        # Arrow will bend as far as possible from center
+        grid_break = "0%"
+        # Arrow should leave from bottom if going to a lower row node
+        from_direction = "left" if to_direction == "right" else "right"
+        if _gt(node_to_row.get(start), node_to_row.get(end)):
+            from_direction = "bottom"
+        elif _gt(node_to_row.get(end), node_to_row.get(start)):
+            from_direction = "top"
+        else:  # Same row connection
+            path = "straight"
+    return {
+        "start": start,
+        "end": end,
+        "startAnchor": from_direction,
+        "endAnchor": to_direction,
+        "gridBreak": grid_break,
+        "path": path,
+    }
+
+
+def compute_map_layout(graph: dict, graph_reverse: dict, node_to_meta: dict) -> dict:
+    """
+    Lay out the supply chain map
+
+    :param graph: Dict mapping parent nodes to lists of child nodes
+    :param graph_reverse: Dict mapping child nodes to lists of parent nodes
+    :param node_to_meta: Dict mapping node ids to metadata
+    :return: Dict with:
+        * "layers": the rows of the map from top to bottom, each either {"stage": stage id} for a
+          stage header or {"nodes": [node ids]}
+        * "edges": lists of routed edges (see route_edge), one list per row of nodes after the
+          final output, from the bottom up
+        * "minimap": the rows of the minimap from top to bottom, each either {"nodes": [node ids]}
+          or {"edges": index into "edges"}
+        * "unattached": process nodes that are not connected to the final output
+    """
+    final_node = next(
+        (n for n, meta in node_to_meta.items() if meta["type"] == "ultimate_output"),
+        None,
+    )
+    curr_nodes = [final_node]
+    layers = [{"nodes": curr_nodes}]
+    minimap = [{"nodes": curr_nodes}]
+    edges = []
+    seen = {final_node}
+    node_to_position = {}
+    node_to_row = {}
+    row = 0
+    curr_stage = None
+    while curr_nodes:
+        row_edges = [
+            (parent, node)
+            for node in curr_nodes
+            for parent in graph_reverse.get(node, [])
+        ]
+        curr_nodes = []
+        for parent, _ in row_edges:
+            if parent in seen:
+                continue
+            if parent in DEFERRED_NODES and DEFERRED_UNTIL not in seen:
+                for node, position in DEFERRED_NODES.items():
+                    node_to_position[node] = position
+                    node_to_row[node] = row
+                continue
+            curr_nodes.append(parent)
+            seen.add(parent)
+        # The next row's parents are looked up in this order, which determines the order of
+        # nodes and edges in the rows above
+        curr_nodes = sort_by_out_degree(curr_nodes, graph)
+        ordered_nodes = get_layer_order(curr_nodes, graph)
+        # Add a stage header if a new stage has started. The last row is always empty, so the
+        # topmost stage gets its header there
+        stage = _MISSING
+        if ordered_nodes and ordered_nodes[0] in node_to_meta:
+            stage = node_to_meta[ordered_nodes[0]].get("stage_id", _MISSING)
+        if stage != curr_stage:
+            if row != 0:
+                layers.append({"stage": None if curr_stage is _MISSING else curr_stage})
+            curr_stage = stage
+        layers.append({"nodes": ordered_nodes})
+        minimap.append({"nodes": ordered_nodes})
+        center = len(ordered_nodes) / 2 - 0.5
+        for idx, node in enumerate(ordered_nodes):
+            node_to_position[node] = idx - center
+            node_to_row[node] = row
+        # Edges are routed as soon as their row is placed, so edges to deferred nodes use the
+        # deferred nodes' placeholder positions
+        edges.append(
+            [route_edge(edge, node_to_position, node_to_row) for edge in row_edges]
+        )
+        minimap.append({"edges": len(edges) - 1})
+        row += 1
+    unattached = [
+        node
+        for node, meta in node_to_meta.items()
+        if node not in seen and meta["type"] == "process"
+    ]
+    return {
+        "layers": layers[::-1],
+        "edges": edges,
+        "minimap": minimap[::-1],
+        "unattached": unattached,
+    }
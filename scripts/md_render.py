@@ -0,0 +1,118 @@
+"""
+Renders the short markdown strings in the source data (chart sources, image captions and credits)
+to inline html. One renderer is reused for every string, and results are cached, as many strings
+(e.g. citations) are repeated across rows.
+"""
+
+import collections
+
+from mistletoe import Document
+from mistletoe.html_renderer import HtmlRenderer
+
+LINK_ATTRIBUTES = "target='_blank' rel='noopener'"
+DEFAULT_CACHE_SIZE = 1024
+
+
+class InlineHtmlRenderer(HtmlRenderer):
+    """
+    Renders markdown to html that can be placed inline: the first paragraph is not wrapped in a
+    <p> tag, and links open in a new tab
+    """
+
+    def render_link(self, token) -> str:
+        return (
+            super()
+            .render_link(token)
+            .replace("<a href=", f"<a {LINK_ATTRIBUTES} href=", 1)
+        )
+
+    def render_auto_link(self, token) -> str:
+        return (
+            super()
+            .render_auto_link(token)
+            .replace("<a href=", f"<a {LINK_ATTRIBUTES} href=", 1)
+        )
+
+    def render_html_span(self, token) -> str:
+        return (
+            super()
+            .render_html_span(token)
+            .replace("<a href=", f"<a {LINK_ATTRIBUTES} href=")
+        )
+
+    def render_document(self, token) -> str:
+        self.footnotes = dict(token.footnotes)
+        rendered = []
+        for idx, child in enumerate(token.children):
+            if idx == 0 and type(child).__name__ == "Paragraph":
+                rendered.append(self.render_inner(child))
+            else:
+                rendered.append(self.render(child))
+        return "\n".join(rendered).strip()
+
+
+class MarkdownRenderer:
+    """
+    Renders markdown with a single InlineHtmlRenderer and a bounded LRU cache of results
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param cache_size: Maximum number of rendered strings to keep
+        """
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.stats = collections.Counter()
+        # The renderer registers its html tokens with mistletoe's parser when created, so it has
+        # to exist before any text is parsed
+        self.renderer = InlineHtmlRenderer()
+
+    def render(self, text: str) -> str:
+        """
+        Render markdown to inline html
+
+        :param text: Markdown text
+        :return: Html
+        """
+        if text in self.cache:
+            self.stats["hit"] += 1
+            self.cache.move_to_end(text)
+            return self.cache[text]
+        self.stats["miss"] += 1
+        html = self.renderer.render(Document(text))
+        self.cache[text] = html
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.stats["eviction"] += 1
+        return html
+
+    def render_many(self, texts: iter) -> list:
+        """
+        Render several markdown strings, rendering each distinct string once
+
+        :param texts: Markdown strings
+        :return: List of html strings, in the same order as texts
+        """
+        texts = list(texts)
+        rendered = {text: self.render(text) for text in dict.fromkeys(texts)}
+        # Repeats within the batch are served from the batch, but count as cache hits
+        self.stats["hit"] += len(texts) - len(rendered)
+        return [rendered[text] for text in texts]
+
+    def report(self) -> str:
+        """
+        Summarize cache statistics
+
+        :return: Human-readable summary of renders, cache hits and hit rate
+        """
+        hits = self.stats["hit"]
+        misses = self.stats["miss"]
+        total = hits + misses
+        hit_rate = hits / total if total else 0
+        return (
+            f"markdown: {total} strings, {misses} rendered, {hits} cache hits "
+            f"({hit_rate:.0%}), {self.stats['eviction']} evictions"
+        )
+
+
+renderer = MarkdownRenderer()
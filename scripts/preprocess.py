@@ -1,24 +1,50 @@
 #! /usr/bin/env python3
 
 import argparse
-import copy
 import csv
 import datetime
+import functools
+import hashlib
+import importlib
 import json
 import os
 import re
-import shutil
-import urllib.request
-
-import mistletoe
-import pdfkit
-import plotly.graph_objects as go
-import pycountry
-from google.cloud import bigquery
-from jinja2 import Environment, FileSystemLoader
-from tqdm import tqdm
-
-env = Environment(loader=FileSystemLoader("templates"))
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# The sibling modules are imported at startup, so --profile-startup times them
+_startup_import_start = time.perf_counter()
+try:
+    from scripts.canonical import has_companions, to_canonical_json, write_companions
+    from scripts.chokepoints import build_upstream_chokepoints
+    from scripts.countries import COUNTRY_MAPPING, MANUAL_FLAG_MAPPING, CountryResolver
+    from scripts.highlight_index import build_highlight_index
+    from scripts.map_layout import compute_map_layout
+    from scripts.provision_store import MAJOR_PROVISION, MINOR_PROVISION, ProvisionStore
+    from scripts.tables import TableStore
+    from scripts.tracing import StageTracer
+    from scripts.validate import ERROR, Validator
+    from scripts.variant_index import build_variant_index
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from canonical import has_companions, to_canonical_json, write_companions
+    from chokepoints import build_upstream_chokepoints
+    from countries import COUNTRY_MAPPING, MANUAL_FLAG_MAPPING, CountryResolver
+    from highlight_index import build_highlight_index
+    from map_layout import compute_map_layout
+    from provision_store import MAJOR_PROVISION, MINOR_PROVISION, ProvisionStore
+    from tables import TableStore
+    from tracing import StageTracer
+    from validate import ERROR, Validator
+    from variant_index import build_variant_index
+startup_import_seconds = time.perf_counter() - _startup_import_start
+
+country_resolver = CountryResolver()
+
+# Seconds spent importing each lazily-imported module, for --profile-startup. These are
+# imported by the stages that use them, after startup
+import_times = {}
 
 EXPECTED_TYPES = {
     "material_resource",
@@ -32,39 +58,6 @@ BASE_NODE_TYPES = {"process", "ultimate_output"}
 TOOLS = "tools"
 MATERIALS = "materials"
 
-# TODO: somewhat duplicative of CAT, refactor into shared lib
-COUNTRY_MAPPING = {
-    "MAL": "Malaysia",
-    "TAN": "Tanzania",
-    "BAH": "Bahamas",
-    "Venezuela, Bolivarian Republic of": "Venezuela",
-    "Macao": "Macau",
-    "Viet Nam": "Vietnam",
-    "Cayman Islands": "Cayman Islands (the)",
-    "China": "China (mainland)",
-    "Eswatini": "Swaziland",
-    "Korea, Republic of": "South Korea",
-    "Korea": "South Korea",
-    "Korea, Democratic People's Republic of": "North Korea",
-    "Lao People's Democratic Republic": "Laos",
-    "Bolivia, Plurinational State of": "Bolivia",
-    "Palestine, State of": "Palestine",
-    "Sao Tome and Principe": "São Tomé and Príncipe",
-    "Syrian Arab Republic": "Syria",
-    "Reunion": "Réunion",
-    "Russian Federation": "Russia",
-    "Iran, Islamic Republic of": "Iran",
-    "Taiwan, Province of China": "Taiwan",
-    "EUR": "Europe",
-    "Various countries": "Various countries",
-}
-
-MANUAL_FLAG_MAPPING = {
-    "EUR": "🇪🇺",
-}
-
-MAJOR_PROVISION = "Major"
-MINOR_PROVISION = "negligible"
 HIGH_PROVISION = "high"
 MARKET_SHARE_COL = "negligible_market_share"
 VALID_COUNTRY_PROVISION_TYPES = [
@@ -73,6 +66,147 @@ VALID_COUNTRY_PROVISION_TYPES = [
     "design_resource",
     "stage",
 ]
+MANIFEST_FILE = ".preprocess_manifest.json"
+
+
+def lazy_import(name: str, sibling: bool = False):
+    """
+    Import a module the first time it is needed. Heavy dependencies (plotly, pdfkit, bigquery,
+    etc.) are only used by some stages, so they are not imported at startup
+
+    :param name: Module name
+    :param sibling: If true, the module lives in the scripts directory alongside this file
+    :return: The imported module
+    """
+    if sibling and __package__:
+        name = f"{__package__}.{name}"
+    if name not in sys.modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        import_times[name] = time.perf_counter() - start
+    return sys.modules[name]
+
+
+@functools.lru_cache(maxsize=None)
+def get_template_env():
+    """
+    Get the jinja environment used to render pdf templates
+
+    :return: jinja2.Environment
+    """
+    jinja2 = lazy_import("jinja2")
+    return jinja2.Environment(loader=jinja2.FileSystemLoader("templates"))
+
+
+class BuildManifest:
+    """
+    Records content hashes of the input files and of each generated artifact, so that an
+    incremental run can leave outputs whose content has not changed untouched. Input hashes
+    are only reported; whether an artifact is regenerated depends on the hash of the content
+    it is generated from and the hash of the file on disk
+    """
+
+    def __init__(self, manifest_fi: str = None):
+        self.manifest_fi = manifest_fi
+        self.previous = {"inputs": {}, "artifacts": {}}
+        self.current = {"inputs": {}, "artifacts": {}}
+        if manifest_fi and os.path.exists(manifest_fi):
+            with open(manifest_fi) as f:
+                self.previous.update(json.load(f))
+
+    @staticmethod
+    def hash_content(content) -> str:
+        """
+        Hash a string or bytes object
+
+        :param content: Content to hash
+        :return: Hex digest of the content
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return hashlib.sha256(content).hexdigest()
+
+    @classmethod
+    def hash_file(cls, fi: str) -> str:
+        """
+        Hash the contents of a file
+
+        :param fi: Path to file
+        :return: Hex digest of the file contents
+        """
+        with open(fi, "rb") as f:
+            return cls.hash_content(f.read())
+
+    def input_changed(self, input_fi: str) -> bool:
+        """
+        Record the hash of an input file and check it against the previous run
+
+        :param input_fi: Path to input file
+        :return: True if the file is new or its contents changed since the previous run
+        """
+        content_hash = self.hash_file(input_fi)
+        self.current["inputs"][input_fi] = content_hash
+        return self.previous["inputs"].get(input_fi) != content_hash
+
+    def artifact_changed(self, key: str, content_hash: str, output_fi: str) -> bool:
+        """
+        Check whether an artifact needs to be regenerated. An artifact is only left as is if
+        it was generated from the same content in the previous run and the file on disk is
+        still the one that was written then, so outputs that were edited, deleted or only
+        partly written are regenerated
+
+        :param key: Identifier for the artifact
+        :param content_hash: Hash of the content the artifact is generated from
+        :param output_fi: Path where the artifact is written
+        :return: True if the artifact needs to be regenerated
+        """
+        previous = self.previous["artifacts"].get(key)
+        if (
+            isinstance(previous, dict)
+            and previous["content"] == content_hash
+            and os.path.exists(output_fi)
+            and self.hash_file(output_fi) == previous["output"]
+        ):
+            self.current["artifacts"][key] = previous
+            return False
+        return True
+
+    def record_artifact(
+        self, key: str, content_hash: str, output_fi: str, output_hash: str = None
+    ) -> None:
+        """
+        Record the hashes of an artifact that was just written
+
+        :param key: Identifier for the artifact
+        :param content_hash: Hash of the content the artifact was generated from
+        :param output_fi: Path the artifact was written to
+        :param output_hash: Hash of the file that was written, if already known. Otherwise
+            the file is hashed
+        :return: None
+        """
+        self.current["artifacts"][key] = {
+            "content": content_hash,
+            "output": output_hash or self.hash_file(output_fi),
+        }
+
+    def save(self) -> None:
+        """
+        Record this run's hashes as the previous run's, and write the manifest to disk if it has
+        a path. Entries that were not checked during this run (for example, pdfs when --pdfs was
+        not specified) are carried over from the previous manifest
+
+        :return: None
+        """
+        manifest = {
+            section: {**self.previous[section], **self.current[section]}
+            for section in self.current
+        }
+        self.previous = manifest
+        self.current = {"inputs": {}, "artifacts": {}}
+        if not self.manifest_fi:
+            return
+        with open(self.manifest_fi, mode="w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
 
 
 class Preprocess:
@@ -80,33 +214,297 @@ class Preprocess:
         self.node_to_meta = {}
         self.provider_to_meta = {}
         self.variants = {}
+        self.variant_index = None
+        self.graph = {}
+        self.graph_reverse = {}
+        self.manifest = None
+        self.tables = TableStore(streaming=getattr(args, "stream_csv", False))
+        self.bytes_written = 0
+        self.compressed_output = getattr(args, "compressed_output", False)
+        trace_fi = getattr(args, "trace_file", None)
+        self.tracer = StageTracer(
+            counters={
+                "rows": lambda: self.tables.rows_read,
+                "bytes_written": lambda: self.bytes_written,
+                "unmapped_countries": lambda: country_resolver.stats["country_miss"],
+                "unmapped_flags": lambda: country_resolver.stats["flag_miss"],
+            },
+            profile_dir=(
+                os.path.splitext(trace_fi)[0] + "_profiles"
+                if trace_fi and getattr(args, "profile", False)
+                else None
+            ),
+        )
         if not is_test:
+            try:
+                self.run(args)
+            finally:
+                if trace_fi:
+                    self.tracer.save(trace_fi)
+                print(self.tracer.report())
+
+    def run(self, args) -> None:  # pragma: no cover
+        """
+        Run each stage of preprocessing, as configured by the command line arguments
+
+        :param args: Parsed command line arguments
+        :return: None
+        """
+        tracer = self.tracer
+        with tracer.stage("setup"):
             if not os.path.exists(args.output_dir):
                 os.makedirs(args.output_dir)
             if not os.path.exists(args.output_pdfs_dir):
                 os.makedirs(args.output_pdfs_dir)
                 os.makedirs(args.output_pdfs_dir + "/images")
+            if args.country_table:
+                country_resolver.table_fi = args.country_table
+            if args.incremental:
+                self.manifest = BuildManifest(
+                    os.path.join(args.output_dir, MANIFEST_FILE)
+                )
+                for input_fi in [
+                    args.nodes,
+                    args.stages,
+                    args.sequence,
+                    args.providers,
+                    args.provision,
+                ]:
+                    if self.manifest.input_changed(input_fi):
+                        print(f"changed input: {input_fi}")
+            elif args.watch:
+                # Only kept in memory, so that watch mode only rewrites outputs that changed
+                self.manifest = BuildManifest()
+
+        # Files the in-memory model is built from, which a snapshot of it is keyed by
+        input_fis = [
+            args.nodes,
+            args.stages,
+            args.sequence,
+            args.providers,
+            args.provision,
+            args.images_file,
+        ] + ([args.country_table] if args.country_table else [])
+        if args.from_snapshot:
+            # Snapshots are only saved once their inputs have passed validation
+            with tracer.stage("load_snapshot"):
+                try:
+                    self.load_snapshot(args.snapshot_file, input_fis)
+                except ValueError as e:
+                    sys.exit(str(e))
+        else:
+            # Check the data before any of the slower stages start, so that every problem is
+            # reported at once
+            with tracer.stage("validate"):
+                issues = self.validate_inputs(
+                    args.nodes,
+                    args.stages,
+                    args.sequence,
+                    args.providers,
+                    args.provision,
+                )
+            num_errors = sum(issue["severity"] == ERROR for issue in issues)
+            if num_errors:
+                sys.exit(f"found {num_errors} errors in the input data")
+            if args.validate:
+                return
+            self.build_model(args)
+            with tracer.stage("save_snapshot"):
+                self.save_snapshot(args.snapshot_file, input_fis)
+
+        self.write_outputs(args)
+
+        if self.manifest is not None:
+            self.manifest.save()
+        print(country_resolver.report())
+        print(lazy_import("md_render", sibling=True).renderer.report())
+        if args.watch:
+            lazy_import("watch", sibling=True).Watcher(self, args).run()
+
+    def build_model(self, args) -> None:  # pragma: no cover
+        """
+        Build node and provider metadata, the graph and provision data from the source csvs,
+        writing the outputs that only depend on them
 
+        :param args: Parsed command line arguments
+        :return: None
+        """
+        tracer = self.tracer
+        with tracer.stage("mk_metadata"):
             self.mk_metadata(args.nodes, args.stages)
+        with tracer.stage("write_descriptions"):
             self.write_descriptions(args.nodes, args.stages, args.output_text_dir)
 
+        with tracer.stage("mk_images"):
             if args.images:
-                # Delete existing images
-                if os.path.exists(args.output_images_dir):
-                    shutil.rmtree(args.output_images_dir)
-                os.makedirs(args.output_images_dir)
-            self.mk_images(args.images, args.images_file, args.output_images_dir)
+                os.makedirs(args.output_images_dir, exist_ok=True)
+            self.mk_images(
+                args.images,
+                args.images_file,
+                args.output_images_dir,
+                args.image_cache_dir,
+            )
+        if args.image_derivatives:
+            with tracer.stage("mk_image_derivatives"):
+                self.mk_image_derivatives(
+                    args.output_images_dir,
+                    args.output_derivatives_dir,
+                    args.pdf_workers,
+                )
 
+        with tracer.stage("write_graphs"):
             self.write_graphs(args.sequence, args.output_dir)
+        with tracer.stage("mk_provider_to_meta"):
             self.mk_provider_to_meta(args.providers)
+        with tracer.stage("write_provision"):
             self.write_provision(args.provision, args.output_dir)
 
-            if args.refresh_bq:
+    def write_outputs(self, args) -> None:  # pragma: no cover
+        """
+        Run the stages that write outputs from the in-memory model, as configured by the command
+        line arguments
+
+        :param args: Parsed command line arguments
+        :return: None
+        """
+        tracer = self.tracer
+        if args.search_index:
+            with tracer.stage("write_search_index"):
+                self.write_search_index(
+                    args.nodes, args.stages, args.providers, args.output_dir
+                )
+        if args.chunked_output:
+            with tracer.stage("write_chunks"):
+                self.write_chunks(args.output_dir)
+
+        if args.scenarios:
+            with tracer.stage("run_scenarios"):
+                try:
+                    results_fi = self.run_scenarios(args.scenarios)
+                except ValueError as e:
+                    sys.exit(str(e))
+                print(f"wrote scenario results to {results_fi}")
+
+        if args.refresh_bq:
+            with tracer.stage("write_to_bq"):
                 providers_bq = self.write_provider_bq_table(args.providers)
-                self.write_to_bq(args.nodes, providers_bq)
+                bq_client = None
+                if args.bq_local_dir:
+                    bq_client = lazy_import("bq_upload", sibling=True).LocalClient(
+                        args.bq_local_dir
+                    )
+                self.write_to_bq(args.nodes, providers_bq, bq_client)
 
-            if args.pdfs:
-                self.mk_pdfs(args.nodes, args.stages, args.output_pdfs_dir)
+        if args.pdfs:
+            with tracer.stage("mk_pdfs"):
+                self.mk_pdfs(
+                    args.nodes, args.stages, args.output_pdfs_dir, args.pdf_workers
+                )
+
+    def _write_if_changed(self, output_fi: str, content: str) -> bool:
+        """
+        Write content to a file. In incremental mode, files whose content is unchanged since the
+        previous run are left untouched so that their mtimes (and downstream caches) are preserved
+
+        :param output_fi: Path to output file
+        :param content: Content to write
+        :return: True if the file was written
+        """
+        data = content.encode("utf-8")
+        content_hash = BuildManifest.hash_content(data)
+        if self.manifest is not None and not self.manifest.artifact_changed(
+            output_fi, content_hash, output_fi
+        ):
+            return False
+        with open(output_fi, mode="wb") as f:
+            f.write(data)
+        self.bytes_written += len(data)
+        if self.manifest is not None:
+            # The file holds exactly the content, so it does not need to be read back
+            self.manifest.record_artifact(
+                output_fi, content_hash, output_fi, content_hash
+            )
+        return True
+
+    def _write_artifact(self, output_fi: str, content: str) -> bool:
+        """
+        Write a data file the webapp imports, as in _write_if_changed. With --compressed_output,
+        its precompressed versions and content hash are written next to it
+
+        :param output_fi: Path to output file
+        :param content: Content to write, which should be serialized with to_canonical_json
+        :return: True if the file was written
+        """
+        written = self._write_if_changed(output_fi, content)
+        if self.compressed_output and (written or not has_companions(output_fi)):
+            self.bytes_written += write_companions(output_fi, content)
+        return written
+
+    def save_snapshot(self, snapshot_fi: str, input_fis: list) -> None:
+        """
+        Save the in-memory model, so that later stages can be run from it with --from-snapshot
+
+        :param snapshot_fi: Path to snapshot file
+        :param input_fis: Paths to the files the model was built from
+        :return: None
+        """
+        snapshot = lazy_import("snapshot", sibling=True)
+        snapshot.save_snapshot(
+            snapshot_fi,
+            {attr: getattr(self, attr, None) for attr in snapshot.SNAPSHOT_ATTRIBUTES},
+            self._hash_inputs(input_fis),
+        )
+
+    def load_snapshot(self, snapshot_fi: str, input_fis: list) -> None:
+        """
+        Load the in-memory model from a snapshot saved by save_snapshot
+
+        :param snapshot_fi: Path to snapshot file
+        :param input_fis: Paths to the files the model should be built from
+        :return: None
+        :raises ValueError: if there is no snapshot, or the input files changed since it was saved
+        """
+        snapshot = lazy_import("snapshot", sibling=True)
+        state = snapshot.load_snapshot(snapshot_fi, self._hash_inputs(input_fis))
+        for attr, value in state.items():
+            setattr(self, attr, value)
+
+    @staticmethod
+    def _hash_inputs(input_fis: list) -> dict:
+        """
+        Hash the contents of the files the in-memory model is built from
+
+        :param input_fis: Paths to input files
+        :return: Dict mapping normalized paths to hashes
+        """
+        return {os.path.normpath(fi): BuildManifest.hash_file(fi) for fi in input_fis}
+
+    def validate_inputs(
+        self,
+        nodes_fi: str,
+        stages_fi: str,
+        sequence_fi: str,
+        providers_fi: str,
+        provision_fi: str,
+    ) -> list:
+        """
+        Check the source csvs for problems, and print any that are found
+
+        :param nodes_fi: inputs csv
+        :param stages_fi: stages csv
+        :param sequence_fi: sequence csv
+        :param providers_fi: providers csv
+        :param provision_fi: provision csv
+        :return: List of problems, from Validator.validate
+        """
+        issues = Validator(
+            self.tables, EXPECTED_TYPES, BASE_NODE_TYPES, VALID_COUNTRY_PROVISION_TYPES
+        ).validate(nodes_fi, stages_fi, sequence_fi, providers_fi, provision_fi)
+        if self.tables.streaming:
+            # Don't keep the tables that validation read in memory
+            self.tables.invalidate()
+        print(Validator.report(issues))
+        return issues
 
     def mk_metadata(self, nodes_fi: str, stages_fi: str):
         """
@@ -116,42 +514,40 @@ class Preprocess:
             (from https://docs.google.com/spreadsheets/d/1fqM2FIdzhrG5ZQnXUMyBfeSodJldrjY0vZeTA5TRqrg/edit#gid=0)
         :return: Dict mapping node ids to metadata
         """
-        with open(nodes_fi, encoding="utf-8-sig") as f:
-            for line in csv.DictReader(f):
-                node_type = line["type"]
-                node_id = line["input_id"]
-                assert node_id not in self.node_to_meta, f"Duplicate id: {node_id}"
-                self.node_to_meta[node_id] = {
-                    "name": line["input_name"],
-                    "type": node_type,
-                    "stage_id": line["stage_id"],
-                    "total_market_size": line[
-                        "market_share_chart_global_market_size_info"
-                    ].lower(),  # lowercasing to prevent "The market size is Over..."
-                    "market_chart_caption": line["market_share_chart_caption"],
-                    "market_chart_source": self.clean_md_link(
-                        line["market_share_chart_source"]
-                    ),
-                }
-                try:
-                    assert node_type in EXPECTED_TYPES
-                except AssertionError:
-                    print("unexpected node_type:", node_type)
-                self.node_to_meta[node_id][MATERIALS] = []
-                self.node_to_meta[node_id][TOOLS] = []
-        with open(stages_fi, encoding="utf-8-sig") as f:
-            for line in csv.DictReader(f):
-                self.node_to_meta[line["stage_id"]] = {
-                    "name": line["stage_name"],
-                    "type": "stage",
-                    "total_market_size": line[
-                        "market_share_chart_global_market_size_info"
-                    ],
-                    "market_chart_caption": line["market_share_chart_caption"],
-                    "market_chart_source": self.clean_md_link(
-                        line["market_share_chart_source"]
-                    ),
-                }
+        for line in self.tables.rows(nodes_fi):
+            node_type = line["type"]
+            node_id = line["input_id"]
+            assert node_id not in self.node_to_meta, f"Duplicate id: {node_id}"
+            self.node_to_meta[node_id] = {
+                "name": line["input_name"],
+                "type": node_type,
+                "stage_id": line["stage_id"],
+                "total_market_size": line[
+                    "market_share_chart_global_market_size_info"
+                ].lower(),  # lowercasing to prevent "The market size is Over..."
+                "market_chart_caption": line["market_share_chart_caption"],
+                "market_chart_source": self.clean_md_link(
+                    line["market_share_chart_source"]
+                ),
+            }
+            try:
+                assert node_type in EXPECTED_TYPES
+            except AssertionError:
+                self.tracer.warn(
+                    "unexpected_node_type", f"unexpected node_type: {node_type}"
+                )
+            self.node_to_meta[node_id][MATERIALS] = []
+            self.node_to_meta[node_id][TOOLS] = []
+        for line in self.tables.rows(stages_fi):
+            self.node_to_meta[line["stage_id"]] = {
+                "name": line["stage_name"],
+                "type": "stage",
+                "total_market_size": line["market_share_chart_global_market_size_info"],
+                "market_chart_caption": line["market_share_chart_caption"],
+                "market_chart_source": self.clean_md_link(
+                    line["market_share_chart_source"]
+                ),
+            }
 
     def update_variants(self, parent: str, child: str, record: dict) -> bool:
         """
@@ -179,7 +575,8 @@ class Preprocess:
 
     def generate_graph(self, lines: iter) -> tuple:
         """
-        Generates dicts specifying a graph of process nodes, and associates nodes with their inputs
+        Generates dicts specifying a graph of process nodes, and associates nodes with their inputs.
+        Also indexes the full variant hierarchy, in self.variant_index
 
         :param lines: iterable of dict-like objects corresponding to node edge list
         :return: A tuple of the graph dict (parents: children) and its reverse (children: parents)
@@ -207,26 +604,40 @@ class Preprocess:
             else:
                 node_type = MATERIALS if parent_type == "material_resource" else TOOLS
                 self.node_to_meta[child][node_type].append(parent)
+        self.variant_index = build_variant_index(self.variants)
         return graph, graph_reverse
 
     def write_graphs(self, sequence: str, output_dir: str) -> None:  # pragma: no cover
         """
-        Parses a csv that specifies node type, the edges between nodes, and node variants
+        Parses a csv that specifies node type, the edges between nodes, and node variants, and
+        lays out the map of the graph
 
         :param sequence: sequence csv
             (from https://docs.google.com/spreadsheets/d/1DLfaIrmJYRy3FzculWDF2gRo74lDnf5WptnC7uIIkhE/edit#gid=0)
         :param output_dir: directory where graph metadata should be written
         :return: None
         """
-        with open(sequence) as f:
-            lines = csv.DictReader(f)
-            graph, graph_reverse = self.generate_graph(lines)
-        with open(os.path.join(output_dir, "graph.js"), mode="w") as f:
-            f.write(f"const graph={json.dumps(graph)};\n")
-            f.write(f"const graphReverse={json.dumps(graph_reverse)};\n")
-            f.write(f"const nodeToMeta={json.dumps(self.node_to_meta)};\n")
-            f.write(f"const variants={json.dumps(self.variants)};\n")
-            f.write("\nexport {graph, graphReverse, nodeToMeta, variants};\n")
+        self.graph, self.graph_reverse = self.generate_graph(self.tables.rows(sequence))
+        self._write_artifact(
+            os.path.join(output_dir, "graph.js"),
+            f"const graph={to_canonical_json(self.graph)};\n"
+            f"const graphReverse={to_canonical_json(self.graph_reverse)};\n"
+            f"const nodeToMeta={to_canonical_json(self.node_to_meta)};\n"
+            f"const variants={to_canonical_json(self.variants)};\n"
+            "const variantDescendants="
+            f"{to_canonical_json(self.variant_index['descendants'])};\n"
+            f"const variantAncestors={to_canonical_json(self.variant_index['ancestors'])};\n"
+            "\nexport {graph, graphReverse, nodeToMeta, variants, variantDescendants, "
+            "variantAncestors};\n",
+        )
+        self.map_layout = compute_map_layout(
+            self.graph, self.graph_reverse, self.node_to_meta
+        )
+        self._write_artifact(
+            os.path.join(output_dir, "layout.js"),
+            f"const mapLayout={to_canonical_json(self.map_layout)};\n"
+            "\nexport {mapLayout};\n",
+        )
 
     @staticmethod
     def get_flag(country_name: str) -> str:
@@ -236,14 +647,7 @@ class Preprocess:
         :param raw_country_name: Country name string
         :return: Flag emoji (in unicode) for that country or None
         """
-        try:
-            country = pycountry.countries.lookup(country_name)
-            return country.flag
-        except LookupError:
-            if country_name in MANUAL_FLAG_MAPPING:
-                return MANUAL_FLAG_MAPPING[country_name]
-            else:
-                return None
+        return country_resolver.get_flag(country_name)
 
     @staticmethod
     def get_country(raw_country_name: str) -> str:
@@ -253,13 +657,7 @@ class Preprocess:
         :param raw_country_name: Raw analyst-specified country name
         :return: Normalized country name
         """
-        country = pycountry.countries.get(alpha_3=raw_country_name)
-        clean_country_name = None if country is None else country.name
-        if clean_country_name is None:
-            if raw_country_name not in COUNTRY_MAPPING:
-                print(f"warning: pycountry could not find {raw_country_name}")
-            clean_country_name = raw_country_name
-        return COUNTRY_MAPPING.get(clean_country_name, clean_country_name)
+        return country_resolver.get_country(raw_country_name)
 
     @staticmethod
     def get_provision(record: dict, is_org: bool = False):
@@ -288,43 +686,37 @@ class Preprocess:
             mk_provision function
         :return: A dictionary mapping node ID to number of countries
         """
-        CONCENTRATION_THRESHOLD = 75
-        # Create a mapping of a node to an array of country shares
-        threshold_tracker = {}
-        for country in country_provision:
-            for node in country_provision[country]:
-                provision_value = country_provision[country][node]
-                # We drop minor providers because they are not relevant for concentration purposes
-                if provision_value == MINOR_PROVISION:
-                    continue
-                if node not in threshold_tracker:
-                    threshold_tracker[node] = [provision_value]
-                else:
-                    threshold_tracker[node].append(provision_value)
-        country_provision_concentration = {}
-        # Sort the country shares so we can add them in descending order
-        for node in threshold_tracker:
-            if MAJOR_PROVISION in threshold_tracker[node]:
-                # Call the node highly concentrated if there are 2 or fewer "Major"
-                # providers, and not concentrated if there are 3 or more
-                if len(threshold_tracker[node]) < 3:
-                    threshold_tracker[node] = [80]
-                else:
-                    threshold_tracker[node] = [20, 20, 20, 20]
-            else:
-                threshold_tracker[node].sort(reverse=True)
-            # Add up how many country shares it takes to reach the threshold
-            num_countries = 0
-            curr_threshold = 0
-            while curr_threshold < CONCENTRATION_THRESHOLD and num_countries < len(
-                threshold_tracker[node]
-            ):
-                curr_threshold += threshold_tracker[node][num_countries]
-                num_countries += 1
-            country_provision_concentration[node] = (
-                num_countries if num_countries > 0 else None
+        provision_matrix = lazy_import("provision_matrix", sibling=True)
+        return provision_matrix.ProvisionMatrix(country_provision).concentration()
+
+    @staticmethod
+    def get_year(record: dict):
+        """
+        Get the year a row of provision data applies to
+
+        :param record: Row of provision data
+        :return: Year as an int, or None if the row has no year
+        """
+        year = (record.get("year") or "").strip()
+        return int(year) if year else None
+
+    @classmethod
+    def get_provision_concentration_series(cls, country_provision_store) -> dict:
+        """
+        Calculate provision concentration separately for each year of provision data
+
+        :param country_provision_store: ProvisionStore of country provision, created in the
+            write_provision function
+        :return: A dictionary mapping node ID to a dictionary mapping year to number of countries
+        """
+        series = {}
+        for year in country_provision_store.years():
+            concentration = cls.get_provision_concentration(
+                country_provision_store.view(year)
             )
-        return country_provision_concentration
+            for node, num_countries in concentration.items():
+                series.setdefault(node, {})[year] = num_countries
+        return series
 
     def write_provision(self, provision_fi: str, output_dir: str) -> None:
         """
@@ -335,56 +727,215 @@ class Preprocess:
         :param output_dir: directory where output metadata should be written
         :return: None
         """
-        self.org_provision = {}
+        self.org_provision_store = ProvisionStore()
         process_nodes_with_org_provision = set()
-        self.country_provision = {}
-        country_flags = {}
-        with open(provision_fi) as f:
-            for line in csv.DictReader(f):
-                provider_id = line["provider_id"].strip()
-                provider_meta = self.provider_to_meta[provider_id]
-                provider_name = provider_meta["name"]
-                provided = line["provided_id"]
-                if provider_meta["type"] == "country":
-                    country_name = self.get_country(provider_name)
-                    if country_name not in self.country_provision:
-                        self.country_provision[country_name] = {}
-                        country_flags[country_name] = self.get_flag(provider_name)
-                    provision_share = self.get_provision(line)
-                    self.country_provision[country_name][provided] = provision_share
-                    if (provided not in self.node_to_meta) or (
-                        self.node_to_meta[provided]["type"]
-                        not in VALID_COUNTRY_PROVISION_TYPES
-                    ):
-                        print(
-                            f"unexpected country provision: {provided} "
-                            + self.node_to_meta.get(provided, {}).get("type", "")
-                        )
-                else:
-                    if provider_id not in self.org_provision:
-                        self.org_provision[provider_id] = {}
-                    self.org_provision[provider_id][provided] = self.get_provision(line)
-                    if self.node_to_meta.get(provided, {}).get("type") == "process":
-                        process_nodes_with_org_provision.add(provided)
+        self.country_provision_store = ProvisionStore()
+        self.country_flags = country_flags = {}
+        for line in self.tables.rows(provision_fi):
+            provider_id = line["provider_id"].strip()
+            provider_meta = self.provider_to_meta[provider_id]
+            provider_name = provider_meta["name"]
+            provided = line["provided_id"]
+            year = self.get_year(line)
+            if provider_meta["type"] == "country":
+                country_name = self.get_country(provider_name)
+                if country_name not in country_flags:
+                    country_flags[country_name] = self.get_flag(provider_name)
+                provision_share = self.get_provision(line)
+                self.country_provision_store.add(
+                    country_name, provided, year, provision_share
+                )
+                if (provided not in self.node_to_meta) or (
+                    self.node_to_meta[provided]["type"]
+                    not in VALID_COUNTRY_PROVISION_TYPES
+                ):
+                    self.tracer.warn(
+                        "unexpected_country_provision",
+                        f"unexpected country provision: {provided} "
+                        + self.node_to_meta.get(provided, {}).get("type", ""),
+                    )
+            else:
+                self.org_provision_store.add(
+                    provider_id, provided, year, self.get_provision(line)
+                )
+                if self.node_to_meta.get(provided, {}).get("type") == "process":
+                    process_nodes_with_org_provision.add(provided)
+        # The most recent value for each provider and node
+        self.country_provision = self.country_provision_store.view()
+        self.org_provision = self.org_provision_store.view()
         country_provision_concentration = self.get_provision_concentration(
             self.country_provision
         )
-        with open(os.path.join(output_dir, "provision.js"), mode="w") as f:
-            f.write(f"const countryProvision={json.dumps(self.country_provision)};\n")
-            f.write(f"const countryFlags={json.dumps(country_flags)};\n")
-            f.write(
-                f"const countryProvisionConcentration={json.dumps(country_provision_concentration)};\n"
+        self.country_provision_concentration = country_provision_concentration
+        self.process_nodes_with_org_provision = process_nodes_with_org_provision
+        self.upstream_chokepoints = build_upstream_chokepoints(
+            self.graph_reverse,
+            self.node_to_meta,
+            self._get_variant_index()["descendants"],
+            self.country_provision,
+            country_provision_concentration,
+        )
+        self._write_artifact(
+            os.path.join(output_dir, "provision.js"),
+            f"const countryProvision={to_canonical_json(self.country_provision, sort_keys=False)};\n"
+            f"const countryFlags={to_canonical_json(country_flags)};\n"
+            f"const countryProvisionConcentration={to_canonical_json(country_provision_concentration)};\n"
+            f"const upstreamChokepoints={to_canonical_json(self.upstream_chokepoints)};\n"
+            f"const orgProvision={to_canonical_json(self.org_provision, sort_keys=False)};\n"
+            f"const processNodesWithOrgProvision={to_canonical_json(process_nodes_with_org_provision)};\n"
+            f"const providerMeta={to_canonical_json(self.provider_to_meta)};\n"
+            "\nexport {countryProvision, countryFlags, "
+            "countryProvisionConcentration, upstreamChokepoints, orgProvision, "
+            "processNodesWithOrgProvision, providerMeta};\n",
+        )
+        self.highlight_index = build_highlight_index(
+            self.node_to_meta,
+            self._get_variant_index()["ancestors"],
+            self.country_provision,
+            self.org_provision,
+            country_provision_concentration,
+        )
+        self._write_artifact(
+            os.path.join(output_dir, "highlights.js"),
+            f"const highlightIndex={to_canonical_json(self.highlight_index)};\n"
+            "\nexport {highlightIndex};\n",
+        )
+        self.write_provision_years(output_dir)
+
+    def write_provision_years(self, output_dir: str) -> None:
+        """
+        Write provision data split by year, so that a webapp view of a single year only needs
+        to load that year. The webapp does not load these files yet; it imports provision.js,
+        which has the most recent value for each provider and node. Does nothing if the
+        provision data has no years. Must be called after write_provision has populated the
+        provision stores
+
+        :param output_dir: directory where output metadata should be written
+        :return: None
+        """
+        years = sorted(
+            set(self.country_provision_store.years())
+            | set(self.org_provision_store.years())
+        )
+        if not years:
+            return
+        self._write_artifact(
+            os.path.join(output_dir, "provision_years.js"),
+            f"const provisionYears={to_canonical_json(years)};\n"
+            "const countryProvisionConcentrationByYear="
+            f"{to_canonical_json(self.get_provision_concentration_series(self.country_provision_store))};\n"
+            "\nexport {provisionYears, countryProvisionConcentrationByYear};\n",
+        )
+        for year in years:
+            country_provision = self.country_provision_store.view(year)
+            self._write_artifact(
+                os.path.join(output_dir, f"provision_{year}.js"),
+                f"const countryProvision={to_canonical_json(country_provision, sort_keys=False)};\n"
+                "const countryProvisionConcentration="
+                f"{to_canonical_json(self.get_provision_concentration(country_provision))};\n"
+                f"const orgProvision={to_canonical_json(self.org_provision_store.view(year), sort_keys=False)};\n"
+                "\nexport {countryProvision, countryProvisionConcentration, orgProvision};\n",
             )
-            f.write(f"const orgProvision={json.dumps(self.org_provision)};\n")
-            f.write(
-                f"const processNodesWithOrgProvision={json.dumps(list(process_nodes_with_org_provision))};\n"
+
+    def write_chunks(self, output_dir: str) -> None:
+        """
+        Write the graph and provision data in the compact, per-node chunked format described in
+        chunked.py, as an alternative to graph.js and provision.js. Must be called after
+        write_graphs and write_provision
+
+        :param output_dir: directory where the chunks directory should be written
+        :return: None
+        """
+        chunked = lazy_import("chunked", sibling=True)
+        index, chunks = chunked.build_chunks(
+            self.graph,
+            self.graph_reverse,
+            self.node_to_meta,
+            self.variants,
+            self.country_provision,
+            self.country_flags,
+            self.country_provision_concentration,
+            self.org_provision,
+            self.process_nodes_with_org_provision,
+            self.provider_to_meta,
+        )
+        chunked.write_chunks(index, chunks, output_dir, self._write_if_changed)
+
+    def write_search_index(
+        self, nodes_fi: str, stages_fi: str, providers_fi: str, output_dir: str
+    ) -> None:
+        """
+        Write a full-text search index over the names and descriptions of nodes and stages, and
+        the names, aliases and headquarters countries of providers
+
+        :param nodes_fi: inputs csv
+        :param stages_fi: stages csv
+        :param providers_fi: provider csv
+        :param output_dir: directory where the search directory should be written
+        :return: None
+        """
+        search_index = lazy_import("search_index", sibling=True)
+        builder = search_index.SearchIndexBuilder()
+        for line in self.tables.rows(stages_fi):
+            builder.add(
+                line["stage_id"],
+                "stage",
+                line["stage_name"],
+                {"name": line["stage_name"], "description": line["description"]},
             )
-            f.write(f"const providerMeta={json.dumps(self.provider_to_meta)};\n")
-            f.write(
-                "\nexport {countryProvision, countryFlags, "
-                "countryProvisionConcentration, orgProvision, processNodesWithOrgProvision, "
-                "providerMeta};\n"
+        for line in self.tables.rows(nodes_fi):
+            builder.add(
+                line["input_id"],
+                line["type"],
+                line["input_name"],
+                {"name": line["input_name"], "description": line["description"]},
             )
+        for line in self.tables.rows(providers_fi):
+            builder.add(
+                line["provider_id"],
+                line["provider_type"],
+                line["provider_name"],
+                {
+                    "name": line["provider_name"],
+                    "alias": line.get("alias"),
+                    "country": (
+                        self.get_country(line["country"]).strip()
+                        if line["country"]
+                        else None
+                    ),
+                },
+            )
+        index, shards = builder.build()
+        search_index.write_search_index(
+            index, shards, output_dir, self._write_if_changed
+        )
+
+    def run_scenarios(self, scenarios_fi: str) -> str:
+        """
+        Compute the effects of removing providers or capping their shares, as described in
+        scenarios.py. Must be called after write_graphs and write_provision
+
+        :param scenarios_fi: Path to json list of scenarios
+        :return: Path to the results, which are written next to the scenarios as
+            <scenarios name>_results.json
+        :raises ValueError: if the scenarios are invalid
+        """
+        with open(scenarios_fi, encoding="utf-8") as f:
+            scenarios = json.load(f)
+        engine = lazy_import("scenarios", sibling=True).ScenarioEngine(
+            self.country_provision,
+            self.org_provision,
+            self.provider_to_meta,
+            self.graph,
+            self.node_to_meta,
+            self._get_variant_index()["ancestors"],
+        )
+        results_fi = os.path.splitext(scenarios_fi)[0] + "_results.json"
+        self._write_if_changed(
+            results_fi,
+            json.dumps(engine.run_all(scenarios), separators=(",", ":")),
+        )
+        return results_fi
 
     def write_descriptions(
         self, nodes_fi: str, stages_fi: str, output_dir: str
@@ -400,22 +951,17 @@ class Preprocess:
         :return: None
         """
         header_template = "#### {}\n\n"
-        with open(nodes_fi, encoding="utf-8-sig") as f:
-            for line in csv.DictReader(f):
-                with open(
-                    os.path.join(output_dir, line["input_id"]) + ".mdx", mode="w"
-                ) as out:
-                    out.write(header_template.format(line["input_name"]))
-                    out.write(line["description"])
-        with open(stages_fi, encoding="utf-8-sig") as f:
-            for line in csv.DictReader(f):
-                with open(
-                    os.path.join(output_dir, line["stage_id"]) + ".mdx", mode="w"
-                ) as out:
-                    out.write(header_template.format(line["stage_name"]))
-                    out.write(
-                        line["description"].replace("<", "&lt;").replace(">", "&gt;")
-                    )
+        for line in self.tables.rows(nodes_fi):
+            self._write_if_changed(
+                os.path.join(output_dir, line["input_id"]) + ".mdx",
+                header_template.format(line["input_name"]) + line["description"],
+            )
+        for line in self.tables.rows(stages_fi):
+            self._write_if_changed(
+                os.path.join(output_dir, line["stage_id"]) + ".mdx",
+                header_template.format(line["stage_name"])
+                + line["description"].replace("<", "&lt;").replace(">", "&gt;"),
+            )
 
     def _get_node_to_country_provision(self):
         """
@@ -423,61 +969,10 @@ class Preprocess:
 
         :return: Above dictionary
         """
-        node_to_country_provision = {}
-        for country in self.country_provision:
-            for node in self.country_provision[country]:
-                if node not in node_to_country_provision:
-                    node_to_country_provision[node] = {
-                        "graph": [],
-                        "undefined": [],
-                        "all_names": [],
-                    }
-                provision = self.country_provision[country][node]
-                node_to_country_provision[node]["all_names"].append(country)
-                if type(provision) is int:
-                    node_to_country_provision[node]["graph"].append(
-                        {"country": country, "value": provision}
-                    )
-                else:
-                    countryDesc = country
-                    if provision == MINOR_PROVISION:
-                        countryDesc += " (negligible)"
-                    node_to_country_provision[node]["undefined"].append(countryDesc)
-        for node in node_to_country_provision:
-            node_to_country_provision[node]["graph"] = sorted(
-                node_to_country_provision[node]["graph"],
-                key=lambda d: d["value"],
-                reverse=True,
-            )
-            node_to_country_provision[node]["undefined"].sort()
-            node_to_country_provision[node]["all_names"].sort()
-        return node_to_country_provision
-
-    def _get_country_provision_graph(
-        self, graph, output_dir, node_id
-    ):  # pragma: no cover
-        """
-        Generate a graph representing country provisions for a node
-
-        :return: A dictionary representation of a graph
-        """
-        fig = go.Figure(
-            data=[
-                go.Bar(
-                    x=[e["value"] for e in graph],
-                    y=[e["country"] for e in graph],
-                    orientation="h",
-                    text=[str(e["value"]) + "%" for e in graph],
-                    textposition="auto",
-                )
-            ]
-        )
-        fig.update_layout(
-            xaxis=dict(title="Share of global market"),
-            yaxis=dict(categoryorder="total ascending"),
-            margin=dict(t=30, r=30, b=35, l=120, pad=4),
-        )
-        fig.write_image(os.path.join(output_dir, "images", node_id) + ".jpg")
+        provision_matrix = lazy_import("provision_matrix", sibling=True)
+        return provision_matrix.ProvisionMatrix(
+            self.country_provision
+        ).node_to_country_provision()
 
     def _get_node_to_org_desc_list(self):
         """
@@ -485,28 +980,29 @@ class Preprocess:
 
         :return: Above dictionary
         """
-        node_to_org_desc_list = {}
-        for org in self.org_provision:
-            for node in self.org_provision[org]:
-                if node not in node_to_org_desc_list:
-                    node_to_org_desc_list[node] = []
-                org_desc = self.provider_to_meta[org]["name"]
-                if self.org_provision[org][node] == MINOR_PROVISION:
-                    org_desc += " (negligible market share)"
-                if self.provider_to_meta[org].get("hq_country"):
-                    org_desc += " - " + self.provider_to_meta[org].get("hq_country")
-                node_to_org_desc_list[node].append(org_desc.strip())
-        for node in node_to_org_desc_list:
-            node_to_org_desc_list[node].sort()
-        return node_to_org_desc_list
+        provision_matrix = lazy_import("provision_matrix", sibling=True)
+        return provision_matrix.ProvisionMatrix(
+            self.org_provision
+        ).node_to_provider_desc_list(self.provider_to_meta)
+
+    def _get_variant_index(self) -> dict:
+        """
+        Get the variant index built in generate_graph, building it if the variants were set
+        some other way
+
+        :return: Variant index, from build_variant_index
+        """
+        if self.variant_index is None:
+            self.variant_index = build_variant_index(self.variants)
+        return self.variant_index
 
     def _get_sub_variants(self):
-        subVariants = copy.deepcopy(self.variants)
-        for nodeWithVariants in subVariants:
-            for nodeVariant in subVariants[nodeWithVariants]:
-                if nodeVariant in subVariants:
-                    subVariants[nodeWithVariants].extend(subVariants[nodeVariant])
-        return subVariants
+        """
+        Get all of the variants below each node
+
+        :return: Dict mapping nodes to lists of their variants, at any depth
+        """
+        return self._get_variant_index()["descendants"]
 
     @staticmethod
     def _preprocess_variants_list(variants_list):
@@ -535,10 +1031,6 @@ class Preprocess:
         """
         node_description = line["description"].replace("\n", "<br/>")
         node_countries = node_to_country_provision.get(node_id, {})
-        if node_countries.get("graph"):
-            self._get_country_provision_graph(
-                node_countries["graph"], output_dir, node_id
-            )
         node_orgs = node_to_org_desc_list.get(node_id)
         # Preprocess variant information.
         node_variants = [
@@ -559,7 +1051,7 @@ class Preprocess:
         )
         node_orgs_variants = self._preprocess_variants_list(node_orgs_variants)
         # Create PDF
-        template = env.get_template("pdf.html")
+        template = get_template_env().get_template("pdf.html")
         cluster_page = template.render(
             node_description=node_description,
             node_id=node_id,
@@ -571,53 +1063,100 @@ class Preprocess:
             node_orgs_variants=node_orgs_variants,
             images_folder=images_folder,
         )
-        pdfkit.from_string(
+        output_fi = os.path.join(output_dir, node_id) + ".pdf"
+        content_hash = BuildManifest.hash_content(
+            cluster_page + json.dumps(node_countries.get("graph"))
+        )
+        if self.manifest is not None and not self.manifest.artifact_changed(
+            output_fi, content_hash, output_fi
+        ):
+            return
+        lazy_import("pdfkit").from_string(
             cluster_page,
-            os.path.join(output_dir, node_id) + ".pdf",
+            output_fi,
             {"enable-local-file-access": None},
         )
+        if self.manifest is not None:
+            self.manifest.record_artifact(output_fi, content_hash, output_fi)
 
     def mk_pdfs(
-        self, nodes_fi: str, stages_fi: str, output_dir: str
-    ) -> None:  # pragma: no cover
+        self, nodes_fi: str, stages_fi: str, output_dir: str, workers: int = 1
+    ) -> dict:  # pragma: no cover
         """
         Generate pdf version of the each node's description
 
         :param nodes_fi: CSV file with node information
         :param stages_fi: CSV file with stage information
         :param output_dir: name of directory where pdfs should be written
-        :return: None
+        :param workers: number of processes to generate pdfs in
+        :return: Dict mapping ids of nodes whose pdf could not be generated to an error message
         """
         node_to_country_provision = self._get_node_to_country_provision()
         node_to_org_desc_list = self._get_node_to_org_desc_list()
         sub_variants = self._get_sub_variants()
         images_folder = os.path.abspath(output_dir + "/images")
-        print("Generating node pdfs...")
-        with open(nodes_fi, encoding="utf-8-sig") as f:
-            for line in tqdm(csv.DictReader(f)):
-                node_id = line["input_id"]
-                self._mk_pdf_for_node(
-                    node_id,
-                    line,
-                    images_folder,
-                    node_to_country_provision,
-                    node_to_org_desc_list,
-                    sub_variants,
-                    output_dir,
-                )
-        print("Generating stage pdfs...")
-        with open(stages_fi, encoding="utf-8-sig") as f:
-            for line in tqdm(csv.DictReader(f)):
-                node_id = line["stage_id"]
-                self._mk_pdf_for_node(
-                    node_id,
-                    line,
-                    images_folder,
-                    node_to_country_provision,
-                    node_to_org_desc_list,
-                    sub_variants,
-                    output_dir,
-                )
+        tasks = []
+        tasks.extend((line["input_id"], line) for line in self.tables.rows(nodes_fi))
+        tasks.extend((line["stage_id"], line) for line in self.tables.rows(stages_fi))
+        # Export all charts up front, so the pdf workers only need to reference them
+        chart_renderer = lazy_import("charts", sibling=True).ChartRenderer(
+            images_folder
+        )
+        chart_failures = chart_renderer.render(
+            {
+                node_id: node_to_country_provision[node_id]["graph"]
+                for node_id, _ in tasks
+                if node_to_country_provision.get(node_id, {}).get("graph")
+            },
+            workers,
+        )
+        # A pdf without its chart is incomplete, so nodes whose chart failed are skipped
+        failures = {
+            node_id: f"failed to render chart:\n{error}"
+            for node_id, error in chart_failures.items()
+        }
+        num_nodes = len(tasks)
+        tasks = [task for task in tasks if task[0] not in failures]
+        # The precomputed maps are handed to each worker once, when it starts,
+        # rather than being pickled along with every task
+        worker_args = (
+            self,
+            images_folder,
+            node_to_country_provision,
+            node_to_org_desc_list,
+            sub_variants,
+            output_dir,
+        )
+        tqdm = lazy_import("tqdm").tqdm
+        print(f"Generating node and stage pdfs with {workers} worker(s)...")
+        if workers <= 1:
+            _init_pdf_worker(*worker_args)
+            results = (_mk_pdf_worker(task) for task in tasks)
+            results = list(tqdm(results, total=len(tasks)))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_pdf_worker,
+                initargs=worker_args,
+            ) as executor:
+                futures = [executor.submit(_mk_pdf_worker, task) for task in tasks]
+                results = [
+                    future.result()
+                    for future in tqdm(as_completed(futures), total=len(futures))
+                ]
+        for node_id, error, artifacts in results:
+            if error:
+                failures[node_id] = error
+            elif self.manifest is not None:
+                self.manifest.current["artifacts"].update(artifacts)
+        for node_id in sorted(failures):
+            self.tracer.warn(
+                "pdf_failed",
+                f"failed to generate pdf for {node_id}:\n{failures[node_id]}",
+            )
+        if failures:
+            print(f"warning: {len(failures)} of {num_nodes} pdfs failed")
+        return failures
 
     def mk_provider_to_meta(self, provider_fi: str):
         """
@@ -628,20 +1167,19 @@ class Preprocess:
         :return: None (mutates self.provider_meta)
         """
         name_to_id = {}
-        with open(provider_fi) as f:
-            for line in csv.DictReader(f):
-                self.provider_to_meta[line["provider_id"]] = {
-                    "name": line["provider_name"],
-                    "type": line["provider_type"],
-                }
-                if line["country"]:
-                    self.provider_to_meta[line["provider_id"]]["hq_flag"] = (
-                        self.get_flag(line["country"].strip())
-                    )
-                    self.provider_to_meta[line["provider_id"]]["hq_country"] = (
-                        self.get_country(line["country"]).strip()
-                    )
-                name_to_id[line["provider_name"]] = line["provider_id"]
+        for line in self.tables.rows(provider_fi):
+            self.provider_to_meta[line["provider_id"]] = {
+                "name": line["provider_name"],
+                "type": line["provider_type"],
+            }
+            if line["country"]:
+                self.provider_to_meta[line["provider_id"]]["hq_flag"] = self.get_flag(
+                    line["country"].strip()
+                )
+                self.provider_to_meta[line["provider_id"]]["hq_country"] = (
+                    self.get_country(line["country"]).strip()
+                )
+            name_to_id[line["provider_name"]] = line["provider_id"]
 
     def write_provider_bq_table(self, provider_fi: str):
         """
@@ -653,31 +1191,58 @@ class Preprocess:
         :return: string representing file name of newly-created CSV
         """
         provider_bq_fi = provider_fi[:-4] + "_bq.csv"
-        with open(provider_fi) as in_f:
-            with open(provider_bq_fi, "w") as out_f:
-                header_names = [
-                    "provider_name",
-                    "provider_id",
-                    "provider_type",
-                    "country",
-                ]
-                writer = csv.DictWriter(out_f, fieldnames=header_names)
-                writer.writeheader()
-                for line in csv.DictReader(in_f):
-                    if line["country"]:
-                        line["country"] = self.get_country(line["country"]).strip()
-                    writer.writerow(line)
+        with open(provider_bq_fi, "w") as out_f:
+            header_names = [
+                "provider_name",
+                "provider_id",
+                "provider_type",
+                "country",
+            ]
+            writer = csv.DictWriter(
+                out_f, fieldnames=header_names, extrasaction="ignore"
+            )
+            writer.writeheader()
+            for line in self.tables.rows(provider_fi):
+                if line["country"]:
+                    line["country"] = self.get_country(line["country"]).strip()
+                writer.writerow(line)
         return provider_bq_fi
 
-    def write_to_bq(self, nodes_fi, provider_bq_fi):  # pragma: no cover
+    def write_to_bq(
+        self, nodes_fi: str, provider_bq_fi: str, client=None
+    ) -> list:  # pragma: no cover
         """
         Load CSVs to bigquery tables, overwriting the existing tables.
-        Also loads the CSVs to versioned backup tables.
+        Also loads the CSVs to versioned backup tables. All tables are loaded
+        concurrently, and tables that already hold the current content are skipped.
 
         :param nodes_fi: inputs csv
         :param provider_bq_fi: provider csv
+        :param client: Client to load tables with, such as a bq_upload.LocalClient; if None,
+            a bigquery client is created
+        :return: List of load results, from BqUploader.upload
         """
-        client = bigquery.Client(project="gcp-cset-projects")
+        bq_upload = lazy_import("bq_upload", sibling=True)
+        job_config_fn = None
+        if client is None:
+            bigquery = lazy_import("google.cloud.bigquery")
+            client = bigquery.Client(project="gcp-cset-projects")
+
+            def mk_job_config(schema):
+                return bigquery.LoadJobConfig(
+                    source_format=bigquery.SourceFormat.CSV,
+                    skip_leading_rows=1,
+                    autodetect=False,
+                    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                    allow_quoted_newlines=True,
+                    schema=[
+                        bigquery.SchemaField(name, field_type)
+                        for name, field_type in schema
+                    ],
+                )
+
+            job_config_fn = mk_job_config
+
         dataset_ids = [
             "gcp-cset-projects.eto_chipexplorer",
             "gcp-cset-projects.eto_chipexplorer_backups",
@@ -686,52 +1251,45 @@ class Preprocess:
             "inputs": {
                 "file": nodes_fi,
                 "schema": [
-                    bigquery.SchemaField("input_name", "STRING"),
-                    bigquery.SchemaField("input_id", "STRING"),
-                    bigquery.SchemaField("type", "STRING"),
-                    bigquery.SchemaField("stage_name", "STRING"),
-                    bigquery.SchemaField("stage_id", "STRING"),
-                    bigquery.SchemaField("description", "STRING"),
-                    bigquery.SchemaField(
-                        "market_share_chart_global_market_size_info", "STRING"
-                    ),
-                    bigquery.SchemaField("market_share_chart_caption", "STRING"),
-                    bigquery.SchemaField("market_share_chart_source", "STRING"),
+                    ("input_name", "STRING"),
+                    ("input_id", "STRING"),
+                    ("type", "STRING"),
+                    ("stage_name", "STRING"),
+                    ("stage_id", "STRING"),
+                    ("description", "STRING"),
+                    ("market_share_chart_global_market_size_info", "STRING"),
+                    ("market_share_chart_caption", "STRING"),
+                    ("market_share_chart_source", "STRING"),
                 ],
             },
             "providers": {
                 "file": provider_bq_fi,
                 "schema": [
-                    bigquery.SchemaField("provider_name", "STRING"),
-                    bigquery.SchemaField("provider_id", "STRING"),
-                    bigquery.SchemaField("provider_type", "STRING"),
-                    bigquery.SchemaField("country", "STRING"),
+                    ("provider_name", "STRING"),
+                    ("provider_id", "STRING"),
+                    ("provider_type", "STRING"),
+                    ("country", "STRING"),
                 ],
             },
         }
 
+        loads = []
         for table_id in table_ids:
-            job_config = bigquery.LoadJobConfig(
-                source_format=bigquery.SourceFormat.CSV,
-                skip_leading_rows=1,
-                autodetect=False,
-                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-                allow_quoted_newlines=True,
-                schema=table_ids[table_id]["schema"],
+            for dataset_id in dataset_ids:
+                table_name = f"{dataset_id}.{table_id}"
+                if "backups" in dataset_id:
+                    table_name += "_" + datetime.date.today().strftime("%Y%m%d")
+                loads.append({"table": table_name, **table_ids[table_id]})
+        print(f"uploading data to {', '.join(load['table'] for load in loads)}")
+        uploader = bq_upload.BqUploader(client, job_config_fn)
+        results = uploader.upload(loads)
+        print(uploader.report(results))
+        failed = [result["table"] for result in results if result["status"] == "failed"]
+        if failed:
+            raise RuntimeError(
+                f"Failed to load {', '.join(failed)}; rerun to retry the failed tables"
             )
-            with open(table_ids[table_id]["file"], "rb") as source_file:
-                for dataset_id in dataset_ids:
-                    table_name = f"{dataset_id}.{table_id}"
-                    if "backups" in dataset_id:
-                        table_name += "_" + datetime.date.today().strftime("%Y%m%d")
-                    print(f"uploading data to {table_name}")
-                    job = client.load_table_from_file(
-                        source_file,
-                        table_name,
-                        job_config=job_config,
-                        rewind=True,
-                    )
-                    job.result()  # Wait for the upload to complete
+        return results
 
     @staticmethod
     def clean_md_link(text) -> str:
@@ -741,50 +1299,158 @@ class Preprocess:
         :param text: text that may contain a markdown link
         :return: text with markdown link replaced with html link
         """
-        # TODO: either move the markdown parsing for the captions into the webapp or use a different
-        #   mistletoe renderer rather than hacking up the default output
-        return re.sub(
-            r"<\/p>", "", re.sub(r"^<p>", "", mistletoe.markdown(text).strip())
-        ).replace("a href=", "a target='_blank' rel='noopener' href=")
+        return lazy_import("md_render", sibling=True).renderer.render(text)
 
-    def mk_images(self, download_images: bool, images_fi: str, output_dir: str) -> None:
+    def mk_images(
+        self,
+        download_images: bool,
+        images_fi: str,
+        output_dir: str,
+        cache_dir: str = os.path.join(".cache", "images"),
+    ) -> None:
         """
-        Downloads images from an airtable CSV and renames them according to their associated node
+        Downloads images from an airtable CSV and renames them according to their associated node.
+        Images that have not changed since they were last downloaded are not downloaded again,
+        and images of nodes that are no longer in the CSV are removed
 
         :param download_images: True if images should be re-downloaded
         :param images_fi: Path to airtable CSV
         :param output_dir: Path to output folder where images will be placed
+        :param cache_dir: Path to folder where downloaded images are cached between runs
         :return: None
         """
-        with open(images_fi) as f:
-            for line in csv.DictReader(f):
-                # image_col is of the format "something.jpeg (https://link.com/to/something.jpeg)"
-                image_col = line["image"]
-                image_fi = re.search(r"\((http.*?)\)", image_col)[1]
-                file_type = image_fi.split(".")[-1]
-                image_node_id = line["input_id"]
-
-                ## CHECK: missing node
-                if image_node_id in ["N68"]:
-                    continue
+        downloads = []
+        for line in self.tables.rows(images_fi):
+            # image_col is of the format "something.jpeg (https://link.com/to/something.jpeg)"
+            image_col = line["image"]
+            image_name, image_fi = re.search(
+                r"^(.*?)\s*\((http.*?)\)", image_col
+            ).groups()
+            file_type = image_fi.split(".")[-1]
+            image_node_id = line["input_id"]
+
+            ## CHECK: missing node
+            if image_node_id in ["N68"]:
+                continue
 
-                if download_images:
-                    urllib.request.urlretrieve(
+            if download_images:
+                downloads.append(
+                    (
                         image_fi,
                         os.path.join(output_dir, image_node_id) + f".{file_type}",
+                        # The url is signed and changes with every export, so cached
+                        # downloads are looked up by node and attachment name instead
+                        f"{image_node_id}/{image_name}",
                     )
-                if image_node_id == "N55":
-                    # Node N55 has been removed from the dataset, but remnants
-                    # seem to still exist somewhere
-                    continue
-
-                self.node_to_meta[image_node_id]["image_caption"] = self.clean_md_link(
-                    line["caption"]
                 )
-                self.node_to_meta[image_node_id]["image_license"] = self.clean_md_link(
-                    line["credit"]
-                )
-                self.node_to_meta[image_node_id]["image_offset"] = line["offset"]
+            if image_node_id == "N55":
+                # Node N55 has been removed from the dataset, but remnants
+                # seem to still exist somewhere
+                continue
+
+            self.node_to_meta[image_node_id]["image_caption"] = self.clean_md_link(
+                line["caption"]
+            )
+            self.node_to_meta[image_node_id]["image_license"] = self.clean_md_link(
+                line["credit"]
+            )
+            self.node_to_meta[image_node_id]["image_offset"] = line["offset"]
+
+        if download_images:
+            fetcher = lazy_import("image_fetch", sibling=True).ImageFetcher(cache_dir)
+            print(fetcher.report(fetcher.fetch_all(downloads)))
+            expected = {os.path.basename(output_fi) for _, output_fi, _ in downloads}
+            for fi in os.listdir(output_dir):
+                if fi not in expected:
+                    os.remove(os.path.join(output_dir, fi))
+
+    def mk_image_derivatives(
+        self, images_dir: str, output_dir: str, workers: int = 1
+    ) -> None:
+        """
+        Generates resized, compressed copies of node images, and adds their dimensions,
+        placeholders and srcsets to the nodes' metadata
+
+        :param images_dir: Path to folder containing node images, named by node id
+        :param output_dir: Path to output folder where derivatives will be placed. This
+            should be within the webapp's static folder, as the srcsets refer to it by url
+        :param workers: Number of processes to generate derivatives in
+        :return: None
+        """
+        sources = {}
+        for fi in sorted(os.listdir(images_dir)):
+            node_id = os.path.splitext(fi)[0]
+            if node_id in self.node_to_meta:
+                sources[node_id] = os.path.join(images_dir, fi)
+        derivatives = lazy_import("image_derivatives", sibling=True).ImageDerivatives(
+            output_dir, "/" + os.path.basename(output_dir), workers
+        )
+        for node_id, meta in derivatives.process(sources).items():
+            self.node_to_meta[node_id].update(meta)
+
+
+# State shared by all pdfs generated in a worker process, set once by _init_pdf_worker
+_pdf_worker_state = {}
+
+
+def _init_pdf_worker(
+    preprocess: Preprocess,
+    images_folder: str,
+    node_to_country_provision: dict,
+    node_to_org_desc_list: dict,
+    sub_variants: dict,
+    output_dir: str,
+) -> None:
+    """
+    Store the state shared across pdfs in the current (worker) process
+
+    :return: None
+    """
+    _pdf_worker_state.update(
+        preprocess=preprocess,
+        images_folder=images_folder,
+        node_to_country_provision=node_to_country_provision,
+        node_to_org_desc_list=node_to_org_desc_list,
+        sub_variants=sub_variants,
+        output_dir=output_dir,
+    )
+
+
+def _mk_pdf_worker(task: tuple) -> tuple:
+    """
+    Generate the pdf for a single node, catching any errors so one bad node does not
+    abort the batch
+
+    :param task: Tuple of node id and its row from the inputs or stages csv
+    :return: Tuple of node id, error message (or None on success), and the manifest entries
+        recorded while generating the pdf
+    """
+    node_id, line = task
+    preprocess = _pdf_worker_state["preprocess"]
+    manifest = preprocess.manifest
+    # Collect this node's manifest entries separately, so that they are only kept if
+    # the pdf was generated successfully
+    if manifest is not None:
+        recorded_artifacts = manifest.current["artifacts"]
+        manifest.current["artifacts"] = {}
+    error = None
+    try:
+        preprocess._mk_pdf_for_node(
+            node_id,
+            line,
+            _pdf_worker_state["images_folder"],
+            _pdf_worker_state["node_to_country_provision"],
+            _pdf_worker_state["node_to_org_desc_list"],
+            _pdf_worker_state["sub_variants"],
+            _pdf_worker_state["output_dir"],
+        )
+    except Exception:
+        error = traceback.format_exc()
+    artifacts = {}
+    if manifest is not None:
+        artifacts = {} if error else manifest.current["artifacts"]
+        manifest.current["artifacts"] = recorded_artifacts
+    return node_id, error, artifacts
 
 
 if __name__ == "__main__":
@@ -806,11 +1472,54 @@ if __name__ == "__main__":
         "--output_images_dir",
         default=os.path.join("supply-chain", "src", "images", "nodes"),
     )
+    parser.add_argument("--image_cache_dir", default=os.path.join(".cache", "images"))
+    parser.add_argument("--image_derivatives", action="store_true")
+    parser.add_argument(
+        "--output_derivatives_dir",
+        default=os.path.join("supply-chain", "static", "node-images"),
+    )
     parser.add_argument("--pdfs", action="store_true")
     parser.add_argument(
         "--output_pdfs_dir", default=os.path.join("supply-chain", "src", "pdfs")
     )
+    parser.add_argument("--pdf-workers", type=int, default=os.cpu_count() or 1)
     parser.add_argument("--refresh_bq", action="store_true")
+    parser.add_argument("--bq_local_dir")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--country_table")
+    parser.add_argument("--stream_csv", action="store_true")
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--watch", action="store_true")
+    parser.add_argument("--chunked_output", action="store_true")
+    parser.add_argument("--search_index", action="store_true")
+    parser.add_argument("--compressed_output", action="store_true")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long the startup imports took before running any stage, and how "
+        "long each module imported lazily by a stage took at the end. Use "
+        "python3 -X importtime scripts/preprocess.py for a breakdown of every import, "
+        "including the interpreter's own",
+    )
+    parser.add_argument(
+        "--trace_file", default=os.path.join(".cache", "preprocess_trace.json")
+    )
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument(
+        "--snapshot_file",
+        default=os.path.join(".cache", "preprocess_snapshot.pickle"),
+    )
+    parser.add_argument("--from-snapshot", action="store_true")
+    parser.add_argument("--scenarios")
     args = parser.parse_args()
 
+    if args.profile_startup:
+        print(
+            f"startup imports: {startup_import_seconds:.3f}s, "
+            f"{time.perf_counter() - _startup_import_start:.3f}s until the first stage"
+        )
     Preprocess(args)
+    if args.profile_startup:
+        print("modules imported by stages:")
+        for name, seconds in sorted(import_times.items(), key=lambda i: -i[1]):
+            print(f"  {name}: {seconds:.3f}s")
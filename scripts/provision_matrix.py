@@ -0,0 +1,232 @@
+"""
+Array-backed provision analytics. Provision dicts (provider -> node -> share) are converted once
+into arrays of their entries, and aggregations over nodes are computed with NumPy rather than by
+walking the nested dicts.
+
+Most providers only provide a few nodes, so the matrix is stored sparsely: one entry per
+(provider, node) pair that has a value, in column-major order, like a CSC matrix. Memory and the
+cost of each aggregation grow with the number of entries, not with providers x nodes.
+"""
+
+import numpy as np
+
+try:
+    from scripts.provision_store import MAJOR_PROVISION, MINOR_PROVISION
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from provision_store import MAJOR_PROVISION, MINOR_PROVISION
+
+CONCENTRATION_THRESHOLD = 75
+
+# Kinds of provision value stored in ProvisionMatrix.kind
+INT_SHARE = 1
+FLOAT_SHARE = 2
+MAJOR = 3
+MINOR = 4
+OTHER = 5
+
+
+def _get_kind(value) -> int:
+    if type(value) is int:
+        return INT_SHARE
+    if isinstance(value, float):
+        return FLOAT_SHARE
+    if value == MAJOR_PROVISION:
+        return MAJOR
+    if value == MINOR_PROVISION:
+        return MINOR
+    return OTHER
+
+
+class ProvisionMatrix:
+    """
+    Sparse provider x node matrix of provision values, with categorical kinds for "Major" and
+    "negligible" values
+    """
+
+    def __init__(self, provision: dict):
+        """
+        :param provision: Dict mapping provider (country name or org id) to a dict mapping node
+            ids to provision values, as built in Preprocess.write_provision
+        """
+        self.providers = list(provision)
+        self.node_index = {}
+        # Order in which nodes first appear with a value that is not negligible; kept so
+        # aggregations are returned in the same order as the dict-based implementation
+        self._non_minor_order = {}
+        entries = []
+        for row, provider in enumerate(self.providers):
+            for node, value in provision[provider].items():
+                col = self.node_index.setdefault(node, len(self.node_index))
+                kind = _get_kind(value)
+                if kind != MINOR:
+                    self._non_minor_order.setdefault(col, len(self._non_minor_order))
+                is_share = kind in (INT_SHARE, FLOAT_SHARE)
+                entries.append((col, row, kind, value if is_share else np.nan))
+        self.nodes = list(self.node_index)
+        # Sort entries by node, then provider
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        cols, rows, kinds, values = zip(*entries) if entries else ((), (), (), ())
+        # Node, provider, kind and numeric value (NaN if not a share) of each entry
+        self.cols = np.array(cols, dtype=np.int64)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.kind = np.array(kinds, dtype=np.int8)
+        self.values = np.array(values, dtype=float)
+        # Entries of node col are col_starts[col]:col_starts[col + 1]
+        self.col_starts = np.searchsorted(self.cols, np.arange(len(self.nodes) + 1))
+        self.major = self.kind == MAJOR
+        self.minor = self.kind == MINOR
+        # Providers that count towards concentration, i.e. are not negligible
+        self.counted = ~self.minor
+        self.num_counted = np.bincount(
+            self.cols[self.counted], minlength=len(self.nodes)
+        )
+        # Positions of each provider's entries are
+        # row_order[row_starts[row]:row_starts[row + 1]]
+        self.row_order = np.argsort(self.rows, kind="stable")
+        self.row_starts = np.searchsorted(
+            self.rows[self.row_order], np.arange(len(self.providers) + 1)
+        )
+        self.raw = provision
+
+    def get_node_entries(self, col: int) -> tuple:
+        """
+        Get the entries of a node
+
+        :param col: Node position, in self.nodes
+        :return: Tuple of lists of the providers' positions (in self.providers) and kinds of
+            value, in provider order
+        """
+        start, end = self.col_starts[col], self.col_starts[col + 1]
+        return self.rows[start:end].tolist(), self.kind[start:end].tolist()
+
+    def get_unprovided(self, removed_rows: list) -> np.ndarray:
+        """
+        Find the nodes that are left without a provider that is not negligible when some
+        providers are removed. Only the removed providers' entries are read
+
+        :param removed_rows: Positions of the removed providers, in self.providers
+        :return: Array of the positions of those nodes, in self.nodes
+        """
+        entries = np.concatenate(
+            [np.arange(0)]
+            + [
+                self.row_order[self.row_starts[row] : self.row_starts[row + 1]]
+                for row in set(removed_rows)
+            ]
+        )
+        entries = entries[self.counted[entries]]
+        cols, num_removed = np.unique(self.cols[entries], return_counts=True)
+        return cols[num_removed == self.num_counted[cols]]
+
+    def concentration(
+        self,
+        threshold: float = CONCENTRATION_THRESHOLD,
+        provider_mask=None,
+        values: np.ndarray = None,
+    ) -> dict:
+        """
+        Calculate how concentrated the provision for each node is. This is approximated as
+        the number of providers it takes to account for `threshold` percent of the market.
+        Negligible providers are ignored. If any provider is "Major", the node is considered
+        highly concentrated (1) if there are 2 or fewer providers, and not concentrated (4)
+        otherwise
+
+        :param threshold: Market share percentage to reach
+        :param provider_mask: Optional boolean array over providers; providers that are False
+            are left out of the calculation
+        :param values: Optional array of shares, aligned with self.values, to use in place of
+            the matrix's own, e.g. with some providers' shares capped
+        :return: A dictionary mapping node ID to number of providers
+        """
+        num_nodes = len(self.nodes)
+        counted = self.counted
+        if provider_mask is not None:
+            counted = counted & np.asarray(provider_mask, dtype=bool)[self.rows]
+        num_counted = np.bincount(self.cols[counted], minlength=num_nodes)
+        has_major = (
+            np.bincount(self.cols[counted & self.major], minlength=num_nodes) > 0
+        )
+        shares = self.values if values is None else np.asarray(values, dtype=float)
+        numeric = counted & ~np.isnan(shares)
+        cols = self.cols[numeric]
+        shares = shares[numeric]
+        # Sort shares in descending order within each node, and lay them out with a row per
+        # rank, so that the running total of each node's shares is summed in the same order
+        # as the dict-based implementation
+        order = np.lexsort((-shares, cols))
+        cols, shares = cols[order], shares[order]
+        ranks = np.arange(len(cols)) - np.searchsorted(cols, cols)
+        by_rank = np.zeros((ranks.max() + 1 if len(ranks) else 0, num_nodes))
+        by_rank[ranks, cols] = shares
+        # Running total of the shares ranked above each share
+        shares_before = np.zeros_like(by_rank)
+        shares_before[1:] = np.cumsum(by_rank, axis=0)[:-1]
+        # A provider is needed if the shares before it have not reached the threshold yet
+        needed = shares_before[ranks, cols] < threshold
+        num_needed = np.bincount(cols[needed], minlength=num_nodes)
+        num_needed = np.where(has_major, np.where(num_counted < 3, 1, 4), num_needed)
+        concentration = {}
+        for col in sorted(self._non_minor_order, key=self._non_minor_order.get):
+            if num_counted[col] > 0:
+                concentration[self.nodes[col]] = int(num_needed[col]) or None
+        return concentration
+
+    def node_to_country_provision(self) -> dict:
+        """
+        Generate dictionary mapping nodes to country provision shares, for use in node pdfs
+
+        :return: Dict mapping node ids to a dict with the "graph" (integer shares, in
+            descending order), "undefined" (other providers) and "all_names" (all providers)
+        """
+        node_to_country_provision = {}
+        for col, node in enumerate(self.nodes):
+            rows, kinds = self.get_node_entries(col)
+            graph = []
+            undefined = []
+            for row, kind in zip(rows, kinds):
+                provider = self.providers[row]
+                if kind == INT_SHARE:
+                    graph.append(
+                        {"country": provider, "value": self.raw[provider][node]}
+                    )
+                else:
+                    undefined.append(
+                        provider + (" (negligible)" if kind == MINOR else "")
+                    )
+            node_to_country_provision[node] = {
+                # Stable sort, so providers with equal shares stay in provider order
+                "graph": sorted(graph, key=lambda d: d["value"], reverse=True),
+                "undefined": sorted(undefined),
+                "all_names": sorted(self.providers[row] for row in rows),
+            }
+        return node_to_country_provision
+
+    def node_to_provider_desc_list(self, provider_to_meta: dict) -> dict:
+        """
+        Generate dictionary mapping nodes to sorted lists of provider descriptions, for use in
+        node pdfs
+
+        :param provider_to_meta: Dict mapping provider ids to metadata
+        :return: Dict mapping node ids to lists of provider names, with negligible providers
+            and headquarters countries noted
+        """
+        base_descs = []
+        hq_suffixes = []
+        for provider in self.providers:
+            meta = provider_to_meta[provider]
+            base_descs.append(meta["name"])
+            hq_suffixes.append(
+                " - " + meta.get("hq_country") if meta.get("hq_country") else ""
+            )
+        node_to_desc_list = {}
+        for col, node in enumerate(self.nodes):
+            rows, kinds = self.get_node_entries(col)
+            node_to_desc_list[node] = sorted(
+                (
+                    base_descs[row]
+                    + (" (negligible market share)" if kind == MINOR else "")
+                    + hq_suffixes[row]
+                ).strip()
+                for row, kind in zip(rows, kinds)
+            )
+        return node_to_desc_list
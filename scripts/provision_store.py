@@ -0,0 +1,88 @@
+"""
+Provision values indexed by provider, node and year, so that provision data from several years
+can be kept side by side rather than later rows overwriting earlier ones.
+"""
+
+import collections
+
+MAJOR_PROVISION = "Major"
+MINOR_PROVISION = "negligible"
+
+
+def _year_key(year):
+    # Rows without a year sort before any dated row
+    return (year is not None, year)
+
+
+class ProvisionStore:
+    """
+    Provision values keyed by (provider, node, year), with per-year indexes
+    """
+
+    def __init__(self):
+        # (provider, node, year) -> provision value
+        self.values = {}
+        # year -> (provider, node) -> provision value
+        self.by_year = collections.defaultdict(dict)
+        # (provider, node) -> most recent year with a value
+        self.latest_year = {}
+
+    def add(self, provider: str, node: str, year, value) -> None:
+        """
+        Add a provision value. A later value for the same provider, node and year replaces
+        the earlier one
+
+        :param provider: Provider (country name or org id)
+        :param node: Provided node id
+        :param year: Year the value applies to, or None if unknown
+        :param value: Provision value
+        :return: None
+        """
+        self.values[(provider, node, year)] = value
+        self.by_year[year][(provider, node)] = value
+        latest = self.latest_year.get((provider, node), year)
+        if _year_key(year) >= _year_key(latest):
+            latest = year
+        self.latest_year[(provider, node)] = latest
+
+    def get(self, provider: str, node: str, year=None, default=None):
+        """
+        Look up a provision value
+
+        :param provider: Provider (country name or org id)
+        :param node: Provided node id
+        :param year: Year to look up; if None, the most recent value is returned
+        :param default: Value to return if there is no provision value
+        :return: Provision value
+        """
+        if year is None:
+            if (provider, node) not in self.latest_year:
+                return default
+            year = self.latest_year[(provider, node)]
+        return self.values.get((provider, node, year), default)
+
+    def years(self) -> list:
+        """
+        :return: Sorted list of years with provision data, excluding undated rows
+        """
+        return sorted(year for year in self.by_year if year is not None)
+
+    def view(self, year=None) -> dict:
+        """
+        Get provision data in the provider -> node -> value layout used by the rest of the
+        pipeline
+
+        :param year: If specified, only values for this year are included. Otherwise the most
+            recent value for each provider and node is included
+        :return: Dict mapping providers to dicts mapping node ids to provision values
+        """
+        provision = {}
+        if year is None:
+            for (provider, node), latest in self.latest_year.items():
+                provision.setdefault(provider, {})[node] = self.values[
+                    (provider, node, latest)
+                ]
+        else:
+            for (provider, node), value in self.by_year.get(year, {}).items():
+                provision.setdefault(provider, {})[node] = value
+        return provision
@@ -0,0 +1,216 @@
+"""
+Answers "what if" questions about providers dropping out of the supply chain. Each scenario
+removes some providers entirely and/or caps some countries' shares. It reports the country
+concentration that results, the nodes left with no provider, and the processes downstream of
+those nodes.
+
+Scenarios are read from a json list, e.g.
+
+    [
+        {"name": "No Japan", "remove": ["Japan"]},
+        {"name": "No ASML, Taiwan capped at 50%", "remove": ["ASML"], "cap": {"Taiwan": 50}}
+    ]
+
+Countries are named as in the webapp (after normalization), and organizations by provider id or
+name. The provision matrices and the graph indexes are built once and shared by every scenario,
+so each scenario is a few array operations.
+"""
+
+import numpy as np
+
+try:
+    from scripts.provision_matrix import ProvisionMatrix
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from provision_matrix import ProvisionMatrix
+
+SCENARIO_FORMAT_VERSION = 1
+INPUT_LISTS = ["tools", "materials"]
+PROCESS_TYPES = {"process", "ultimate_output"}
+
+
+class ScenarioEngine:
+    """
+    Recomputes provision for batches of provider removal and share cap scenarios
+    """
+
+    def __init__(
+        self,
+        country_provision: dict,
+        org_provision: dict,
+        provider_to_meta: dict,
+        graph: dict,
+        node_to_meta: dict,
+        variant_ancestors: dict,
+    ):
+        """
+        :param country_provision: Dict mapping countries to dicts mapping node ids to provision
+            values
+        :param org_provision: Dict mapping org provider ids to dicts mapping node ids to
+            provision values
+        :param provider_to_meta: Dict mapping provider ids to metadata, used to look up orgs by
+            name
+        :param graph: Dict mapping processes to lists of the nodes they go into
+        :param node_to_meta: Dict mapping node ids to metadata, including the lists of tools and
+            materials that go into each node
+        :param variant_ancestors: Dict mapping variants to the nodes they are variants of, from
+            build_variant_index
+        """
+        self.country_matrix = ProvisionMatrix(country_provision)
+        self.org_matrix = ProvisionMatrix(org_provision)
+        self.baseline = self.country_matrix.concentration()
+        self.org_ids = {org: org for org in org_provision}
+        for provider_id, meta in provider_to_meta.items():
+            if meta["type"] == "organization":
+                self.org_ids.setdefault(provider_id, provider_id)
+                self.org_ids.setdefault(meta["name"], provider_id)
+        self.country_rows = {
+            country: row for row, country in enumerate(self.country_matrix.providers)
+        }
+        self.org_rows = {org: row for row, org in enumerate(self.org_matrix.providers)}
+        self.graph = graph
+        self.variant_ancestors = variant_ancestors
+        self.node_order = {node: idx for idx, node in enumerate(node_to_meta)}
+        # Processes each node goes directly into
+        self.consumers = {}
+        for node, meta in node_to_meta.items():
+            if meta.get("type") in PROCESS_TYPES:
+                self.consumers.setdefault(node, set()).add(node)
+            for input_list in INPUT_LISTS:
+                for input_node in meta.get(input_list, []):
+                    self.consumers.setdefault(input_node, set()).add(node)
+        self.downstream = {}
+
+    def _get_unprovided(self, removed_countries: list, removed_orgs: list) -> set:
+        """
+        Get the nodes that had a provider that is not negligible, and have none left
+
+        :param removed_countries: Rows of removed countries in the country matrix
+        :param removed_orgs: Rows of removed orgs in the org matrix
+        :return: Set of node ids
+        """
+        lost = [
+            (matrix, set(matrix.get_unprovided(removed)))
+            for matrix, removed in [
+                (self.country_matrix, removed_countries),
+                (self.org_matrix, removed_orgs),
+            ]
+        ]
+        unprovided = set()
+        for (matrix, cols), (other, other_cols) in [lost, lost[::-1]]:
+            for col in cols:
+                node = matrix.nodes[col]
+                # The node may still be provided in the other matrix
+                other_col = other.node_index.get(node)
+                if (
+                    other_col is None
+                    or other_col in other_cols
+                    or other.num_counted[other_col] == 0
+                ):
+                    unprovided.add(node)
+        return unprovided
+
+    def _get_downstream(self, process: str) -> set:
+        """
+        Get a process and every node it leads to
+
+        :param process: Process node id
+        :return: Set of node ids
+        """
+        if process not in self.downstream:
+            downstream = {process}
+            for child in self.graph.get(process, []):
+                downstream |= self._get_downstream(child)
+            self.downstream[process] = downstream
+        return self.downstream[process]
+
+    def _resolve(self, provider: str) -> tuple:
+        """
+        Find a provider's row in the provision matrices
+
+        :param provider: Country name, or org provider id or name
+        :return: Tuple of "country" or "org", and the provider's row in that matrix, or None
+            if it is a known org that provides nothing
+        :raises ValueError: if the provider is unknown
+        """
+        if provider in self.country_rows:
+            return "country", self.country_rows[provider]
+        if provider in self.org_ids:
+            return "org", self.org_rows.get(self.org_ids[provider])
+        raise ValueError(f"Unknown provider in scenario: {provider}")
+
+    def run(self, scenario: dict) -> dict:
+        """
+        Compute the effect of a scenario
+
+        :param scenario: Dict with an optional "remove" list of providers to remove, and an
+            optional "cap" dict mapping countries to the highest share they may provide. Caps
+            only apply to numeric shares
+        :return: Dict with:
+            * "concentration": dict mapping nodes whose country concentration changed to their
+              new concentration, or None if no country provides them any more
+            * "unprovided": nodes that had providers, but have none that are not negligible left
+            * "affectedProcesses": processes and outputs that any unprovided node, or any node
+              an unprovided node is a variant of, leads to
+        """
+        removed = {"country": [], "org": []}
+        for provider in scenario.get("remove", []):
+            kind, row = self._resolve(provider)
+            if row is not None:
+                removed[kind].append(row)
+        country_mask = np.ones(len(self.country_rows), dtype=bool)
+        country_mask[removed["country"]] = False
+        values = None
+        if scenario.get("cap"):
+            caps = np.full(len(self.country_rows), np.inf)
+            for provider, cap in scenario["cap"].items():
+                kind, row = self._resolve(provider)
+                if kind != "country":
+                    raise ValueError(f"Only country shares can be capped: {provider}")
+                caps[row] = cap
+            values = np.minimum(
+                self.country_matrix.values, caps[self.country_matrix.rows]
+            )
+        concentration = self.country_matrix.concentration(
+            provider_mask=country_mask, values=values
+        )
+        changed = {
+            node: concentration.get(node)
+            for node in list(self.baseline) + list(concentration)
+            if concentration.get(node) != self.baseline.get(node)
+        }
+        unprovided = self._get_unprovided(removed["country"], removed["org"])
+        affected = set()
+        for node in unprovided:
+            for disrupted in [node] + self.variant_ancestors.get(node, []):
+                for process in self.consumers.get(disrupted, []):
+                    affected |= self._get_downstream(process)
+        return {
+            "concentration": changed,
+            "unprovided": self._sort(unprovided),
+            "affectedProcesses": self._sort(affected),
+        }
+
+    def _sort(self, nodes: set) -> list:
+        return sorted(nodes, key=lambda node: (self.node_order.get(node, -1), node))
+
+    def run_all(self, scenarios: list) -> dict:
+        """
+        Compute the effects of a batch of scenarios
+
+        :param scenarios: List of scenario dicts, as in run, each with a unique "name"
+        :return: Dict with the "baseline" concentration, and the results of each scenario by
+            name
+        :raises ValueError: if scenario names are missing or repeated, or a scenario refers to
+            an unknown provider
+        """
+        results = {}
+        for scenario in scenarios:
+            name = scenario.get("name")
+            if not name or name in results:
+                raise ValueError(f"Scenarios need unique names, found {name!r}")
+            results[name] = self.run(scenario)
+        return {
+            "version": SCENARIO_FORMAT_VERSION,
+            "baseline": self.baseline,
+            "scenarios": results,
+        }
@@ -0,0 +1,205 @@
+"""
+Builds a full-text search index over node, stage and provider names and descriptions, so that the
+webapp can search them with a few lookups rather than scanning all of the metadata.
+
+The index is an inverted index from terms to the documents (nodes, stages and providers) that
+contain them, split into shards by the first character of each term. The output directory
+contains an index.json, which lists the documents and shards, and one file per shard under
+shards/. To search for a word, or the start of a word, only the shard for its first character
+needs to be loaded.
+
+Encoding conventions:
+* A document is referred to by its position in the index's "docs" list, each entry of which is
+  [id, type, name]
+* Each shard has a sorted list of "terms", so the terms starting with a prefix are a contiguous
+  range that can be found by binary search, and a list of "postings" aligned with it
+* The postings of a term are a flat list of alternating document positions and scores, highest
+  score first. A document's score for a term is the sum, over the fields it appears in, of the
+  field's weight times the number of times it appears there (up to MAX_TERM_FREQUENCY)
+"""
+
+import bisect
+import collections
+import json
+import os
+import re
+import unicodedata
+
+SEARCH_FORMAT_VERSION = 1
+SEARCH_DIR = "search"
+FIELD_WEIGHTS = {"name": 8, "alias": 6, "country": 3, "description": 1}
+# Long descriptions repeat their subject many times; cap how much that can count for
+MAX_TERM_FREQUENCY = 3
+OTHER_SHARD = "_"
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it",
+    "its", "of", "on", "or", "that", "the", "their", "these", "this", "to", "was", "which",
+    "with",
+}  # fmt: skip
+
+
+def tokenize(text: str) -> list:
+    """
+    Split text into search terms. Markdown link targets, urls and html tags are dropped, accents
+    are removed and text is lowercased, and stopwords and single characters are skipped
+
+    :param text: Text to split
+    :return: List of terms, in the order they appear
+    """
+    text = re.sub(r"\]\([^)]*\)", "]", text)
+    text = re.sub(r"https?://\S+|<[^>]*>", " ", text)
+    text = "".join(
+        c
+        for c in unicodedata.normalize("NFKD", text.lower())
+        if not unicodedata.combining(c)
+    )
+    return [
+        term
+        for term in re.findall(r"[^\W_]+", text)
+        if len(term) > 1 and term not in STOPWORDS
+    ]
+
+
+def get_shard(term: str) -> str:
+    """
+    Get the shard a term (or a prefix of one) is stored in
+
+    :param term: Term or prefix
+    :return: Shard key, the term's first character if it is a letter or digit that can be used
+        in a file name, or OTHER_SHARD
+    """
+    first = term[:1]
+    return first if first.isascii() and first.isalnum() else OTHER_SHARD
+
+
+class SearchIndexBuilder:
+    """
+    Collects documents and the terms in each of their fields
+    """
+
+    def __init__(self):
+        self.docs = []
+        self.doc_positions = {}
+        # Number of times each term appears in each field of each document
+        self.term_counts = []
+
+    def add(self, doc_id: str, doc_type: str, name: str, fields: dict) -> None:
+        """
+        Add a document to the index. A document that was already added (for instance, a
+        provider listed once per alias) has the terms of its fields added to it, counting terms
+        that are repeated between the two only once
+
+        :param doc_id: Node or provider id
+        :param doc_type: Node type, "stage", or provider type
+        :param name: Name to show in search results
+        :param fields: Dict mapping keys of FIELD_WEIGHTS to the text of that field
+        :return: None
+        """
+        key = (doc_type, doc_id)
+        if key not in self.doc_positions:
+            self.doc_positions[key] = len(self.docs)
+            self.docs.append([doc_id, doc_type, name])
+            self.term_counts.append({})
+        doc_term_counts = self.term_counts[self.doc_positions[key]]
+        for field, text in fields.items():
+            if not text:
+                continue
+            field_term_counts = doc_term_counts.setdefault(field, collections.Counter())
+            field_term_counts |= collections.Counter(tokenize(text))
+
+    def build(self) -> tuple:
+        """
+        Encode the documents and postings as an index and shards
+
+        :return: Tuple of the index dict and a dict mapping shard keys to shard dicts
+        """
+        postings = collections.defaultdict(collections.Counter)
+        for position, doc_term_counts in enumerate(self.term_counts):
+            for field, field_term_counts in doc_term_counts.items():
+                for term, count in field_term_counts.items():
+                    postings[term][position] += FIELD_WEIGHTS[field] * min(
+                        count, MAX_TERM_FREQUENCY
+                    )
+        shards = {}
+        for term in sorted(postings):
+            shard = shards.setdefault(get_shard(term), {"terms": [], "postings": []})
+            shard["terms"].append(term)
+            shard["postings"].append(
+                [
+                    value
+                    for position, score in sorted(
+                        postings[term].items(), key=lambda p: (-p[1], p[0])
+                    )
+                    for value in (position, score)
+                ]
+            )
+        index = {
+            "version": SEARCH_FORMAT_VERSION,
+            "fieldWeights": FIELD_WEIGHTS,
+            "docs": self.docs,
+            "shards": sorted(shards),
+        }
+        return index, shards
+
+
+def write_search_index(
+    index: dict, shards: dict, output_dir: str, write_fn=None
+) -> None:
+    """
+    Write an index and its shards as compact json
+
+    :param index: Index dict, from SearchIndexBuilder.build
+    :param shards: Dict mapping shard keys to shard dicts, from SearchIndexBuilder.build
+    :param output_dir: Directory the search directory should be created in
+    :param write_fn: Function taking a path and content that writes a file; defaults to
+        overwriting the file
+    :return: None
+    """
+
+    def overwrite(output_fi, content):
+        with open(output_fi, mode="w", encoding="utf-8") as f:
+            f.write(content)
+
+    write_fn = write_fn or overwrite
+    search_dir = os.path.join(output_dir, SEARCH_DIR)
+    os.makedirs(os.path.join(search_dir, "shards"), exist_ok=True)
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    write_fn(os.path.join(search_dir, "index.json"), dumps(index))
+    for key, shard in shards.items():
+        write_fn(os.path.join(search_dir, "shards", f"{key}.json"), dumps(shard))
+
+
+def search(index: dict, shards: dict, query: str, limit: int = 10) -> list:
+    """
+    Find the documents matching a query, as the webapp would. Each word of the query matches
+    the terms it is a prefix of, and documents must match every word
+
+    :param index: Index dict, from SearchIndexBuilder.build
+    :param shards: Dict mapping shard keys to shard dicts
+    :param query: Text to search for
+    :param limit: Maximum number of documents to return
+    :return: List of [id, type, name] of the matching documents, best match first
+    """
+    scores = None
+    for word in dict.fromkeys(tokenize(query)):
+        shard = shards.get(get_shard(word), {"terms": [], "postings": []})
+        word_scores = collections.Counter()
+        start = bisect.bisect_left(shard["terms"], word)
+        for term, postings in zip(shard["terms"][start:], shard["postings"][start:]):
+            if not term.startswith(word):
+                break
+            for position, score in zip(postings[::2], postings[1::2]):
+                # Exact matches count for more than matches of a longer word
+                score = score if term == word else score / 2
+                word_scores[position] = max(word_scores[position], score)
+        if scores is None:
+            scores = word_scores
+        else:
+            scores = collections.Counter(
+                {p: scores[p] + word_scores[p] for p in scores if p in word_scores}
+            )
+    ranked = sorted((scores or {}).items(), key=lambda p: (-p[1], p[0]))
+    return [index["docs"][position] for position, _ in ranked[:limit]]
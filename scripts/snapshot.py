@@ -0,0 +1,89 @@
+"""
+Saves the in-memory model that preprocessing builds from the source csvs (node and provider
+metadata, the graph, variants and provision data), so that the slower output stages (pdfs,
+BigQuery, chunks and the search index) can be rerun on their own without rebuilding it.
+
+A snapshot is a pickle of the model together with the format version and the hashes of the
+input files it was built from, and is only loaded if both still match. As with any pickle,
+only load snapshots written by this script.
+"""
+
+import os
+import pickle
+
+SNAPSHOT_VERSION = 2
+# Preprocess attributes making up the model, as set by mk_metadata, mk_images, write_graphs,
+# mk_provider_to_meta and write_provision
+SNAPSHOT_ATTRIBUTES = [
+    "node_to_meta",
+    "provider_to_meta",
+    "variants",
+    "variant_index",
+    "graph",
+    "graph_reverse",
+    "map_layout",
+    "country_provision_store",
+    "org_provision_store",
+    "country_provision",
+    "org_provision",
+    "country_flags",
+    "country_provision_concentration",
+    "process_nodes_with_org_provision",
+    "highlight_index",
+    "upstream_chokepoints",
+]
+
+
+def save_snapshot(snapshot_fi: str, state: dict, input_hashes: dict) -> None:
+    """
+    Write a snapshot
+
+    :param snapshot_fi: Path to snapshot file
+    :param state: Dict mapping each of SNAPSHOT_ATTRIBUTES to its value
+    :param input_hashes: Dict mapping paths of the input files the state was built from to
+        hashes of their content
+    :return: None
+    """
+    if os.path.dirname(snapshot_fi):
+        os.makedirs(os.path.dirname(snapshot_fi), exist_ok=True)
+    # Write to a temporary file first, so that an interrupted save can't leave a partial
+    # snapshot behind
+    tmp_fi = snapshot_fi + ".tmp"
+    with open(tmp_fi, mode="wb") as f:
+        pickle.dump(
+            {"version": SNAPSHOT_VERSION, "inputs": input_hashes, "state": state},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp_fi, snapshot_fi)
+
+
+def load_snapshot(snapshot_fi: str, input_hashes: dict) -> dict:
+    """
+    Read a snapshot
+
+    :param snapshot_fi: Path to snapshot file
+    :param input_hashes: Dict mapping paths of the current input files to hashes of their
+        content, which must match the ones the snapshot was built from
+    :return: Dict mapping each of SNAPSHOT_ATTRIBUTES to its value
+    :raises ValueError: if there is no snapshot, or it is out of date
+    """
+    if not os.path.exists(snapshot_fi):
+        raise ValueError(f"No snapshot at {snapshot_fi}")
+    with open(snapshot_fi, mode="rb") as f:
+        snapshot = pickle.load(f)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Snapshot {snapshot_fi} has version {snapshot.get('version')}, expected "
+            f"{SNAPSHOT_VERSION}"
+        )
+    changed = [
+        fi
+        for fi in sorted(set(input_hashes) | set(snapshot["inputs"]))
+        if input_hashes.get(fi) != snapshot["inputs"].get(fi)
+    ]
+    if changed:
+        raise ValueError(
+            f"Snapshot {snapshot_fi} is out of date; changed inputs: {', '.join(changed)}"
+        )
+    return snapshot["state"]
@@ -0,0 +1,173 @@
+"""
+Loads the source csvs once per run into column-oriented tables that every preprocessing stage
+can share, rather than each stage re-opening and re-parsing the files it needs.
+"""
+
+import csv
+import os
+
+
+class CsvFormatError(ValueError):
+    """
+    Raised when a csv can't be read as a table of uniquely named columns
+    """
+
+    def __init__(self, csv_fi: str, row: int, message: str):
+        """
+        :param csv_fi: Path to csv file
+        :param row: Row number, counting the header as row 1
+        :param message: Description of the problem
+        """
+        super().__init__(f"{csv_fi} row {row}: {message}")
+        self.csv_fi = csv_fi
+        self.row = row
+        self.message = message
+
+
+class Table:
+    """
+    Column-oriented, in-memory copy of a csv file
+    """
+
+    def __init__(self, fieldnames: list, columns: dict):
+        """
+        :param fieldnames: Column names, in file order
+        :param columns: Dict mapping each column name to a list of that column's values
+        """
+        self.fieldnames = fieldnames
+        self.columns = columns
+
+    @classmethod
+    def read(cls, csv_fi: str, types: dict = None) -> "Table":
+        """
+        Parse a csv file into a table
+
+        :param csv_fi: Path to csv file
+        :param types: Optional dict mapping column names to functions that convert the raw
+            string values of that column (empty values are left as empty strings)
+        :return: Table
+        :raises CsvFormatError: if the header repeats a column name, or a row has (non-empty)
+            values beyond the last column
+        """
+        types = types or {}
+        with open(csv_fi, encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            fieldnames = next(reader, [])
+            duplicates = sorted(
+                {name for name in fieldnames if fieldnames.count(name) > 1}
+            )
+            if duplicates:
+                raise CsvFormatError(
+                    csv_fi, 1, f"duplicate columns: {', '.join(duplicates)}"
+                )
+            columns = {name: [] for name in fieldnames}
+            column_lists = [columns[name] for name in fieldnames]
+            for row, record in enumerate(reader, start=2):
+                if not record:
+                    continue
+                if any(record[len(fieldnames) :]):
+                    raise CsvFormatError(
+                        csv_fi,
+                        row,
+                        f"{len(record)} values, but the header only has "
+                        f"{len(fieldnames)} columns",
+                    )
+                # Unlike csv.DictReader, which fills short rows with None, fill them with empty
+                # strings, so that missing values read the same as empty cells
+                record += [""] * (len(fieldnames) - len(record))
+                for values, value in zip(column_lists, record):
+                    values.append(value)
+        for name, convert in types.items():
+            if name in columns:
+                columns[name] = [convert(v) if v != "" else v for v in columns[name]]
+        return cls(fieldnames, columns)
+
+    def __len__(self) -> int:
+        return len(self.columns[self.fieldnames[0]]) if self.fieldnames else 0
+
+    def column(self, name: str) -> list:
+        """
+        Get all values of a column
+
+        :param name: Column name
+        :return: List of values
+        """
+        return self.columns[name]
+
+    def rows(self) -> iter:
+        """
+        Iterate over the table's rows. Each row is a new dict, so callers may modify it without
+        affecting the table
+
+        :return: Iterator of dicts mapping column names to values, like csv.DictReader
+        """
+        for values in zip(*(self.columns[name] for name in self.fieldnames)):
+            yield dict(zip(self.fieldnames, values))
+
+
+def stream_rows(csv_fi: str) -> iter:
+    """
+    Iterate over the rows of a csv file without holding the file in memory
+
+    :param csv_fi: Path to csv file
+    :return: Iterator of dicts mapping column names to values
+    """
+    with open(csv_fi, encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+class TableStore:
+    """
+    Loads each csv file at most once, and hands the parsed table to every stage that needs it
+    """
+
+    def __init__(self, streaming: bool = False):
+        """
+        :param streaming: If true, files are re-read row by row each time they are needed
+            instead of being held in memory
+        """
+        self.streaming = streaming
+        self.tables = {}
+        # Number of rows handed out by rows(), across all files
+        self.rows_read = 0
+
+    def get(self, csv_fi: str, types: dict = None) -> Table:
+        """
+        Get the table for a csv file, reading it if it has not been read yet
+
+        :param csv_fi: Path to csv file
+        :param types: Column types to read the file with, as in Table.read. Only used the
+            first time the file is read
+        :return: Table
+        """
+        key = os.path.abspath(csv_fi)
+        if key not in self.tables:
+            self.tables[key] = Table.read(csv_fi, types)
+        return self.tables[key]
+
+    def rows(self, csv_fi: str) -> iter:
+        """
+        Iterate over the rows of a csv file
+
+        :param csv_fi: Path to csv file
+        :return: Iterator of dicts mapping column names to values
+        """
+        rows = stream_rows(csv_fi) if self.streaming else self.get(csv_fi).rows()
+        return self._count_rows(rows)
+
+    def _count_rows(self, rows: iter) -> iter:
+        for row in rows:
+            self.rows_read += 1
+            yield row
+
+    def invalidate(self, csv_fi: str = None) -> None:
+        """
+        Drop cached tables so they are re-read on next use
+
+        :param csv_fi: Path to the csv file to drop; if None, all tables are dropped
+        :return: None
+        """
+        if csv_fi is None:
+            self.tables.clear()
+        else:
+            self.tables.pop(os.path.abspath(csv_fi), None)
@@ -0,0 +1,204 @@
+"""
+Records how long each stage of a preprocessing run takes and what it did, so that slow stages
+and slowdowns between data releases can be found from the trace file a run leaves behind.
+"""
+
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Number of functions, by cumulative time, to include from each stage's profile
+PROFILE_TOP_FUNCTIONS = 20
+
+
+def get_peak_rss() -> int:
+    """
+    Get the peak resident set size of this process and its finished child processes
+
+    :return: Peak RSS in bytes, or None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_cpu_seconds() -> float:
+    """
+    Get the CPU time used by this process and its finished child processes
+
+    :return: CPU time in seconds
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageTracer:
+    """
+    Times the stages of a run, and records the change in a set of counters over each stage
+    """
+
+    def __init__(self, counters: dict = None, profile_dir: str = None):
+        """
+        :param counters: Dict mapping counter names (e.g. "rows") to functions returning the
+            counter's current value
+        :param profile_dir: If set, each stage is run under cProfile and its profile is written
+            to this directory
+        """
+        self.counters = counters or {}
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.current = None
+        self.start = time.perf_counter()
+
+    def __getstate__(self) -> dict:
+        # Counters are usually lambdas, which cannot be pickled. A tracer that is sent to a
+        # worker process only needs to print warnings
+        return {**self.__dict__, "counters": {}, "current": None}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Trace a stage of the run
+
+        :param name: Stage name
+        :return: Context manager yielding the stage's record, a dict which is filled in when the
+            stage finishes
+        """
+        record = {"name": name, "warnings": collections.Counter()}
+        counts = {counter: get_value() for counter, get_value in self.counters.items()}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        previous, self.current = self.current, record
+        record["start_seconds"] = time.perf_counter() - self.start
+        cpu_start = get_cpu_seconds()
+        peak_rss_start = get_peak_rss()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = repr(e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_seconds"] = (
+                time.perf_counter() - self.start - record["start_seconds"]
+            )
+            record["cpu_seconds"] = get_cpu_seconds() - cpu_start
+            # The peak RSS is a high-water mark for the whole process, so a stage only shows up
+            # in it if it raised the mark. Record how much it did, along with the mark itself
+            peak_rss = get_peak_rss()
+            record["process_peak_rss_bytes"] = peak_rss
+            record["peak_rss_increase_bytes"] = (
+                peak_rss - peak_rss_start if peak_rss is not None else None
+            )
+            for counter, get_value in self.counters.items():
+                record[counter] = get_value() - counts[counter]
+            record["warnings"] = dict(record["warnings"])
+            if profiler is not None:
+                record["profile"] = self._save_profile(name, profiler)
+            self.current = previous
+            self.stages.append(record)
+
+    def _save_profile(self, name: str, profiler: cProfile.Profile) -> dict:
+        """
+        Write a stage's profile to the profile directory
+
+        :param name: Stage name
+        :param profiler: Profiler the stage ran under
+        :return: Dict with the path of the profile "file", which can be loaded with pstats, and
+            the "top" functions by cumulative time
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_fi = os.path.join(self.profile_dir, f"{name}.prof")
+        profiler.dump_stats(profile_fi)
+        stats = pstats.Stats(profiler).stats
+        top = sorted(stats.items(), key=lambda item: -item[1][3])[
+            :PROFILE_TOP_FUNCTIONS
+        ]
+        return {
+            "file": profile_fi,
+            "top": [
+                {
+                    "function": f"{fi}:{line}({function})",
+                    "calls": calls,
+                    "cumulative_seconds": cumulative,
+                }
+                for (fi, line, function), (_, calls, _, cumulative, _) in top
+            ],
+        }
+
+    def warn(self, kind: str, message: str) -> None:
+        """
+        Print a warning, and count it against the current stage
+
+        :param kind: Kind of warning, which warnings are counted by
+        :param message: Warning to print
+        :return: None
+        """
+        print(message)
+        if self.current is not None:
+            self.current["warnings"][kind] += 1
+
+    def save(self, trace_fi: str) -> None:
+        """
+        Write the trace to a json file
+
+        :param trace_fi: Path to trace file
+        :return: None
+        """
+        if os.path.dirname(trace_fi):
+            os.makedirs(os.path.dirname(trace_fi), exist_ok=True)
+        with open(trace_fi, mode="w") as f:
+            json.dump(
+                {
+                    "wall_seconds": time.perf_counter() - self.start,
+                    "peak_rss_bytes": get_peak_rss(),
+                    "stages": self.stages,
+                },
+                f,
+                indent=2,
+            )
+
+    def report(self) -> str:
+        """
+        Summarize the trace
+
+        :return: Human-readable table of the stages, slowest first
+        """
+        lines = ["stage times:"]
+        for record in sorted(self.stages, key=lambda r: -r["wall_seconds"]):
+            details = [f"{record['cpu_seconds']:.2f}s cpu"]
+            if record["peak_rss_increase_bytes"]:
+                details.append(
+                    f"peak rss +{record['peak_rss_increase_bytes'] / 2**20:.1f}MB"
+                )
+            details += [
+                f"{record[counter]} {counter}"
+                for counter in self.counters
+                if record[counter]
+            ]
+            details += [
+                f"{count} {kind} warnings"
+                for kind, count in sorted(record["warnings"].items())
+            ]
+            lines.append(
+                f"  {record['name']}: {record['wall_seconds']:.2f}s "
+                f"({', '.join(details)})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,390 @@
+"""
+Checks the source csvs for the problems that would otherwise make preprocessing fail part way
+through, or quietly produce bad output: missing columns, duplicate and dangling ids, unexpected
+types, invalid shares and years, and cycles. Every problem is collected, with the file and row it
+was found in, so that a bad export can be fixed in one go.
+
+Row numbers count the header as row 1, so they match the row numbers of the spreadsheets the
+csvs are exported from.
+"""
+
+import collections
+import graphlib
+
+try:
+    from scripts.tables import CsvFormatError
+    from scripts.variant_index import build_variant_index
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from tables import CsvFormatError
+    from variant_index import build_variant_index
+
+ERROR = "error"
+WARNING = "warning"
+PROVIDER_TYPES = {"country", "organization"}
+# Country shares of a node are rounded, so may add up to a little over 100
+SHARE_SUM_TOLERANCE = 5
+REQUIRED_COLUMNS = {
+    "nodes": ["input_id", "input_name", "type", "stage_id"],
+    "stages": ["stage_id", "stage_name"],
+    "sequence": ["input_id", "goes_into_id", "is_type_of_id"],
+    "providers": ["provider_id", "provider_name", "provider_type"],
+    "provision": ["provider_id", "provided_id", "share_provided"],
+}
+
+
+class Validator:
+    """
+    Validates the source csvs against each other
+    """
+
+    def __init__(
+        self,
+        tables,
+        node_types: set,
+        base_node_types: set,
+        country_provision_types: list,
+    ):
+        """
+        :param tables: TableStore to read the csvs from, so they are only parsed once per run
+        :param node_types: Valid node types
+        :param base_node_types: Node types that process nodes may go into
+        :param country_provision_types: Node types that countries may provide
+        """
+        self.tables = tables
+        self.node_types = node_types
+        self.base_node_types = base_node_types
+        self.country_provision_types = country_provision_types
+        self.issues = []
+        self.node_to_type = {}
+        self.provider_to_type = {}
+
+    def add_issue(self, severity: str, fi: str, row: int, message: str) -> None:
+        """
+        Record a problem
+
+        :param severity: ERROR or WARNING
+        :param fi: Path to the csv the problem was found in
+        :param row: Row number, counting the header as row 1, or None if the problem is not
+            in a single row
+        :param message: Description of the problem
+        :return: None
+        """
+        self.issues.append(
+            {"severity": severity, "file": fi, "row": row, "message": message}
+        )
+
+    def _get_columns(self, kind: str, fi: str) -> dict:
+        """
+        Get the columns of a csv, checking that it has the columns preprocessing needs
+
+        :param kind: Kind of csv, a key of REQUIRED_COLUMNS
+        :param fi: Path to csv
+        :return: Dict mapping column names to lists of values, or None if columns are missing
+            or the csv can't be read
+        """
+        try:
+            table = self.tables.get(fi)
+        except CsvFormatError as e:
+            self.add_issue(ERROR, fi, e.row, e.message)
+            return None
+        missing = [
+            column for column in REQUIRED_COLUMNS[kind] if column not in table.columns
+        ]
+        if missing:
+            self.add_issue(ERROR, fi, 1, f"missing columns: {', '.join(missing)}")
+            return None
+        return table.columns
+
+    def _check_ids(self, fi: str, ids: list, seen: dict, id_type: str) -> None:
+        """
+        Check that ids are present and unique
+
+        :param fi: Path to the csv the ids are from
+        :param ids: Ids, in row order
+        :param seen: Dict mapping ids seen so far to where they were first seen, which is
+            updated with these ids
+        :param id_type: Kind of id, for messages
+        :return: None
+        """
+        for idx, id_ in enumerate(ids):
+            row = idx + 2
+            if not id_:
+                self.add_issue(ERROR, fi, row, f"missing {id_type}")
+            elif id_ in seen:
+                self.add_issue(
+                    ERROR,
+                    fi,
+                    row,
+                    f"duplicate {id_type} {id_} (first seen in {seen[id_][0]} row "
+                    f"{seen[id_][1]})",
+                )
+            else:
+                seen[id_] = (fi, row)
+
+    def check_nodes(self, nodes_fi: str, stages_fi: str) -> None:
+        """
+        Check the inputs and stages csvs, and index their node types for the other checks
+
+        :param nodes_fi: Path to inputs csv
+        :param stages_fi: Path to stages csv
+        :return: None
+        """
+        seen = {}
+        stages = self._get_columns("stages", stages_fi)
+        if stages is not None:
+            self._check_ids(stages_fi, stages["stage_id"], seen, "stage_id")
+            for stage_id in stages["stage_id"]:
+                self.node_to_type[stage_id] = "stage"
+        nodes = self._get_columns("nodes", nodes_fi)
+        if nodes is None:
+            return
+        self._check_ids(nodes_fi, nodes["input_id"], seen, "input_id")
+        num_final_outputs = 0
+        for idx, (node, node_type, stage_id) in enumerate(
+            zip(nodes["input_id"], nodes["type"], nodes["stage_id"])
+        ):
+            row = idx + 2
+            self.node_to_type.setdefault(node, node_type)
+            if node_type not in self.node_types:
+                self.add_issue(ERROR, nodes_fi, row, f"unexpected type {node_type!r}")
+            if node_type == "ultimate_output":
+                num_final_outputs += 1
+            if node_type == "process" and self.node_to_type.get(stage_id) != "stage":
+                self.add_issue(
+                    ERROR,
+                    nodes_fi,
+                    row,
+                    f"process {node} has unknown stage {stage_id!r}",
+                )
+        if num_final_outputs != 1:
+            self.add_issue(
+                ERROR,
+                nodes_fi,
+                None,
+                f"expected one ultimate_output node, found {num_final_outputs}",
+            )
+
+    def check_sequence(self, sequence_fi: str) -> None:
+        """
+        Check that the sequence csv refers to known nodes, that edges connect the right types
+        of nodes, and that neither the process graph nor the variant hierarchy has cycles
+
+        :param sequence_fi: Path to sequence csv
+        :return: None
+        """
+        sequence = self._get_columns("sequence", sequence_fi)
+        if sequence is None:
+            return
+        graph = collections.defaultdict(list)
+        variants = collections.defaultdict(list)
+        for idx, (parent, child, variant_of) in enumerate(
+            zip(
+                sequence["input_id"],
+                sequence["goes_into_id"],
+                sequence["is_type_of_id"],
+            )
+        ):
+            row = idx + 2
+            if not parent:
+                # Blank rows are skipped by preprocessing
+                continue
+            for node, column in [
+                (parent, "input_id"),
+                (child, "goes_into_id"),
+                (variant_of, "is_type_of_id"),
+            ]:
+                if node and node not in self.node_to_type:
+                    self.add_issue(ERROR, sequence_fi, row, f"unknown {column} {node}")
+            if variant_of:
+                variants[variant_of].append(parent)
+                continue
+            if not child:
+                self.add_issue(
+                    ERROR,
+                    sequence_fi,
+                    row,
+                    f"{parent} has no goes_into_id or is_type_of_id",
+                )
+                continue
+            if self.node_to_type.get(parent) == "process":
+                child_type = self.node_to_type.get(child)
+                if child_type is not None and child_type not in self.base_node_types:
+                    self.add_issue(
+                        ERROR,
+                        sequence_fi,
+                        row,
+                        f"process {parent} goes into {child}, which is a {child_type}",
+                    )
+                graph[child].append(parent)
+        try:
+            graphlib.TopologicalSorter(graph).prepare()
+        except graphlib.CycleError as e:
+            self.add_issue(
+                ERROR,
+                sequence_fi,
+                None,
+                f"cycle in process graph: {' -> '.join(e.args[1])}",
+            )
+        try:
+            build_variant_index(variants)
+        except ValueError as e:
+            self.add_issue(ERROR, sequence_fi, None, str(e))
+
+    def check_providers(self, providers_fi: str) -> None:
+        """
+        Check the providers csv, and index provider types for the provision checks
+
+        :param providers_fi: Path to providers csv
+        :return: None
+        """
+        providers = self._get_columns("providers", providers_fi)
+        if providers is None:
+            return
+        countries = providers.get("country", [""] * len(providers["provider_id"]))
+        # Providers with several aliases are listed once per alias, so ids may repeat as long as
+        # the rows agree
+        first_rows = {}
+        for idx, (provider, name, provider_type, country) in enumerate(
+            zip(
+                providers["provider_id"],
+                providers["provider_name"],
+                providers["provider_type"],
+                countries,
+            )
+        ):
+            row = idx + 2
+            if not provider:
+                self.add_issue(ERROR, providers_fi, row, "missing provider_id")
+                continue
+            if provider_type not in PROVIDER_TYPES:
+                self.add_issue(
+                    ERROR, providers_fi, row, f"unexpected type {provider_type!r}"
+                )
+            meta = (name, provider_type, country)
+            if provider not in first_rows:
+                first_rows[provider] = (row, meta)
+                self.provider_to_type[provider] = provider_type
+            elif first_rows[provider][1] != meta:
+                self.add_issue(
+                    ERROR,
+                    providers_fi,
+                    row,
+                    f"provider_id {provider} has a different name, type or country than in "
+                    f"row {first_rows[provider][0]}",
+                )
+
+    def check_provision(self, provision_fi: str) -> None:
+        """
+        Check that the provision csv refers to known providers and nodes, and that its shares
+        and years are valid
+
+        :param provision_fi: Path to provision csv
+        :return: None
+        """
+        provision = self._get_columns("provision", provision_fi)
+        if provision is None:
+            return
+        years = provision.get("year", [""] * len(provision["provider_id"]))
+        country_share_sums = collections.Counter()
+        first_rows = {}
+        for idx, (provider, provided, share, year) in enumerate(
+            zip(
+                provision["provider_id"],
+                provision["provided_id"],
+                provision["share_provided"],
+                years,
+            )
+        ):
+            row = idx + 2
+            provider_type = self.provider_to_type.get(provider.strip())
+            if provider_type is None:
+                self.add_issue(
+                    ERROR, provision_fi, row, f"unknown provider_id {provider}"
+                )
+            node_type = self.node_to_type.get(provided)
+            if node_type is None:
+                self.add_issue(
+                    ERROR, provision_fi, row, f"unknown provided_id {provided}"
+                )
+            elif (
+                provider_type == "country"
+                and node_type not in self.country_provision_types
+            ):
+                self.add_issue(
+                    WARNING,
+                    provision_fi,
+                    row,
+                    f"country {provider} provides {provided}, which is a {node_type}",
+                )
+            if year.strip():
+                try:
+                    int(year)
+                except ValueError:
+                    self.add_issue(ERROR, provision_fi, row, f"invalid year {year!r}")
+            if share:
+                try:
+                    value = float(share.strip("%"))
+                except ValueError:
+                    self.add_issue(
+                        ERROR, provision_fi, row, f"invalid share_provided {share!r}"
+                    )
+                    continue
+                if not 0 <= value <= 100:
+                    self.add_issue(
+                        ERROR,
+                        provision_fi,
+                        row,
+                        f"share_provided {share} is not between 0 and 100",
+                    )
+                elif provider_type == "country":
+                    key = (provided, year.strip())
+                    country_share_sums[key] += value
+                    first_rows.setdefault(key, row)
+        for (provided, year), total in country_share_sums.items():
+            if total > 100 + SHARE_SUM_TOLERANCE:
+                self.add_issue(
+                    WARNING,
+                    provision_fi,
+                    first_rows[(provided, year)],
+                    f"country shares of {provided}"
+                    + (f" in {year}" if year else "")
+                    + f" add up to {total:g}",
+                )
+
+    def validate(
+        self,
+        nodes_fi: str,
+        stages_fi: str,
+        sequence_fi: str,
+        providers_fi: str,
+        provision_fi: str,
+    ) -> list:
+        """
+        Check all of the source csvs
+
+        :return: List of problems found, as dicts with the "severity", "file", "row" and
+            "message" of each
+        """
+        self.check_nodes(nodes_fi, stages_fi)
+        self.check_sequence(sequence_fi)
+        self.check_providers(providers_fi)
+        self.check_provision(provision_fi)
+        return self.issues
+
+    @staticmethod
+    def report(issues: list) -> str:
+        """
+        Summarize problems found by validate
+
+        :param issues: Problems, from validate
+        :return: Human-readable list of problems, followed by totals
+        """
+        lines = [
+            f"{issue['file']}"
+            + (f":{issue['row']}" if issue["row"] is not None else "")
+            + f": {issue['severity']}: {issue['message']}"
+            for issue in issues
+        ]
+        counts = collections.Counter(issue["severity"] for issue in issues)
+        lines.append(f"validation: {counts[ERROR]} errors, {counts[WARNING]} warnings")
+        return "\n".join(lines)
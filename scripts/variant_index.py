@@ -0,0 +1,93 @@
+"""
+Resolves the variant hierarchy (nodes that are a type of another node, from the sequence csv's
+is_type_of_id column) into the full set of variants below and above each node. Each node's
+closure is built from its direct variants' closures, so every node is visited once.
+"""
+
+
+def _dedupe(nodes: list) -> list:
+    return list(dict.fromkeys(nodes))
+
+
+def _get_topological_order(variants: dict) -> list:
+    """
+    Order nodes so that each node comes before its variants
+
+    :param variants: Dict mapping nodes to lists of their direct variants
+    :return: List of nodes
+    :raises ValueError: if a node is, directly or indirectly, a variant of itself
+    """
+    visiting = 1
+    visited = 2
+    state = {}
+    order = []
+    for root in variants:
+        if root in state:
+            continue
+        state[root] = visiting
+        # Depth-first search with an explicit stack of (node, iterator over its variants)
+        stack = [(root, iter(variants.get(root, [])))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                state[node] = visited
+                order.append(node)
+            elif state.get(child) == visiting:
+                path = [n for n, _ in stack]
+                cycle = path[path.index(child) :] + [child]
+                raise ValueError(f"Cycle in node variants: {' -> '.join(cycle)}")
+            elif child not in state:
+                state[child] = visiting
+                stack.append((child, iter(variants.get(child, []))))
+    return order[::-1]
+
+
+def build_variant_index(variants: dict) -> dict:
+    """
+    Build the transitive closure of the variant hierarchy
+
+    :param variants: Dict mapping nodes to lists of their direct variants
+    :return: Dict with:
+        * "descendants": dict mapping each node that has variants to all of its variants, with
+          its direct variants first, followed by each direct variant's descendants in turn
+        * "ancestors": dict mapping each variant to all of the nodes it is a variant of, nearest
+          first
+    :raises ValueError: if a node is, directly or indirectly, a variant of itself
+    """
+    order = _get_topological_order(variants)
+    parents = {}
+    for node in order:
+        for variant in variants.get(node, []):
+            parents.setdefault(variant, []).append(node)
+    ancestors = {}
+    for node in order:
+        if node in parents:
+            ancestors[node] = _dedupe(
+                parents[node]
+                + [
+                    ancestor
+                    for parent in parents[node]
+                    for ancestor in ancestors.get(parent, [])
+                ]
+            )
+    descendants = {}
+    for node in reversed(order):
+        if node in variants:
+            descendants[node] = _dedupe(
+                variants[node]
+                + [
+                    descendant
+                    for variant in variants[node]
+                    for descendant in descendants.get(variant, [])
+                ]
+            )
+    # Keep the order nodes were listed in
+    listed_variants = _dedupe(
+        variant for node_variants in variants.values() for variant in node_variants
+    )
+    return {
+        "descendants": {node: descendants[node] for node in variants},
+        "ancestors": {node: ancestors[node] for node in listed_variants},
+    }
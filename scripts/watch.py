@@ -0,0 +1,220 @@
+"""
+Keeps the state of a preprocessing run in memory and watches the source csvs, so that edits show
+up in the webapp's development server without a full run per save. When a csv changes, it is
+compared column by column with the version last applied, and only the stages that read the
+changed columns are rerun. Outputs are written through the build manifest, so only files whose
+content actually changed are rewritten.
+"""
+
+import os
+import time
+import traceback
+
+try:
+    from scripts.tables import Table
+    from scripts.validate import ERROR
+except ImportError:  # run directly, as python3 scripts/preprocess.py
+    from tables import Table
+    from validate import ERROR
+
+# Seconds between checks for changed files
+POLL_SECONDS = 0.1
+# Command line arguments holding the paths of the source csvs
+SOURCES = ["nodes", "stages", "sequence", "providers", "provision"]
+# Source csvs each stage reads, in the order the stages run. write_graphs and the image stages
+# add to the node metadata that mk_metadata builds, so all of them rerun whenever it is rebuilt
+STAGE_SOURCES = {
+    "mk_metadata": {"nodes", "stages", "sequence"},
+    "write_descriptions": {"nodes", "stages"},
+    "mk_images": {"nodes", "stages", "sequence"},
+    "mk_image_derivatives": {"nodes", "stages", "sequence"},
+    "write_graphs": {"nodes", "stages", "sequence"},
+    "mk_provider_to_meta": {"providers"},
+    "write_provision": set(SOURCES),
+    "write_search_index": {"nodes", "stages", "providers"},
+    "write_chunks": set(SOURCES),
+}
+# Columns that only TEXT_STAGES read, so edits to them leave the other stages' outputs unchanged
+TEXT_COLUMNS = {"description"}
+TEXT_STAGES = {"write_descriptions", "write_search_index"}
+
+
+def get_changed_columns(old: Table, new: Table) -> set:
+    """
+    Compare two versions of a csv
+
+    :param old: Table read from the previous version, or None if there was none
+    :param new: Table read from the new version
+    :return: Set of the names of columns that were added, removed, or have different values.
+        If rows were added or removed, this is every column
+    """
+    old_columns = old.columns if old is not None else {}
+    return {
+        column
+        for column in set(old_columns) | set(new.columns)
+        if old_columns.get(column) != new.columns.get(column)
+    }
+
+
+def get_stages(changes: dict, stages: list = None) -> list:
+    """
+    Get the stages that need to be rerun after the source csvs changed
+
+    :param changes: Dict mapping sources (keys of SOURCES) to the columns that changed in them
+    :param stages: Stages that may be run; defaults to all of STAGE_SOURCES
+    :return: List of stages, in the order they should run
+    """
+    return [
+        stage
+        for stage in stages or STAGE_SOURCES
+        if any(
+            changes.get(source)
+            and (stage in TEXT_STAGES or changes[source] - TEXT_COLUMNS)
+            for source in STAGE_SOURCES[stage]
+        )
+    ]
+
+
+class Watcher:
+    """
+    Reruns the stages of a preprocessing run that depend on the source csvs as they change
+    """
+
+    def __init__(self, preprocess, args):
+        """
+        :param preprocess: Preprocess instance that has already run every stage once
+        :param args: Parsed command line arguments the run was configured with
+        """
+        self.preprocess = preprocess
+        self.args = args
+        self.stages = [
+            stage
+            for stage in STAGE_SOURCES
+            if (stage != "mk_image_derivatives" or args.image_derivatives)
+            and (stage != "write_chunks" or args.chunked_output)
+            and (stage != "write_search_index" or args.search_index)
+        ]
+        self.file_stats = {source: self._stat(source) for source in SOURCES}
+        # The version of each csv that the in-memory state was built from
+        self.tables = {source: Table.read(getattr(args, source)) for source in SOURCES}
+
+    def _stat(self, source: str) -> tuple:
+        try:
+            stat = os.stat(getattr(self.args, source))
+        except FileNotFoundError:
+            # Some editors save by replacing the file, so it may briefly not exist
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self) -> list:
+        """
+        Check which source csvs were modified since the last check
+
+        :return: List of sources (keys of SOURCES) whose files were modified
+        """
+        changed = []
+        for source in SOURCES:
+            stat = self._stat(source)
+            if stat is not None and stat != self.file_stats[source]:
+                self.file_stats[source] = stat
+                changed.append(source)
+        return changed
+
+    def run_stage(self, stage: str) -> None:
+        """
+        Rerun a stage, first clearing the in-memory state it rebuilds
+
+        :param stage: Stage name, a key of STAGE_SOURCES
+        :return: None
+        """
+        preprocess, args = self.preprocess, self.args
+        if stage == "mk_metadata":
+            preprocess.node_to_meta = {}
+            preprocess.variants = {}
+            preprocess.variant_index = None
+            preprocess.mk_metadata(args.nodes, args.stages)
+        elif stage == "write_descriptions":
+            preprocess.write_descriptions(args.nodes, args.stages, args.output_text_dir)
+        elif stage == "mk_images":
+            # Images are only downloaded by a full run
+            preprocess.mk_images(
+                False, args.images_file, args.output_images_dir, args.image_cache_dir
+            )
+        elif stage == "mk_image_derivatives":
+            preprocess.mk_image_derivatives(
+                args.output_images_dir, args.output_derivatives_dir, args.pdf_workers
+            )
+        elif stage == "write_graphs":
+            preprocess.write_graphs(args.sequence, args.output_dir)
+        elif stage == "mk_provider_to_meta":
+            preprocess.provider_to_meta = {}
+            preprocess.mk_provider_to_meta(args.providers)
+        elif stage == "write_provision":
+            preprocess.write_provision(args.provision, args.output_dir)
+        elif stage == "write_search_index":
+            preprocess.write_search_index(
+                args.nodes, args.stages, args.providers, args.output_dir
+            )
+        elif stage == "write_chunks":
+            preprocess.write_chunks(args.output_dir)
+
+    def apply(self, changed: list) -> list:
+        """
+        Update the in-memory state and outputs after source csvs changed. Changes are not
+        applied while the csvs have validation errors
+
+        :param changed: Sources (keys of SOURCES) whose files were modified
+        :return: List of the stages that were rerun
+        """
+        preprocess, args = self.preprocess, self.args
+        new_tables = {}
+        changes = {}
+        for source in changed:
+            new_tables[source] = Table.read(getattr(args, source))
+            changes[source] = get_changed_columns(
+                self.tables[source], new_tables[source]
+            )
+            preprocess.tables.invalidate(getattr(args, source))
+        stages = get_stages(changes, self.stages)
+        if not stages:
+            return []
+        issues = preprocess.validate_inputs(*(getattr(args, s) for s in SOURCES))
+        if any(issue["severity"] == ERROR for issue in issues):
+            print("not applying changes until the errors are fixed")
+            return []
+        for stage in stages:
+            with preprocess.tracer.stage(stage):
+                self.run_stage(stage)
+        self.tables.update(new_tables)
+        if preprocess.manifest is not None:
+            preprocess.manifest.save()
+        return stages
+
+    def run(self) -> None:  # pragma: no cover
+        """
+        Apply changes to the source csvs as they are saved, until interrupted
+
+        :return: None
+        """
+        print(f"watching {', '.join(getattr(self.args, s) for s in SOURCES)}")
+        try:
+            while True:
+                time.sleep(POLL_SECONDS)
+                changed = self.poll()
+                if not changed:
+                    continue
+                start = time.perf_counter()
+                bytes_written = self.preprocess.bytes_written
+                try:
+                    stages = self.apply(changed)
+                except Exception:
+                    # Keep watching, so that the next save can fix the problem
+                    traceback.print_exc()
+                    continue
+                print(
+                    f"{', '.join(changed)} changed: reran {', '.join(stages) or 'nothing'} "
+                    f"in {(time.perf_counter() - start) * 1000:.0f}ms, wrote "
+                    f"{self.preprocess.bytes_written - bytes_written} bytes"
+                )
+        except KeyboardInterrupt:
+            print("stopped watching")
@@ -14,8 +14,9 @@ import {
 import {useXarrow} from "react-xarrows";
 
 import Map from "./map";
-import { nodeToMeta, variants } from "../../data/graph";
-import {countryProvision, countryProvisionConcentration, orgProvision, providerMeta} from "../../data/provision";
+import { nodeToMeta } from "../../data/graph";
+import { highlightIndex } from "../../data/highlights";
+import {countryProvision, orgProvision, providerMeta} from "../../data/provision";
 import {FILTER_INPUT, FILTER_CONCENTRATION, FILTER_COUNTRY, FILTER_ORG} from "../helpers/shared";
 import tooltips from "../helpers/tooltips";
 import "./Dashboard.css";
@@ -136,28 +137,6 @@ const Dashboard = () => {
     return inputNodes;
   };
 
-  // Each key variant is associated with a list of all
-  // its ancestors.
-  const getVariantToAncestors = () => {
-    const variantToAncestor = {};
-    // First, map each variant to its immediate parent
-    for (const node in variants) {
-      for (const variant of variants[node]) {
-        variantToAncestor[variant] = [node];
-      }
-    }
-    // Then, add all other ancestors
-    for (const variant in variantToAncestor) {
-      let ancestor = variantToAncestor[variant];
-      while (ancestor in variantToAncestor) {
-        ancestor = variantToAncestor[ancestor];
-        variantToAncestor[variant].push(...ancestor);
-      }
-    }
-    return variantToAncestor;
-  }
-  const variantToAncestor = getVariantToAncestors();
-
   const getCurrentHighlights = (currFilterValues = filterValues) => {
     let highlighter = FILTER_INPUT;
     let hasHighlighter = false;
@@ -198,57 +177,33 @@ const Dashboard = () => {
       setHighlights({});
       return;
     }
-    const currMapping = filterToValues[highlighter];
+    // Which nodes each filter highlights, and how strongly, is precomputed by preprocess.py
+    // (see scripts/highlight_index.py)
     if(highlighter === FILTER_INPUT) {
       const identityMap = {"type": "binary"};  // Use binary on/off shading on nodes
-      let provKey = currFilterValues[highlighter];
-      identityMap[provKey] = 1;
+      const provKey = currFilterValues[highlighter];
       // If the selected input is a variant, select the canonical version as well
-      if (variantToAncestor[provKey] !== undefined) {
-        for (const variantAncestor of variantToAncestor[provKey]) {
-          identityMap[variantAncestor] = 1;
-        }
+      for (const node of highlightIndex.input[provKey]?.nodes ?? [provKey]) {
+        identityMap[node] = 1;
       }
       setHighlights(identityMap);
     } else {
       const highlightGradientMap = {"type" : "gradient"};  // Use gradient shading on nodes
       if (highlighter === FILTER_CONCENTRATION) {
-        for (const nodeId in countryProvisionConcentration) {
-          const numCountries = countryProvisionConcentration[nodeId];
-          if (numCountries === 1) {  // Highly concentrated
-            highlightGradientMap[nodeId] = 81;
-          } else if (numCountries <= 3) {  // Medium concentrated
-            highlightGradientMap[nodeId] = 41;
-          } else {  // Not concentrated
-            continue;
+        for (const [highlight, nodeIds] of Object.entries(highlightIndex.concentration)) {
+          for (const nodeId of nodeIds) {
+            highlightGradientMap[nodeId] = Number(highlight);
           }
         }
       } else if (MULTI_FILTERS.includes(highlighter)) {
+        const currIndex = highlighter === FILTER_ORG ? highlightIndex.org : highlightIndex.country;
         let highlightFirst = undefined;
         for (const name of currFilterValues[highlighter]) {
           // If name is not one of the choices, we ignore it
-          if (!(name in currMapping)) {
+          if (!(name in currIndex)) {
             continue;
           }
-          for (const provKey in currMapping[name]) {
-            let provValue = currMapping[name][provKey]
-            // We round qualitative "major"/"minor" values to numerical approximations.
-            // For orgs, we treat all providers as if they are providing almost all of
-            // the node.
-            if (highlighter === FILTER_ORG) {
-              provValue = 81;
-            }
-            // For countries, we treat major providers as providing some small share.
-            else if (highlighter === FILTER_COUNTRY) {
-              if (provValue === "Major") {
-                provValue = 21;
-              } else if (provValue === "negligible") {
-                provValue = 0;
-              }
-            }
-            if (isNaN(provValue)) {
-              continue;
-            }
+          for (const [provKey, provValue, variantAncestors = []] of currIndex[name]) {
             if (provKey in highlightGradientMap) {
               highlightGradientMap[provKey] += provValue;
             } else {
@@ -257,15 +212,12 @@ const Dashboard = () => {
             // If the provision node is a variant of another parent node,
             // we show the highlighting on the top-level parent node.
             let provKeyTemp = provKey;
-            if (variantToAncestor[provKeyTemp] !== undefined) {
-              const variantAncestors = variantToAncestor[provKeyTemp];
-              for (const variantAncestor of variantAncestors) {
-                provKeyTemp = variantAncestor;
-                if (variantAncestor in highlightGradientMap) {
-                  highlightGradientMap[variantAncestor] = Math.max(provValue, highlightGradientMap[variantAncestor]);
-                } else {
-                  highlightGradientMap[variantAncestor] = provValue;
-                }
+            for (const variantAncestor of variantAncestors) {
+              provKeyTemp = variantAncestor;
+              if (variantAncestor in highlightGradientMap) {
+                highlightGradientMap[variantAncestor] = Math.max(provValue, highlightGradientMap[variantAncestor]);
+              } else {
+                highlightGradientMap[variantAncestor] = provValue;
               }
             }
             // Find the top node so we can scroll it into view
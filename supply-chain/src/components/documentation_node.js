@@ -13,6 +13,31 @@ import { allSubVariantsList } from "../helpers/shared";
 import InputDetail from "./input_detail";
 import InputList from "./input_list";
 
+// Renders a node image, using the resized derivatives written by preprocess.py when they exist
+const NodeImage = ({meta, src, sizes, style, ...imgProps}) => {
+  if (!meta.image_srcset) {
+    return <img src={src} style={style} {...imgProps}/>;
+  }
+  const formats = Object.keys(meta.image_srcset);
+  const fallback = formats[formats.length - 1];
+  return (
+    <picture>
+      {formats.slice(0, -1).map(format =>
+        <source key={format} type={`image/${format}`} srcSet={meta.image_srcset[format]} sizes={sizes}/>
+      )}
+      <img src={src} srcSet={meta.image_srcset[fallback]} sizes={sizes}
+        width={meta.image_width} height={meta.image_height}
+        style={{
+          backgroundImage: `url(${meta.image_placeholder})`,
+          backgroundSize: "cover",
+          ...style
+        }}
+        {...imgProps}
+      />
+    </picture>
+  );
+};
+
 const DocumentationNode = (props) => {
   const {
     currSelectedNode,
@@ -117,7 +142,7 @@ const DocumentationNode = (props) => {
         <div className="documentation-node-description">
           {imgFileName !== undefined &&
             <div className="image-wrapper">
-              <img src={imgFileName}
+              <NodeImage meta={meta} src={imgFileName} sizes="(max-width: 900px) 100vw, 50vw"
                 onClick={() => setOpen(true)}
                 onKeyDown={(evt) => {
                   if (evt.key === "Enter") {setOpen(true)}
@@ -195,7 +220,7 @@ const DocumentationNode = (props) => {
           }}>
             {imgFileName !== undefined &&
               <figure>
-                <img src={imgFileName} alt={node}
+                <NodeImage meta={meta} src={imgFileName} sizes="600px" alt={node}
                   style={{maxWidth: "600px", maxHeight: "80vh", height: "auto"}}
                 />
                 <figcaption className="caption" dangerouslySetInnerHTML={{__html:
@@ -2,7 +2,8 @@ import React, { useEffect, useRef } from "react";
 import Xarrow, {Xwrapper} from "react-xarrows";
 import { useStaticQuery, graphql } from "gatsby"
 
-import {graph, graphReverse, nodeToMeta} from "../../data/graph";
+import {nodeToMeta} from "../../data/graph";
+import {mapLayout} from "../../data/layout";
 import DocumentationNode from "./documentation_node";
 import GraphNode, {MiniGraphNode} from "./graph_node";
 import {FILTER_CONCENTRATION, getBackgroundGradient} from "../helpers/shared";
@@ -12,8 +13,6 @@ const Map = (props) => {
   const {highlights, highlighterFilter, filterValues, defaultFilterValues, documentationPanelToggle, setDocumentationPanelToggle,
     parentNode, selectedNode, updateSelected} = props;
 
-  const finalNode = Object.keys(nodeToMeta).filter(k => nodeToMeta[k]["type"] === "ultimate_output")[0];
-
   const minimapLayers = [];
   const standaloneMinimapLayers = [];
   const data = useStaticQuery(graphql`
@@ -51,25 +50,6 @@ const Map = (props) => {
   const images = data.images.nodes;
   const pdfs = data.pdfs.nodes;
 
-  const _nodeToNumber = (e) => e in graph ? graph[e].length : 0;
-
-  const getLayerOrder = (nodes) => {
-    nodes.sort((e1, e2) => (_nodeToNumber(e1) > _nodeToNumber(e2)) ? 1 : ((_nodeToNumber(e1) < _nodeToNumber(e2)) ? -1 : 0));
-    // Now that we have sorted the nodes by number of outgoing edges, we want to put the nodes with the fewest
-    // edges in the middle of the node list
-    const nodesPrefix = [];
-    const nodesSuffix = [];
-    for(let idx = 0; idx < nodes.length; idx ++){
-      if(idx % 2 === 0){
-        nodesSuffix.push(nodes[idx])
-      } else {
-        nodesPrefix.push(nodes[idx])
-      }
-    }
-    nodesPrefix.reverse();
-    return nodesPrefix.concat(nodesSuffix);
-  };
-
   const _getStageHighlight = (stage, highlights, stageClassName) => {
     // If the user is highlighting by concentration, we disable stage highlighting
     // to avoid confusion.
@@ -153,54 +133,20 @@ const Map = (props) => {
 
   const arrowShape = {svgElem: <path d="M 0.5 0.25 L 1 0.5 L 0.5 0.75 z"/>, offsetForward: 0.75}
 
-  const mkEdges = (edges, nodeToPosition, nodeToLayerNumber, minimap=false, standalone=false) => {
-    return <div className="graph-arrows-wrapper" key={JSON.stringify(edges)}>
+  // Edges are routed ahead of time by preprocess.py (see scripts/map_layout.py)
+  const mkEdges = (edges, minimap=false, standalone=false) => {
+    return <div className="graph-arrows-wrapper" key={JSON.stringify(edges.map(edge => [edge.start, edge.end]))}>
       {edges.map(edge => {
-        let startEdge = edge[0] + (minimap ? ("-minimap" + (standalone ? "-standalone" : "")) : "");
-        let endEdge = edge[1] + (minimap ? ("-minimap" + (standalone ? "-standalone" : "")) : "");
-        let fromDirection = "bottom";
-        let toDirection = "top";
-        let gridBreak = "50%";
-        let path = "grid";
-        // If arrow is going from center to edge
-        if(Math.abs(nodeToPosition[edge[0]]) < Math.abs(nodeToPosition[edge[1]])){
-          // Arrow will leave center on the left or right
-          fromDirection = nodeToPosition[edge[0]] > 0 ? "left" : "right";
-          // Arrow will bend as far as possible from center
-          gridBreak = "100%";
-          // Arrow should enter from top if going to a lower layer node
-          toDirection = fromDirection === "right" ? "left" : "right";
-          if (nodeToLayerNumber[edge[0]] > nodeToLayerNumber[edge[1]]) {
-            toDirection = "top";
-          } else if (nodeToLayerNumber[edge[0]] < nodeToLayerNumber[edge[1]]) {
-            toDirection = "bottom";
-          } else {  // Same layer connection
-            path = "straight";
-          }
-        // If arrow is going from edge to center
-        } else if(Math.abs(nodeToPosition[edge[0]]) > Math.abs(nodeToPosition[edge[1]])){
-          // Arrow will meet center on the left or right
-          toDirection = nodeToPosition[edge[0]] > 0 ? "right" : "left";
-          // Arrow will bend as far as possible from center
-          gridBreak = "0%";
-          // Arrow should leave from bottom if going to a lower layer node
-          fromDirection = toDirection === "right" ? "left" : "right";
-          if (nodeToLayerNumber[edge[0]] > nodeToLayerNumber[edge[1]]) {
-            fromDirection = "bottom";
-          } else if (nodeToLayerNumber[edge[0]] < nodeToLayerNumber[edge[1]]) {
-            fromDirection = "top";
-          } else {  // Same layer connection
-            path = "straight";
-          }
-        }
+        const startEdge = edge.start + (minimap ? ("-minimap" + (standalone ? "-standalone" : "")) : "");
+        const endEdge = edge.end + (minimap ? ("-minimap" + (standalone ? "-standalone" : "")) : "");
         return <Xarrow
           start={startEdge}
           end={endEdge}
           key={`${startEdge}-to-${endEdge}`}
-          path={path}
-          gridBreak={gridBreak}
-          startAnchor={fromDirection}
-          endAnchor={toDirection}
+          path={edge.path}
+          gridBreak={edge.gridBreak}
+          startAnchor={edge.startAnchor}
+          endAnchor={edge.endAnchor}
           strokeWidth={minimap ? 0.6 : 2}
           headSize={10}
           headShape={arrowShape}
@@ -222,108 +168,28 @@ const Map = (props) => {
   /* eslint-disable-next-line react-hooks/exhaustive-deps */
   }, []);
 
+  // The map is laid out ahead of time by preprocess.py (see scripts/map_layout.py), so we only
+  // need to draw it
   const mkGraph = () => {
-    let currNodes = [finalNode];
-    const layers = [mkLayer(currNodes)];
-    const layerEdges = [];
-    minimapLayers.push(makeMinimapLayer(currNodes, false));
-    standaloneMinimapLayers.push(makeMinimapLayer(currNodes, false, true));
-    const seen = new Set();
-    currNodes.map(n => seen.add(n));
-    // To help us figure out how to draw arrows
-    const nodeToPosition = {};
-    let layerNumber = 0;
-    const nodeToLayerNumber = {};
-    let currStage = null;
-    while(currNodes.length > 0){
-      const edgePairs = [];
-      for(let node of currNodes){
-        if(node in graphReverse){
-          for(let parentNode of graphReverse[node]){
-            edgePairs.push([parentNode, node])
-          }
-        }
-      }
-      const filtEdges = [];
-      currNodes = [];
-      for(let edge of edgePairs){
-        let siblings = [];
-        const parent = edge[0];
-        if(parent in graphReverse) {
-          for (let grandParent of graphReverse[parent]) {
-            siblings = siblings.concat(graph[grandParent]);
-          }
-        }
-        filtEdges.push(edge);
-        if(!seen.has(parent)) {
-          // Nodes N59 and N60 get special handling.
-          // By default, these nodes would appear near the bottom of stage 2.
-          // However, because they are a parent to almost every node in stage 2,
-          // it makes more sense if they appear near the top (especially in mobile
-          // view where arrows cannot provide guidance to the user).
-          // Therefore, this algorithm skips placing these two nodes in the map
-          // until we reach the top of stage 2 (node N35), although we still
-          // need to assign them a position and layer number to make the arrows
-          // behave correctly.
-          if (((parent === "N59") || (parent === "N60")) && (!seen.has("N35"))) {
-            nodeToPosition["N59"] = -1;
-            nodeToLayerNumber["N59"] = layerNumber;
-            nodeToPosition["N60"] = 1;
-            nodeToLayerNumber["N60"] = layerNumber;
-            continue;
-          }
-          currNodes.push(parent);
-        }
-        seen.add(parent);
-      }
-      const orderedLayerNodes = getLayerOrder(currNodes);
-      // Add a stage layer if a new stage has started
-      if (orderedLayerNodes && currStage !== nodeToMeta[orderedLayerNodes[0]]?.["stage_id"]) {
-        if (layerNumber !== 0) {
-          const stage = mkStage(currStage);
-          layers.push(stage);
-        }
-        currStage = nodeToMeta[orderedLayerNodes[0]]?.["stage_id"];
-      }
-      // Add nodes for the current layer
-      const layer = mkLayer(orderedLayerNodes);
-      layers.push(layer);
-      const minimapLayer = makeMinimapLayer(orderedLayerNodes, false);
-      minimapLayers.push(minimapLayer);
-      const standaloneMinimapLayer = makeMinimapLayer(orderedLayerNodes, false, true);
-      standaloneMinimapLayers.push(standaloneMinimapLayer);
-      // Add edges for the current layer
-      const centerPoint = orderedLayerNodes.length/2 - 0.5;
-      for (let idx = 0; idx < orderedLayerNodes.length; idx++) {
-        const node = orderedLayerNodes[idx];
-        nodeToPosition[node] = idx - centerPoint;
-        nodeToLayerNumber[node] = layerNumber;
+    for (const row of mapLayout.minimap) {
+      if (row.edges !== undefined) {
+        minimapLayers.push(mkEdges(mapLayout.edges[row.edges], true));
+        standaloneMinimapLayers.push(mkEdges(mapLayout.edges[row.edges], true, true));
+      } else {
+        minimapLayers.push(makeMinimapLayer(row.nodes, false));
+        standaloneMinimapLayers.push(makeMinimapLayer(row.nodes, false, true));
       }
-      const edges = mkEdges(filtEdges, nodeToPosition, nodeToLayerNumber);
-      layerEdges.push(edges);
-      const minimapEdges = mkEdges(filtEdges, nodeToPosition, nodeToLayerNumber, true);
-      minimapLayers.push(minimapEdges);
-      const standaloneMinimapEdges = mkEdges(filtEdges, nodeToPosition, nodeToLayerNumber, true, true);
-      standaloneMinimapLayers.push(standaloneMinimapEdges);
-      layerNumber += 1;
     }
-    layers.reverse();
+    const unattached = mapLayout.unattached;
+    minimapLayers.unshift(makeMinimapLayer(unattached, true));
+    standaloneMinimapLayers.unshift(makeMinimapLayer(unattached, true, true));
+    const layers = mapLayout.layers.map(row => row.nodes !== undefined ? mkLayer(row.nodes) : mkStage(row.stage));
     // SVGs don't respect z-index, so to order them, we need to draw them in the correct order.
     // We add the arrows to the front of the array so they are drawn before anything else,
     // because the arrows are the bottom layer of the map, and other elements/SVGs
     // (most importantly, the little black down arrow on the bottom edge of the graph node)
     // should show on top of them.
-    layers.unshift(layerEdges);
-    minimapLayers.reverse();
-    standaloneMinimapLayers.reverse();
-    const unattached = [];
-    for(let node in nodeToMeta){
-      if((! seen.has(node)) && (nodeToMeta[node]["type"] === "process")){
-        unattached.push(node)
-      }
-    }
-    minimapLayers.unshift(makeMinimapLayer(unattached, true));
-    standaloneMinimapLayers.unshift(makeMinimapLayer(unattached, true, true));
+    layers.unshift(mapLayout.edges.map(edges => mkEdges(edges)));
     return (
       <div className="map-background">
         {filterValues["input-resource"] && filterValues["input-resource"] !== defaultFilterValues["input-resource"] && documentationPanelToggle &&
@@ -2,24 +2,11 @@ import React from "react";
 import CircleIcon from '@mui/icons-material/Circle';
 import CircleOutlinedIcon from '@mui/icons-material/CircleOutlined';
 import SvgIcon from '@mui/material/SvgIcon';
-import { variants } from "../../data/graph";
+import { variantDescendants } from "../../data/graph";
 import { NODE_TYPE_PARENT } from "../components/input_list";
 
-// List of all subvariants a parent variant has
-const getAllSubVariantsList = () => {
-  let subVariantsList = {...variants};
-  for (const nodeWithVariants in subVariantsList) {
-    // Deep copy
-    subVariantsList[nodeWithVariants] = [...subVariantsList[nodeWithVariants]];
-    for (const nodeVariant of subVariantsList[nodeWithVariants]) {
-      if (nodeVariant in subVariantsList) {
-        subVariantsList[nodeWithVariants].push(...subVariantsList[nodeVariant]);
-      }
-    }
-  }
-  return subVariantsList;
-};
-const allSubVariantsList = getAllSubVariantsList();
+// List of all subvariants a parent variant has, at any depth
+const allSubVariantsList = variantDescendants;
 
 export const getBackgroundGradient = (highlight, highlights) => {
   let backgroundGradient = "gradient-100";
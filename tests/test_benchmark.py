@@ -0,0 +1,73 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from scripts.benchmark import compare, generate_dataset, run_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_generate_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = generate_dataset(os.path.join(tmp_dir, "a"), 2)
+            files_again = generate_dataset(os.path.join(tmp_dir, "b"), 2)
+            for name, fi in files.items():
+                with open(fi) as f, open(files_again[name]) as f_again:
+                    self.assertEqual(f.read(), f_again.read())
+            with open(files["inputs"]) as f:
+                types = [row["type"] for row in csv.DictReader(f)]
+            self.assertEqual(22, types.count("process"))
+            self.assertEqual(1, types.count("ultimate_output"))
+            with open(files["sequence"]) as f:
+                parents = {
+                    row["input_id"]: row["is_type_of_id"]
+                    for row in csv.DictReader(f)
+                    if row["is_type_of_id"]
+                }
+            self.assertTrue(parents)
+            # Variant chains are short and acyclic
+            for node in parents:
+                depth = 0
+                while node in parents:
+                    node = parents[node]
+                    depth += 1
+                self.assertLessEqual(depth, 3)
+
+    def test_run_benchmark(self):
+        report = run_benchmark([1], repeat=1)
+        result = report["scales"]["1"]
+        self.assertEqual(126, result["rows"]["inputs"])
+        self.assertEqual(list(result["seconds"]), list(result["peak_bytes"]))
+        self.assertIn("write_provision", result["seconds"])
+        self.assertIn("pdf_prep", result["seconds"])
+        self.assertEqual([], compare(report, report))
+
+    def test_compare(self):
+        baseline = {
+            "scales": {
+                "1": {
+                    "seconds": {"fast": 1.0, "slow": 1.0, "tiny": 0.001},
+                    "peak_bytes": {"fast": 1 << 30, "slow": 1 << 30, "tiny": 1},
+                }
+            }
+        }
+        report = {
+            "scales": {
+                "1": {
+                    "seconds": {"fast": 1.1, "slow": 2.0, "tiny": 0.005},
+                    "peak_bytes": {"fast": 1 << 30, "slow": 1 << 31, "tiny": 100},
+                },
+                "10": {"seconds": {"fast": 10.0}, "peak_bytes": {"fast": 1}},
+            }
+        }
+        self.assertEqual(
+            [
+                "scale 1: slow seconds regressed from 1 to 2 (+100%)",
+                "scale 1: slow peak_bytes regressed from 1.074e+09 to 2.147e+09 (+100%)",
+            ],
+            compare(report, baseline),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
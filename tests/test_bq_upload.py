@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from scripts.bq_upload import CHECKSUM_LABEL, BqUploader, LocalClient, file_checksum
+
+
+class FlakyClient(LocalClient):
+    """
+    LocalClient whose loads into some tables fail a given number of times
+    """
+
+    def __init__(self, output_dir, failures):
+        super().__init__(output_dir)
+        self.failures = dict(failures)
+        self.loads = []
+
+    def load_table_from_file(self, source_file, table_name, **kwargs):
+        self.loads.append(table_name)
+        if self.failures.get(table_name, 0) > 0:
+            self.failures[table_name] -= 1
+            raise ConnectionError(f"could not load {table_name}")
+        return super().load_table_from_file(source_file, table_name, **kwargs)
+
+
+class TestBqUpload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tables_dir = os.path.join(self.tmp_dir.name, "tables")
+        self.source_fi = os.path.join(self.tmp_dir.name, "source.csv")
+        with open(self.source_fi, "w") as f:
+            f.write("a,b\n1,2\n")
+        self.loads = [
+            {"file": self.source_fi, "table": "d.t", "schema": [("a", "STRING")]},
+            {"file": self.source_fi, "table": "d.t_backup", "schema": []},
+        ]
+        self.sleeps = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def mk_uploader(self, client, max_retries=3):
+        return BqUploader(client, max_retries=max_retries, sleep=self.sleeps.append)
+
+    def test_upload(self):
+        client = FlakyClient(self.tables_dir, {})
+        results = self.mk_uploader(client).upload(self.loads)
+        self.assertEqual(["loaded", "loaded"], [r["status"] for r in results])
+        self.assertEqual([8, 8], [r["bytes"] for r in results])
+        with open(os.path.join(self.tables_dir, "d.t.csv")) as f:
+            self.assertEqual("a,b\n1,2\n", f.read())
+        self.assertEqual(
+            file_checksum(self.source_fi),
+            client.get_table("d.t").labels[CHECKSUM_LABEL],
+        )
+
+    def test_skip_unchanged(self):
+        self.mk_uploader(LocalClient(self.tables_dir)).upload(self.loads)
+        client = FlakyClient(self.tables_dir, {})
+        results = self.mk_uploader(client).upload(self.loads)
+        self.assertEqual(["skipped", "skipped"], [r["status"] for r in results])
+        self.assertEqual([], client.loads)
+        with open(self.source_fi, "a") as f:
+            f.write("3,4\n")
+        results = self.mk_uploader(client).upload(self.loads)
+        self.assertEqual(["loaded", "loaded"], [r["status"] for r in results])
+
+    def test_retry(self):
+        client = FlakyClient(self.tables_dir, {"d.t": 2})
+        results = self.mk_uploader(client).upload(self.loads)
+        self.assertEqual(["loaded", "loaded"], [r["status"] for r in results])
+        self.assertEqual([3, 1], [r["attempts"] for r in results])
+        self.assertIsNone(results[0]["error"])
+        self.assertEqual([1.0, 2.0], self.sleeps)
+
+    def test_failure_is_resumable(self):
+        client = FlakyClient(self.tables_dir, {"d.t_backup": 2})
+        results = self.mk_uploader(client, max_retries=1).upload(self.loads)
+        self.assertEqual(["loaded", "failed"], [r["status"] for r in results])
+        self.assertIn("ConnectionError", results[1]["error"])
+        self.assertIn("failed d.t_backup", BqUploader.report(results))
+        # Rerunning only loads the table that failed
+        client.loads = []
+        results = self.mk_uploader(client).upload(self.loads)
+        self.assertEqual(["skipped", "loaded"], [r["status"] for r in results])
+        self.assertEqual(["d.t_backup"], client.loads)
@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+from scripts.canonical import (
+    canonicalize,
+    get_companions,
+    has_companions,
+    to_canonical_json,
+    write_companions,
+)
+
+
+class TestCanonical(unittest.TestCase):
+    def test_sorted_keys_and_sets(self):
+        self.assertEqual(
+            '{"N1": ["a", "b", "c"], "N2": {"x": 1, "y": 2}}',
+            to_canonical_json({"N2": {"y": 2, "x": 1}, "N1": {"c", "a", "b"}}),
+        )
+        self.assertEqual(
+            to_canonical_json({"b": frozenset(["y", "x"]), "a": 1}),
+            to_canonical_json({"a": 1, "b": frozenset(["x", "y"])}),
+        )
+
+    def test_lists_keep_order(self):
+        self.assertEqual("[3, 1, 2]", to_canonical_json([3, 1, 2]))
+        self.assertEqual('[["b", 1]]', to_canonical_json([("b", 1)]))
+
+    def test_unsorted_top_level(self):
+        country_provision = {"USA": {"N2": 50, "N1": 40}, "China": {"N1": 60}}
+        self.assertEqual(
+            '{"USA": {"N1": 40, "N2": 50}, "China": {"N1": 60}}',
+            to_canonical_json(country_provision, sort_keys=False),
+        )
+
+    def test_ordered_keys(self):
+        meta = {
+            "N1": {
+                "name": "CPUs",
+                "image_srcset": {"avif": "a.avif", "webp": "a.webp", "jpeg": "a.jpg"},
+            }
+        }
+        self.assertEqual(
+            ["avif", "webp", "jpeg"],
+            list(canonicalize(meta)["N1"]["image_srcset"]),
+        )
+        self.assertEqual(["image_srcset", "name"], list(canonicalize(meta)["N1"]))
+
+    def test_keys(self):
+        self.assertEqual(
+            '{"2.5": "b", "3": "a", "null": "c", "true": "d"}',
+            to_canonical_json({2.5: "b", 3: "a", True: "d", None: "c"}),
+        )
+
+    def test_floats(self):
+        self.assertEqual("[0.0, 0.1, 61.0]", to_canonical_json([-0.0, 0.1, 61.0]))
+        for value in [float("nan"), float("inf")]:
+            with self.assertRaises(ValueError):
+                to_canonical_json({"N1": value})
+
+    def test_companions(self):
+        content = "const graph={};\n"
+        companions = get_companions(os.path.join("data", "graph.js"), content)
+        self.assertEqual(companions, get_companions("data/graph.js", content))
+        self.assertEqual(
+            content, gzip.decompress(companions["data/graph.js.gz"]).decode("utf-8")
+        )
+        self.assertEqual(
+            f"{hashlib.sha256(content.encode('utf-8')).hexdigest()}  graph.js\n",
+            companions["data/graph.js.sha256"].decode("utf-8"),
+        )
+
+    def test_write_companions(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_fi = os.path.join(tmp_dir, "graph.js")
+            self.assertFalse(has_companions(output_fi))
+            content = json.dumps({"a": 1})
+            num_bytes = write_companions(output_fi, content)
+            self.assertTrue(has_companions(output_fi))
+            self.assertEqual(
+                num_bytes,
+                sum(len(data) for data in get_companions(output_fi, content).values()),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from scripts.charts import (
+    CHART_LAYOUT,
+    ChartRenderer,
+    mk_country_provision_figure,
+)
+
+
+class TestCharts(unittest.TestCase):
+    def test_mk_country_provision_figure(self):
+        graph = [{"country": "JP", "value": 60}, {"country": "US", "value": 30}]
+        fig = mk_country_provision_figure(graph)
+        self.assertEqual((60, 30), fig.data[0].x)
+        self.assertEqual(("JP", "US"), fig.data[0].y)
+        self.assertEqual(("60%", "30%"), fig.data[0].text)
+        self.assertEqual(CHART_LAYOUT.xaxis.title.text, fig.layout.xaxis.title.text)
+
+    def test_chart_hash(self):
+        graph = [{"country": "JP", "value": 60}, {"country": "US", "value": 30}]
+        self.assertEqual(
+            ChartRenderer.chart_hash(graph),
+            ChartRenderer.chart_hash([dict(reversed(e.items())) for e in graph]),
+        )
+        self.assertNotEqual(
+            ChartRenderer.chart_hash(graph), ChartRenderer.chart_hash(graph[:1])
+        )
+
+    def test_get_stale(self):
+        graph = [{"country": "JP", "value": 60}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            renderer = ChartRenderer(tmp_dir)
+            renderer.hashes = {
+                "N1": ChartRenderer.chart_hash(graph),
+                "N2": ChartRenderer.chart_hash(graph),
+                "N3": "outdated",
+            }
+            for node_id in ["N1", "N3"]:
+                open(renderer.get_output_fi(node_id), mode="w").close()
+            self.assertEqual(
+                {"N2": graph, "N3": graph, "N4": graph},
+                renderer.get_stale(
+                    {"N1": graph, "N2": graph, "N3": graph, "N4": graph}
+                ),
+            )
+            self.assertEqual(
+                os.path.join(tmp_dir, "N1.jpg"), renderer.get_output_fi("N1")
+            )
@@ -0,0 +1,82 @@
+import unittest
+
+from scripts.chokepoints import build_upstream_chokepoints
+
+
+class TestChokepoints(unittest.TestCase):
+    def setUp(self):
+        # T1 (with variant T2) goes into process P1, which goes into P2 along with M1. P2 makes
+        # the final output O
+        self.node_to_meta = {
+            "P1": {"type": "process", "tools": ["T1"], "materials": []},
+            "P2": {"type": "process", "tools": [], "materials": ["M1"]},
+            "O": {"type": "ultimate_output", "tools": [], "materials": []},
+            "T1": {"type": "tool_resource"},
+            "T2": {"type": "tool_resource"},
+            "M1": {"type": "material_resource"},
+            "S1": {"type": "stage"},
+        }
+        self.graph_reverse = {"P2": ["P1"], "O": ["P2"]}
+        self.variant_descendants = {"T1": ["T2"]}
+        self.country_provision = {
+            "Japan": {"T2": 90.0, "M1": 40.0, "S1": 50.0},
+            "Taiwan": {"M1": 35.0, "T1": "negligible"},
+            "United States": {"M1": 25.0},
+        }
+        self.concentration = {"T2": 1, "M1": 2, "S1": 1}
+
+    def test_build_upstream_chokepoints(self):
+        rollup = build_upstream_chokepoints(
+            self.graph_reverse,
+            self.node_to_meta,
+            self.variant_descendants,
+            self.country_provision,
+            self.concentration,
+        )
+        self.assertEqual(["P1", "P2", "O"], list(rollup))
+        self.assertEqual(
+            {
+                "upstream": 2,
+                "measured": 1,
+                "worstConcentration": 1,
+                "singleCountry": 1,
+                "countryShares": {"Japan": 100.0},
+            },
+            rollup["P1"],
+        )
+        self.assertEqual(
+            {
+                "upstream": 4,
+                "measured": 2,
+                "worstConcentration": 1,
+                "singleCountry": 1,
+                "countryShares": {
+                    "Japan": 100.0,
+                    "Taiwan": 50.0,
+                    "United States": 50.0,
+                },
+            },
+            rollup["P2"],
+        )
+        # The output's upstream nodes are counted once, although they reach it through P2
+        self.assertEqual(5, rollup["O"]["upstream"])
+        self.assertEqual(rollup["P2"]["countryShares"], rollup["O"]["countryShares"])
+
+    def test_no_provision(self):
+        rollup = build_upstream_chokepoints(
+            self.graph_reverse, self.node_to_meta, {}, {}, {}
+        )
+        self.assertEqual(
+            {
+                "upstream": 1,
+                "measured": 0,
+                "worstConcentration": None,
+                "singleCountry": 0,
+                "countryShares": {},
+            },
+            rollup["P1"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
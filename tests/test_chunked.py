@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from scripts.chunked import StringTable, build_chunks, load_chunks, write_chunks
+
+
+class TestChunked(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            "graph": {"N1": ["N2"]},
+            "graphReverse": {"N2": ["N1"]},
+            "nodeToMeta": {
+                "N1": {
+                    "name": "Design",
+                    "type": "process",
+                    "stage_id": "S1",
+                    "market_chart_source": "<a href='x'>CSET</a>",
+                    "tools": ["T1"],
+                    "image_width": 2,
+                    "image_height": 0,
+                    "image_srcset": {"webp": "n1.webp 480w", "jpeg": "N1"},
+                },
+                "N2": {
+                    "name": "Fab",
+                    "type": "process",
+                    "stage_id": "S2",
+                    "market_chart_source": "<a href='x'>CSET</a>",
+                    "tools": [],
+                },
+                "T1": {"name": "EDA", "type": "tool_resource", "stage_id": ""},
+            },
+            "variants": {"T1": ["T2"]},
+            "countryProvision": {"United States": {"T1": 80.0, "N1": "Major"}},
+            "countryFlags": {"United States": "🇺🇸"},
+            "countryProvisionConcentration": {"T1": 1},
+            "orgProvision": {"P9": {"N1": "Major", "T2": "negligible"}},
+            "processNodesWithOrgProvision": ["N1"],
+            "providerMeta": {
+                "P1": {"name": "USA", "type": "country"},
+                "P9": {"name": "Intel", "type": "organization", "hq_flag": None},
+            },
+        }
+
+    def _build(self):
+        return build_chunks(
+            self.data["graph"],
+            self.data["graphReverse"],
+            self.data["nodeToMeta"],
+            self.data["variants"],
+            self.data["countryProvision"],
+            self.data["countryFlags"],
+            self.data["countryProvisionConcentration"],
+            self.data["orgProvision"],
+            self.data["processNodesWithOrgProvision"],
+            self.data["providerMeta"],
+        )
+
+    def test_string_table(self):
+        strings = StringTable(["N1", "N2"])
+        encoded = strings.encode(["N2", "N3", 5.0, 1, {"s": "N1"}])
+        self.assertEqual([{"s": 1}, "N3", 5.0, 1, {"d": {"s": {"s": 0}}}], encoded)
+        self.assertEqual(["N2", "N3", 5.0, 1, {"s": "N1"}], strings.decode(encoded))
+
+    def test_build_chunks(self):
+        index, chunks = self._build()
+        # Repeated strings are interned, strings used once are left in the node chunk
+        self.assertIn("<a href='x'>CSET</a>", index["strings"])
+        self.assertNotIn("Design", index["strings"])
+        self.assertEqual(["N1", "N2", "T1", "T2"], sorted(chunks))
+        self.assertEqual(
+            [[{"s": index["strings"].index("United States")}, 80.0]],
+            chunks["T1"]["countryProvision"],
+        )
+
+    def test_round_trip(self):
+        index, chunks = self._build()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_chunks(index, chunks, tmp_dir)
+            self.assertTrue(
+                os.path.exists(os.path.join(tmp_dir, "chunks", "nodes", "N1.json"))
+            )
+            self.assertEqual(self.data, load_chunks(tmp_dir))
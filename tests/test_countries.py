@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+
+from scripts.countries import TABLE_VERSION, CountryResolver, build_table
+
+
+class TestCountries(unittest.TestCase):
+    def test_build_table(self):
+        table = build_table()
+        self.assertEqual(TABLE_VERSION, table["version"])
+        self.assertEqual("United States", table["alpha_3"]["usa"])
+        self.assertEqual("🇺🇸", table["flags"]["usa"])
+        self.assertEqual("🇺🇸", table["flags"]["us"])
+        self.assertEqual("🇺🇸", table["flags"]["united states"])
+
+    def test_get_country(self):
+        resolver = CountryResolver()
+        self.assertEqual("United States", resolver.get_country("USA"))
+        self.assertEqual("Taiwan", resolver.get_country("TWN"))
+        self.assertEqual("Malaysia", resolver.get_country("MAL"))
+        self.assertEqual("Europe", resolver.get_country("Europe"))
+        self.assertEqual("Europe", resolver.get_country("Europe"))
+        self.assertEqual(3, resolver.stats["country_hit"])
+        self.assertEqual(2, resolver.stats["country_miss"])
+        self.assertEqual({"Europe": 2}, resolver.unmapped["country"])
+
+    def test_get_flag(self):
+        resolver = CountryResolver()
+        self.assertEqual("🇺🇸", resolver.get_flag("USA"))
+        self.assertEqual("🇺🇸", resolver.get_flag("united states"))
+        self.assertEqual("🇪🇺", resolver.get_flag("EUR"))
+        self.assertEqual(None, resolver.get_flag("NoSuchCountry"))
+        self.assertEqual(3, resolver.stats["flag_hit"])
+        self.assertEqual({"NoSuchCountry": 1}, resolver.unmapped["flag"])
+        self.assertIn("unmapped flag: NoSuchCountry (1)", resolver.report())
+
+    def test_persisted_table(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            table_fi = os.path.join(tmp_dir, "countries.json")
+            self.assertEqual("🇺🇸", CountryResolver(table_fi).get_flag("USA"))
+            self.assertTrue(os.path.exists(table_fi))
+            # Lookups on a warm run come from the persisted table
+            with open(table_fi, mode="w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": TABLE_VERSION,
+                        "alpha_3": {"usa": "Test Country"},
+                        "flags": {},
+                    },
+                    f,
+                )
+            self.assertEqual(
+                "Test Country", CountryResolver(table_fi).get_country("USA")
+            )
+            # Tables from an older version are rebuilt
+            with open(table_fi, mode="w", encoding="utf-8") as f:
+                json.dump({"version": -1}, f)
+            self.assertEqual(
+                "United States", CountryResolver(table_fi).get_country("USA")
+            )
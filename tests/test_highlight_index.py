@@ -0,0 +1,46 @@
+import unittest
+
+from scripts.highlight_index import build_concentration_index, build_highlight_index
+from scripts.variant_index import build_variant_index
+
+
+class TestHighlightIndex(unittest.TestCase):
+    def setUp(self):
+        # N3 is a variant of N2, which is a variant of N1
+        self.variants = {"N1": ["N2"], "N2": ["N3"]}
+        self.node_to_meta = {
+            "N1": {"type": "tool_resource"},
+            "N2": {"type": "tool_resource"},
+            "N3": {"type": "tool_resource"},
+            "N4": {"type": "material_resource"},
+            "N5": {"type": "process", "tools": ["N1"], "materials": ["N4"]},
+            "N6": {"type": "process", "tools": ["N3"], "materials": []},
+        }
+
+    def test_build_concentration_index(self):
+        self.assertEqual(
+            {81: ["N1", "N4"], 41: ["N2", "N3", "N6"]},
+            build_concentration_index(
+                {"N4": 1, "N1": 1, "N2": 2, "N3": 3, "N5": 4, "N6": None}
+            ),
+        )
+
+    def test_build_highlight_index(self):
+        index = build_highlight_index(
+            self.node_to_meta,
+            build_variant_index(self.variants)["ancestors"],
+            {"US": {"N4": 30.0, "N3": "Major", "N1": "negligible", "N2": "unknown"}},
+            {"P1": {"N2": "Major"}},
+            {"N4": 1},
+        )
+        self.assertEqual(
+            [["N4", 30.0], ["N3", 21, ["N2", "N1"]], ["N1", 0]], index["country"]["US"]
+        )
+        self.assertEqual([["N2", 81, ["N1"]]], index["org"]["P1"])
+        self.assertEqual({81: ["N4"], 41: []}, index["concentration"])
+        self.assertEqual(
+            {"nodes": ["N3", "N2", "N1"], "processes": ["N5", "N6"]},
+            index["input"]["N3"],
+        )
+        self.assertEqual({"nodes": ["N4"], "processes": ["N5"]}, index["input"]["N4"])
+        self.assertNotIn("N5", index["input"])
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from scripts.image_derivatives import (
+    CACHE_FILE,
+    ImageDerivatives,
+    get_derivative_widths,
+)
+
+
+class TestImageDerivatives(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.tmp_dir.name, "sources")
+        self.output_dir = os.path.join(self.tmp_dir.name, "node-images")
+        os.makedirs(self.source_dir)
+        self.sources = {
+            "N1": self.mk_image("N1.jpg", (1000, 500)),
+            "N2": self.mk_image("N2.JPG", (300, 200)),
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def mk_image(self, name, size, color="red"):
+        fi = os.path.join(self.source_dir, name)
+        Image.new("RGB", size, color).save(fi, "jpeg")
+        return fi
+
+    def test_get_derivative_widths(self):
+        self.assertEqual([480, 960, 1600], get_derivative_widths(2000))
+        self.assertEqual([480, 960, 1000], get_derivative_widths(1000))
+        self.assertEqual([300], get_derivative_widths(300))
+
+    def test_process(self):
+        meta = ImageDerivatives(self.output_dir, "/node-images/").process(self.sources)
+        self.assertEqual(["N1", "N2"], list(meta))
+        self.assertEqual(1000, meta["N1"]["image_width"])
+        self.assertEqual(500, meta["N1"]["image_height"])
+        self.assertTrue(
+            meta["N1"]["image_placeholder"].startswith("data:image/webp;base64,")
+        )
+        self.assertEqual(
+            "/node-images/N1-480.webp 480w, /node-images/N1-960.webp 960w, "
+            "/node-images/N1-1000.webp 1000w",
+            meta["N1"]["image_srcset"]["webp"],
+        )
+        self.assertEqual(
+            "/node-images/N2-300.jpg 300w", meta["N2"]["image_srcset"]["jpeg"]
+        )
+        with Image.open(os.path.join(self.output_dir, "N1-480.avif")) as image:
+            self.assertEqual((480, 240), image.size)
+
+    def test_only_changed_images_are_reprocessed(self):
+        ImageDerivatives(self.output_dir, "/node-images").process(self.sources)
+        unchanged_fi = os.path.join(self.output_dir, "N1-480.jpg")
+        changed_fi = os.path.join(self.output_dir, "N2-300.jpg")
+        os.utime(unchanged_fi, (0, 0))
+        os.utime(changed_fi, (0, 0))
+        self.mk_image("N2.JPG", (300, 200), "blue")
+        ImageDerivatives(self.output_dir, "/node-images").process(self.sources)
+        self.assertEqual(0, os.path.getmtime(unchanged_fi))
+        self.assertNotEqual(0, os.path.getmtime(changed_fi))
+
+    def test_corrupt_image(self):
+        for workers in [1, 2]:
+            ImageDerivatives(self.output_dir, "/node-images").process(self.sources)
+            with open(self.sources["N1"], mode="wb") as f:
+                f.write(b"not an image")
+            derivatives = ImageDerivatives(self.output_dir, "/node-images", workers)
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                meta = derivatives.process(self.sources)
+            # The other images are still processed, and N1's old derivatives are removed
+            self.assertEqual(["N2"], list(meta))
+            self.assertEqual(["N1"], list(derivatives.failures))
+            self.assertIn("failed to generate derivatives of N1", stdout.getvalue())
+            self.assertFalse(
+                any(fi.startswith("N1") for fi in os.listdir(self.output_dir))
+            )
+            self.mk_image("N1.jpg", (1000, 500))
+
+    def test_removed_images(self):
+        ImageDerivatives(self.output_dir, "/node-images").process(self.sources)
+        del self.sources["N1"]
+        ImageDerivatives(self.output_dir, "/node-images").process(self.sources)
+        self.assertEqual(
+            sorted([CACHE_FILE, "N2-300.avif", "N2-300.jpg", "N2-300.webp"]),
+            sorted(os.listdir(self.output_dir)),
+        )
@@ -0,0 +1,133 @@
+import hashlib
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+
+from scripts.image_fetch import ImageFetcher
+
+
+class ImageHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.client_address))
+        # Ignore the signature in the query string, as the image host does
+        path = self.path.split("?")[0]
+        if path == "/moved.png":
+            self.send_response(302)
+            self.send_header("Location", "/a.png")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if path not in server.images:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = server.images[path]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestImageFetch(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+        self.server.images = {"/a.png": b"image a", "/b.jpeg": b"image b"}
+        self.server.requests = []
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.output_dir = os.path.join(self.tmp_dir.name, "images")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def downloads(self, *paths):
+        return [
+            (self.base_url + path, os.path.join(self.output_dir, path[1:]))
+            for path in paths
+        ]
+
+    def test_fetch_all(self):
+        results = ImageFetcher(self.cache_dir, workers=1).fetch_all(
+            self.downloads("/a.png", "/b.jpeg")
+        )
+        self.assertEqual(["downloaded", "downloaded"], [r["status"] for r in results])
+        self.assertEqual([7, 7], [r["bytes"] for r in results])
+        with open(os.path.join(self.output_dir, "b.jpeg"), "rb") as f:
+            self.assertEqual(b"image b", f.read())
+        # A single worker reuses one connection for both requests
+        self.assertEqual(1, len({address for _, address in self.server.requests}))
+
+    def test_not_modified(self):
+        downloads = self.downloads("/a.png", "/b.jpeg")
+        ImageFetcher(self.cache_dir).fetch_all(downloads)
+        mtime = os.path.getmtime(downloads[0][1])
+        self.server.images["/b.jpeg"] = b"new image b"
+        results = ImageFetcher(self.cache_dir).fetch_all(downloads)
+        self.assertEqual(["not_modified", "downloaded"], [r["status"] for r in results])
+        self.assertEqual(mtime, os.path.getmtime(downloads[0][1]))
+        with open(downloads[1][1], "rb") as f:
+            self.assertEqual(b"new image b", f.read())
+
+    def test_signed_urls(self):
+        def downloads(signature):
+            return [
+                (
+                    f"{self.base_url}/a.png?signature={signature}",
+                    os.path.join(self.output_dir, "N1.png"),
+                    "N1/a.png",
+                )
+            ]
+
+        ImageFetcher(self.cache_dir).fetch_all(downloads(1))
+        results = ImageFetcher(self.cache_dir).fetch_all(downloads(2))
+        self.assertEqual("not_modified", results[0]["status"])
+        with open(os.path.join(self.output_dir, "N1.png"), "rb") as f:
+            self.assertEqual(b"image a", f.read())
+
+    def test_restore_from_cache(self):
+        downloads = self.downloads("/a.png")
+        ImageFetcher(self.cache_dir).fetch_all(downloads)
+        os.remove(downloads[0][1])
+        results = ImageFetcher(self.cache_dir).fetch_all(downloads)
+        self.assertEqual("not_modified", results[0]["status"])
+        with open(downloads[0][1], "rb") as f:
+            self.assertEqual(b"image a", f.read())
+
+    def test_redirect(self):
+        results = ImageFetcher(self.cache_dir).fetch_all(self.downloads("/moved.png"))
+        self.assertEqual("downloaded", results[0]["status"])
+        with open(os.path.join(self.output_dir, "moved.png"), "rb") as f:
+            self.assertEqual(b"image a", f.read())
+
+    def test_failure(self):
+        results = ImageFetcher(self.cache_dir).fetch_all(
+            self.downloads("/a.png", "/missing.png")
+        )
+        self.assertEqual(["downloaded", "failed"], [r["status"] for r in results])
+        self.assertIn("HTTP 404", results[1]["error"])
+        report = ImageFetcher.report(results)
+        self.assertIn("1 downloaded, 0 not modified, 1 failed", report)
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "missing.png")))
@@ -0,0 +1,97 @@
+import unittest
+
+from scripts.map_layout import compute_map_layout, get_layer_order, route_edge
+
+
+class TestMapLayout(unittest.TestCase):
+    def setUp(self):
+        # N3 and N4 feed into N2, which feeds into the final output N1. N5 feeds into N3 and N4
+        self.graph = {"N2": ["N1"], "N3": ["N2"], "N4": ["N2"], "N5": ["N3", "N4"]}
+        self.graph_reverse = {
+            "N1": ["N2"],
+            "N2": ["N3", "N4"],
+            "N3": ["N5"],
+            "N4": ["N5"],
+        }
+        self.node_to_meta = {
+            "N1": {"type": "ultimate_output", "stage_id": ""},
+            "N2": {"type": "process", "stage_id": "S2"},
+            "N3": {"type": "process", "stage_id": "S1"},
+            "N4": {"type": "process", "stage_id": "S1"},
+            "N5": {"type": "process", "stage_id": "S1"},
+            "N6": {"type": "process", "stage_id": "S3"},
+            "N7": {"type": "tool_resource", "stage_id": ""},
+        }
+
+    def test_get_layer_order(self):
+        graph = {"A": [1, 2, 3], "B": [1], "C": [1, 2], "D": [1, 2, 3, 4]}
+        self.assertEqual(
+            ["A", "B", "E", "C", "D"], get_layer_order(list("ABCDE"), graph)
+        )
+
+    def test_route_edge(self):
+        self.assertEqual(
+            {
+                "start": "N3",
+                "end": "N2",
+                "startAnchor": "bottom",
+                "endAnchor": "left",
+                "gridBreak": "0%",
+                "path": "grid",
+            },
+            route_edge(("N3", "N2"), {"N3": -0.5, "N2": 0}, {"N3": 1, "N2": 0}),
+        )
+        self.assertEqual(
+            "straight",
+            route_edge(("N3", "N4"), {"N3": 0, "N4": 1}, {"N3": 1, "N4": 1})["path"],
+        )
+        # Nodes without a position are joined top to bottom
+        edge = route_edge(("N2", "N1"), {"N2": 0}, {"N2": 0})
+        self.assertEqual(("bottom", "top"), (edge["startAnchor"], edge["endAnchor"]))
+
+    def test_compute_map_layout(self):
+        layout = compute_map_layout(self.graph, self.graph_reverse, self.node_to_meta)
+        self.assertEqual(
+            [
+                [],
+                {"stage": "S1"},
+                ["N5"],
+                ["N4", "N3"],
+                {"stage": "S2"},
+                ["N2"],
+                ["N1"],
+            ],
+            [row.get("nodes", row) for row in layout["layers"]],
+        )
+        self.assertEqual(
+            [["N2-N1"], ["N3-N2", "N4-N2"], ["N5-N3", "N5-N4"], []],
+            [
+                [f"{edge['start']}-{edge['end']}" for edge in edges]
+                for edges in layout["edges"]
+            ],
+        )
+        self.assertEqual(
+            [3, [], 2, ["N5"], 1, ["N4", "N3"], 0, ["N2"], ["N1"]],
+            [row.get("nodes", row.get("edges")) for row in layout["minimap"]],
+        )
+        self.assertEqual(["N6"], layout["unattached"])
+
+    def test_deferred_nodes(self):
+        # N59 is a parent of N2, but is not placed until N35 has been
+        graph = {"N2": ["N1"], "N35": ["N2"], "N59": ["N2", "N35"]}
+        graph_reverse = {"N1": ["N2"], "N2": ["N59", "N35"], "N35": ["N59"]}
+        node_to_meta = {
+            "N1": {"type": "ultimate_output"},
+            "N2": {"type": "process", "stage_id": "S2"},
+            "N35": {"type": "process", "stage_id": "S2"},
+            "N59": {"type": "process", "stage_id": "S2"},
+        }
+        layout = compute_map_layout(graph, graph_reverse, node_to_meta)
+        self.assertEqual(
+            [[], {"stage": "S2"}, ["N59"], ["N35"], ["N2"], ["N1"]],
+            [row.get("nodes", row) for row in layout["layers"]],
+        )
+        # The edge from N59 to N2 was routed while N59 was at its placeholder position
+        edge = layout["edges"][1][0]
+        self.assertEqual(("N59", "N2"), (edge["start"], edge["end"]))
+        self.assertEqual(("bottom", "left"), (edge["startAnchor"], edge["endAnchor"]))
@@ -0,0 +1,58 @@
+import unittest
+
+from scripts.md_render import MarkdownRenderer
+
+
+class TestMarkdownRenderer(unittest.TestCase):
+    def setUp(self):
+        self.renderer = MarkdownRenderer(cache_size=2)
+
+    def test_render_inline(self):
+        self.assertEqual(
+            "See <a target='_blank' rel='noopener' href=\"https://example.com\">"
+            "<em>this</em></a>",
+            self.renderer.render("See [*this*](https://example.com)"),
+        )
+        self.assertEqual(
+            "<a target='_blank' rel='noopener' href=\"https://example.com\">"
+            "https://example.com</a>",
+            self.renderer.render("<https://example.com>"),
+        )
+        self.assertEqual("", self.renderer.render(""))
+
+    def test_render_later_paragraphs(self):
+        self.assertEqual("one\n<p>two</p>", self.renderer.render("one\n\ntwo"))
+
+    def test_reference_links_are_per_document(self):
+        self.assertIn(
+            'href="https://example.com"',
+            self.renderer.render("[a][1]\n\n[1]: https://example.com"),
+        )
+        self.assertEqual("[a][1]", self.renderer.render("[a][1]"))
+
+    def test_cache(self):
+        self.renderer.render("a")
+        self.renderer.render("b")
+        self.renderer.render("a")
+        # "b" is least recently used, so it is evicted
+        self.renderer.render("c")
+        self.renderer.render("b")
+        self.assertEqual(
+            {"hit": 1, "miss": 4, "eviction": 2}, dict(self.renderer.stats)
+        )
+        self.assertEqual(["c", "b"], list(self.renderer.cache))
+
+    def test_render_many(self):
+        self.assertEqual(
+            ["<em>a</em>", "b", "<em>a</em>"],
+            self.renderer.render_many(["*a*", "b", "*a*"]),
+        )
+        self.assertEqual({"hit": 1, "miss": 2}, dict(self.renderer.stats))
+        self.assertEqual(
+            "markdown: 3 strings, 2 rendered, 1 cache hits (33%), 0 evictions",
+            self.renderer.report(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
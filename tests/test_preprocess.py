@@ -1,4 +1,10 @@
 import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
 from scripts.preprocess import (
@@ -7,7 +13,12 @@ from scripts.preprocess import (
     MATERIALS,
     MINOR_PROVISION,
     TOOLS,
+    BuildManifest,
     Preprocess,
+    _init_pdf_worker,
+    _mk_pdf_worker,
+    import_times,
+    lazy_import,
 )
 
 
@@ -93,10 +104,11 @@ class TestPreprocess(unittest.TestCase):
                 },
             },
         )
-        pp.write_provision(provision_fi, "tests/")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pp.write_provision(provision_fi, tmp_dir)
+            output_testing = open(os.path.join(tmp_dir, "provision.js")).read()
 
         output_truth = open("tests/test_provision.js").read()
-        output_testing = open("tests/provision.js").read()
 
         self.assertEqual(output_testing, output_truth)
 
@@ -104,10 +116,13 @@ class TestPreprocess(unittest.TestCase):
         self.maxDiff = None
         provider_fi = "./tests/test_providers.csv"
         pp = Preprocess(None, True)
-        bq_fi = pp.write_provider_bq_table(provider_fi)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # The table is written next to the providers csv
+            tmp_provider_fi = shutil.copy(provider_fi, tmp_dir)
+            bq_fi = pp.write_provider_bq_table(tmp_provider_fi)
+            output_testing = open(bq_fi).read()
 
         output_truth = open("tests/test_providers_bq_output.csv").read()
-        output_testing = open(bq_fi).read()
 
         self.assertEqual(output_testing, output_truth)
 
@@ -315,11 +330,165 @@ class TestPreprocess(unittest.TestCase):
 
     def test_write_descriptions(self):
         pp = Preprocess(None, True)
-        pp.write_descriptions(
-            "./tests/test_input.csv", "./tests/test_stages.csv", "tests/"
-        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pp.write_descriptions(
+                "./tests/test_input.csv", "./tests/test_stages.csv", tmp_dir
+            )
+            output_testing = open(os.path.join(tmp_dir, "N1.mdx")).read().strip()
 
         output_truth = open("tests/test_N1.mdx").read().strip()
-        output_testing = open("tests/N1.mdx").read().strip()
 
         self.assertEqual(output_testing, output_truth)
+
+    def test_write_search_index(self):
+        search_index = lazy_import("search_index", sibling=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pp = Preprocess(None, True)
+            pp.write_search_index(
+                "./tests/test_input.csv",
+                "./tests/test_stages.csv",
+                "./tests/test_providers.csv",
+                tmp_dir,
+            )
+            search_dir = os.path.join(tmp_dir, search_index.SEARCH_DIR)
+            with open(os.path.join(search_dir, "index.json")) as f:
+                index = json.load(f)
+            shards = {}
+            for key in index["shards"]:
+                with open(os.path.join(search_dir, "shards", f"{key}.json")) as f:
+                    shards[key] = json.load(f)
+        self.assertEqual(["S1", "stage", "Design"], index["docs"][0])
+        self.assertEqual(
+            ["N1", "process", "Logic chip design: Advanced CPUs"],
+            search_index.search(index, shards, "cpu", 1)[0],
+        )
+        # Organizations can be found by the country they are headquartered in
+        self.assertIn(
+            ["P9", "organization", "Intel"],
+            search_index.search(index, shards, "united states"),
+        )
+
+    def test_snapshot(self):
+        input_fis = ["./tests/test_input.csv", "./tests/test_stages.csv"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_fi = os.path.join(tmp_dir, "snapshot.pickle")
+            pp = Preprocess(None, True)
+            pp.mk_metadata(*input_fis)
+            pp.variants = {"N1": ["N2"]}
+            pp.save_snapshot(snapshot_fi, input_fis)
+
+            loaded = Preprocess(None, True)
+            loaded.load_snapshot(
+                snapshot_fi, ["tests/test_input.csv", "tests/test_stages.csv"]
+            )
+            self.assertEqual(pp.node_to_meta, loaded.node_to_meta)
+            self.assertEqual({"N1": ["N2"]}, loaded.variants)
+            self.assertIsNone(loaded.variant_index)
+            with self.assertRaisesRegex(ValueError, "out of date"):
+                loaded.load_snapshot(snapshot_fi, input_fis[:1])
+
+    def test_build_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_fi = os.path.join(tmp_dir, "manifest.json")
+            output_fi = os.path.join(tmp_dir, "out.js")
+            manifest = BuildManifest(manifest_fi)
+            self.assertTrue(manifest.input_changed("./tests/test_input.csv"))
+            self.assertTrue(manifest.artifact_changed("out", "abc", output_fi))
+            with open(output_fi, mode="w") as f:
+                f.write("out")
+            manifest.record_artifact("out", "abc", output_fi)
+            manifest.save()
+
+            manifest = BuildManifest(manifest_fi)
+            self.assertFalse(manifest.input_changed("./tests/test_input.csv"))
+            self.assertFalse(manifest.artifact_changed("out", "abc", output_fi))
+            self.assertTrue(manifest.artifact_changed("out", "def", output_fi))
+            # Outputs that were edited or only partly written are regenerated
+            with open(output_fi, mode="w") as f:
+                f.write("ou")
+            self.assertTrue(manifest.artifact_changed("out", "abc", output_fi))
+            os.remove(output_fi)
+            self.assertTrue(manifest.artifact_changed("out", "abc", output_fi))
+
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pp = Preprocess(None, True)
+            pp.manifest = BuildManifest(os.path.join(tmp_dir, "manifest.json"))
+            output_fi = os.path.join(tmp_dir, "graph.js")
+            self.assertTrue(pp._write_if_changed(output_fi, "const graph={};\n"))
+            pp.manifest.save()
+            os.utime(output_fi, (0, 0))
+
+            pp.manifest = BuildManifest(os.path.join(tmp_dir, "manifest.json"))
+            self.assertFalse(pp._write_if_changed(output_fi, "const graph={};\n"))
+            self.assertEqual(0, os.path.getmtime(output_fi))
+            self.assertTrue(pp._write_if_changed(output_fi, "const graph={1:2};\n"))
+            self.assertEqual("const graph={1:2};\n", open(output_fi).read())
+            pp.manifest.save()
+            with open(output_fi, mode="w") as f:
+                f.write("const graph=")
+            self.assertTrue(pp._write_if_changed(output_fi, "const graph={1:2};\n"))
+            self.assertEqual("const graph={1:2};\n", open(output_fi).read())
+
+    def test_write_artifact(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pp = Preprocess(None, True)
+            output_fi = os.path.join(tmp_dir, "graph.js")
+            self.assertTrue(pp._write_artifact(output_fi, "const graph={};\n"))
+            self.assertEqual(["graph.js"], os.listdir(tmp_dir))
+
+            pp.compressed_output = True
+            pp.manifest = BuildManifest()
+            self.assertTrue(pp._write_artifact(output_fi, "const graph={};\n"))
+            pp.manifest.save()
+            self.assertTrue(os.path.exists(output_fi + ".gz"))
+            os.remove(output_fi + ".gz")
+            # Missing companions are written even if the artifact is unchanged
+            self.assertFalse(pp._write_artifact(output_fi, "const graph={};\n"))
+            self.assertTrue(os.path.exists(output_fi + ".gz"))
+            self.assertEqual(
+                open(output_fi + ".sha256").read().split()[0],
+                BuildManifest.hash_content("const graph={};\n"),
+            )
+
+    def test_mk_pdf_worker_failure(self):
+        pp = Preprocess(None, True)
+        pp.manifest = BuildManifest()
+        pp.manifest.current["artifacts"]["N1.mdx"] = "abc"
+        _init_pdf_worker(pp, "images", {}, {}, {}, "tests/")
+        node_id, error, artifacts = _mk_pdf_worker(("N1", {"description": "Desc"}))
+        self.assertEqual("N1", node_id)
+        self.assertIn("KeyError", error)
+        self.assertEqual({}, artifacts)
+        self.assertEqual({"N1.mdx": "abc"}, pp.manifest.current["artifacts"])
+
+    def test_lazy_imports(self):
+        # Run in a fresh interpreter, since other tests may already have imported these
+        heavy_modules = [
+            "google.cloud.bigquery",
+            "jinja2",
+            "kaleido",
+            "mistletoe",
+            "numpy",
+            "pdfkit",
+            "plotly",
+            "pycountry",
+        ]
+        loaded = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; import scripts.preprocess; "
+                f"print([m for m in {heavy_modules} if m in sys.modules])",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        self.assertEqual("[]", loaded)
+
+    def test_lazy_import(self):
+        self.assertIs(sys.modules["json"], lazy_import("json"))
+        self.assertNotIn("json", import_times)
+        charts = lazy_import("charts", sibling=True)
+        self.assertEqual("scripts.charts", charts.__name__)
@@ -1,8 +1,9 @@
 const countryProvision={"United States": {"S1": 61.0, "S2": 27.0}};
 const countryFlags={"United States": "\ud83c\uddfa\ud83c\uddf8"};
 const countryProvisionConcentration={"S1": 1, "S2": 1};
+const upstreamChokepoints={};
 const orgProvision={"P9": {"N1": "Major"}};
 const processNodesWithOrgProvision=[];
-const providerMeta={"P1": {"name": "USA", "type": "country"}, "P2": {"name": "CHN", "type": "country"}, "P4": {"name": "KOR", "type": "country"}, "P9": {"name": "Intel", "type": "organization", "hq_flag": "\ud83c\uddfa\ud83c\uddf8", "hq_country": "United States"}, "P10": {"name": "AMD", "type": "organization", "hq_flag": "\ud83c\uddfa\ud83c\uddf8", "hq_country": "United States"}, "P15": {"name": "Phytium", "type": "organization", "hq_flag": "\ud83c\udde8\ud83c\uddf3", "hq_country": "China (mainland)"}};
+const providerMeta={"P1": {"name": "USA", "type": "country"}, "P10": {"hq_country": "United States", "hq_flag": "\ud83c\uddfa\ud83c\uddf8", "name": "AMD", "type": "organization"}, "P15": {"hq_country": "China (mainland)", "hq_flag": "\ud83c\udde8\ud83c\uddf3", "name": "Phytium", "type": "organization"}, "P2": {"name": "CHN", "type": "country"}, "P4": {"name": "KOR", "type": "country"}, "P9": {"hq_country": "United States", "hq_flag": "\ud83c\uddfa\ud83c\uddf8", "name": "Intel", "type": "organization"}};
 
-export {countryProvision, countryFlags, countryProvisionConcentration, orgProvision, processNodesWithOrgProvision, providerMeta};
+export {countryProvision, countryFlags, countryProvisionConcentration, upstreamChokepoints, orgProvision, processNodesWithOrgProvision, providerMeta};
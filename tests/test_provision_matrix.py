@@ -0,0 +1,207 @@
+import argparse
+import contextlib
+import io
+import tempfile
+import unittest
+
+import numpy as np
+
+from scripts.benchmark import generate_dataset
+from scripts.preprocess import Preprocess
+from scripts.provision_matrix import (
+    FLOAT_SHARE,
+    MAJOR,
+    MAJOR_PROVISION,
+    MINOR,
+    MINOR_PROVISION,
+    ProvisionMatrix,
+)
+
+
+def get_dict_concentration(country_provision: dict) -> dict:
+    """
+    Dict-based implementation of ProvisionMatrix.concentration that it replaced
+    """
+    threshold_tracker = {}
+    for country in country_provision:
+        for node in country_provision[country]:
+            provision_value = country_provision[country][node]
+            if provision_value == MINOR_PROVISION:
+                continue
+            threshold_tracker.setdefault(node, []).append(provision_value)
+    concentration = {}
+    for node, shares in threshold_tracker.items():
+        if MAJOR_PROVISION in shares:
+            shares = [80] if len(shares) < 3 else [20, 20, 20, 20]
+        else:
+            shares.sort(reverse=True)
+        num_countries = 0
+        curr_threshold = 0
+        while curr_threshold < 75 and num_countries < len(shares):
+            curr_threshold += shares[num_countries]
+            num_countries += 1
+        concentration[node] = num_countries if num_countries > 0 else None
+    return concentration
+
+
+def get_dict_node_to_country_provision(country_provision: dict) -> dict:
+    """
+    Dict-based implementation of ProvisionMatrix.node_to_country_provision that it replaced
+    """
+    node_to_country_provision = {}
+    for country in country_provision:
+        for node, provision in country_provision[country].items():
+            node_provision = node_to_country_provision.setdefault(
+                node, {"graph": [], "undefined": [], "all_names": []}
+            )
+            node_provision["all_names"].append(country)
+            if type(provision) is int:
+                node_provision["graph"].append({"country": country, "value": provision})
+            else:
+                node_provision["undefined"].append(
+                    country + (" (negligible)" if provision == MINOR_PROVISION else "")
+                )
+    for node_provision in node_to_country_provision.values():
+        node_provision["graph"].sort(key=lambda d: d["value"], reverse=True)
+        node_provision["undefined"].sort()
+        node_provision["all_names"].sort()
+    return node_to_country_provision
+
+
+def get_dict_node_to_provider_desc_list(org_provision: dict, provider_to_meta: dict):
+    """
+    Dict-based implementation of ProvisionMatrix.node_to_provider_desc_list that it replaced
+    """
+    node_to_org_desc_list = {}
+    for org in org_provision:
+        for node in org_provision[org]:
+            org_desc = provider_to_meta[org]["name"]
+            if org_provision[org][node] == MINOR_PROVISION:
+                org_desc += " (negligible market share)"
+            if provider_to_meta[org].get("hq_country"):
+                org_desc += " - " + provider_to_meta[org].get("hq_country")
+            node_to_org_desc_list.setdefault(node, []).append(org_desc.strip())
+    return {node: sorted(descs) for node, descs in node_to_org_desc_list.items()}
+
+
+class TestProvisionMatrix(unittest.TestCase):
+    def setUp(self):
+        self.matrix = ProvisionMatrix(
+            {
+                "US": {"N1": 50.0, "N2": MAJOR_PROVISION},
+                "JP": {"N1": 30.0, "N3": MINOR_PROVISION},
+                "KR": {"N1": 20.0, "N2": MAJOR_PROVISION},
+            }
+        )
+
+    def test_matrix(self):
+        self.assertEqual(["US", "JP", "KR"], self.matrix.providers)
+        self.assertEqual(["N1", "N2", "N3"], self.matrix.nodes)
+        # Entries are stored by node, then provider
+        np.testing.assert_array_equal([0, 0, 0, 1, 1, 2], self.matrix.cols)
+        np.testing.assert_array_equal([0, 1, 2, 0, 2, 1], self.matrix.rows)
+        np.testing.assert_array_equal([0, 3, 5, 6], self.matrix.col_starts)
+        self.assertEqual(FLOAT_SHARE, self.matrix.kind[0])
+        self.assertEqual(MAJOR, self.matrix.kind[4])
+        self.assertEqual(MINOR, self.matrix.kind[5])
+        np.testing.assert_array_equal([50, 30, 20], self.matrix.values[:3])
+        np.testing.assert_array_equal([False, True, True], self.matrix.major[2:5])
+        np.testing.assert_array_equal([3, 2, 0], self.matrix.num_counted)
+        self.assertEqual(([1], [MINOR]), self.matrix.get_node_entries(2))
+
+    def test_concentration(self):
+        self.assertEqual({"N1": 2, "N2": 1}, self.matrix.concentration())
+        self.assertEqual({"N1": 3, "N2": 1}, self.matrix.concentration(threshold=90))
+
+    def test_concentration_provider_mask(self):
+        self.assertEqual(
+            {"N1": 2, "N2": 1},
+            self.matrix.concentration(provider_mask=[False, True, True]),
+        )
+        self.assertEqual({}, self.matrix.concentration(provider_mask=[False] * 3))
+
+    def test_concentration_values(self):
+        caps = np.array([20.0, np.inf, np.inf])
+        capped = np.minimum(self.matrix.values, caps[self.matrix.rows])
+        self.assertEqual({"N1": 3, "N2": 1}, self.matrix.concentration(values=capped))
+
+    def test_get_unprovided(self):
+        self.assertEqual([], self.matrix.get_unprovided([]).tolist())
+        self.assertEqual([1], self.matrix.get_unprovided([0, 2]).tolist())
+        # N3 only has a negligible provider, so it was never provided
+        self.assertEqual([0, 1], self.matrix.get_unprovided([0, 1, 2, 2]).tolist())
+
+    def test_node_to_provider_desc_list(self):
+        matrix = ProvisionMatrix({"P1": {"N1": 10.0}, "P2": {"N1": MINOR_PROVISION}})
+        self.assertEqual(
+            {"N1": ["Acme - US", "Widgets (negligible market share)"]},
+            matrix.node_to_provider_desc_list(
+                {"P1": {"name": "Acme", "hq_country": "US"}, "P2": {"name": "Widgets"}}
+            ),
+        )
+
+    def assert_matches_dict_implementation(
+        self, country_provision: dict, org_provision: dict, provider_to_meta: dict
+    ):
+        country_matrix = ProvisionMatrix(country_provision)
+        concentration = country_matrix.concentration()
+        expected = get_dict_concentration(country_provision)
+        self.assertEqual(expected, concentration)
+        self.assertEqual(list(expected), list(concentration))
+        self.assertEqual(
+            get_dict_node_to_country_provision(country_provision),
+            country_matrix.node_to_country_provision(),
+        )
+        self.assertEqual(
+            get_dict_node_to_provider_desc_list(org_provision, provider_to_meta),
+            ProvisionMatrix(org_provision).node_to_provider_desc_list(provider_to_meta),
+        )
+        # Leaving providers out matches removing them from the dicts
+        provider_mask = np.arange(len(country_matrix.providers)) % 3 != 0
+        self.assertEqual(
+            get_dict_concentration(
+                {
+                    country: provision
+                    for (country, provision), keep in zip(
+                        country_provision.items(), provider_mask
+                    )
+                    if keep
+                }
+            ),
+            country_matrix.concentration(provider_mask=provider_mask),
+        )
+
+    def test_matches_dict_implementation(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = generate_dataset(tmp_dir, 2)
+            pp = Preprocess(argparse.Namespace(), is_test=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                pp.mk_metadata(files["inputs"], files["stages"])
+                pp.mk_provider_to_meta(files["providers"])
+                pp.write_provision(files["provision"], tmp_dir)
+        self.assertTrue(pp.country_provision and pp.org_provision)
+        self.assert_matches_dict_implementation(
+            pp.country_provision, pp.org_provision, pp.provider_to_meta
+        )
+        # The pipeline only produces float and "Major" values, so also check integer shares
+        # and negligible providers by replacing some of the generated values
+        mixed = [{}, {}]
+        for provision, mixed_provision in zip(
+            [pp.country_provision, pp.org_provision], mixed
+        ):
+            for idx, (provider, node, value) in enumerate(
+                (provider, node, value)
+                for provider, node_to_value in provision.items()
+                for node, value in node_to_value.items()
+            ):
+                if idx % 7 == 0:
+                    value = MINOR_PROVISION
+                elif idx % 2 == 0 and isinstance(value, float):
+                    value = round(value)
+                mixed_provision.setdefault(provider, {})[node] = value
+        self.assert_matches_dict_implementation(*mixed, pp.provider_to_meta)
+
+    def test_empty(self):
+        matrix = ProvisionMatrix({})
+        self.assertEqual({}, matrix.concentration())
+        self.assertEqual({}, matrix.node_to_country_provision())
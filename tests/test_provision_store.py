@@ -0,0 +1,57 @@
+import unittest
+
+from scripts.preprocess import Preprocess
+from scripts.provision_store import ProvisionStore
+
+
+class TestProvisionStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ProvisionStore()
+        self.store.add("US", "N1", 2021, 60.0)
+        self.store.add("JP", "N1", 2021, 40.0)
+        self.store.add("US", "N1", 2019, 80.0)
+        self.store.add("JP", "N2", None, "Major")
+        self.store.add("JP", "N1", 2022, 30.0)
+        self.store.add("KR", "N1", 2022, 70.0)
+
+    def test_get(self):
+        self.assertEqual(60.0, self.store.get("US", "N1"))
+        self.assertEqual(80.0, self.store.get("US", "N1", 2019))
+        self.assertEqual(30.0, self.store.get("JP", "N1"))
+        self.assertEqual("Major", self.store.get("JP", "N2"))
+        self.assertIsNone(self.store.get("KR", "N2"))
+        self.assertEqual(0, self.store.get("KR", "N1", 2019, default=0))
+
+    def test_years(self):
+        self.assertEqual([2019, 2021, 2022], self.store.years())
+
+    def test_view(self):
+        self.assertEqual(
+            {
+                "US": {"N1": 60.0},
+                "JP": {"N1": 30.0, "N2": "Major"},
+                "KR": {"N1": 70.0},
+            },
+            self.store.view(),
+        )
+        self.assertEqual(["US", "JP", "KR"], list(self.store.view()))
+        self.assertEqual({"US": {"N1": 80.0}}, self.store.view(2019))
+        self.assertEqual({}, self.store.view(2020))
+
+    def test_undated_rows_replace_each_other(self):
+        store = ProvisionStore()
+        store.add("US", "N1", None, 10.0)
+        store.add("US", "N1", None, 20.0)
+        self.assertEqual({"US": {"N1": 20.0}}, store.view())
+        self.assertEqual([], store.years())
+
+    def test_get_provision_concentration_series(self):
+        self.assertEqual(
+            {"N1": {2019: 1, 2021: 2, 2022: 2}},
+            Preprocess.get_provision_concentration_series(self.store),
+        )
+
+    def test_get_year(self):
+        self.assertEqual(2021, Preprocess.get_year({"year": " 2021 "}))
+        self.assertIsNone(Preprocess.get_year({"year": ""}))
+        self.assertIsNone(Preprocess.get_year({}))
@@ -0,0 +1,99 @@
+import unittest
+
+from scripts.provision_matrix import MAJOR_PROVISION, MINOR_PROVISION
+from scripts.scenarios import SCENARIO_FORMAT_VERSION, ScenarioEngine
+
+
+class TestScenarioEngine(unittest.TestCase):
+    def setUp(self):
+        # Tool T1 (with variant T2) and material M1 go into process P1, which goes into P2,
+        # which makes the final output O. Process P3 goes into O separately
+        node_to_meta = {
+            "P1": {"type": "process", "tools": ["T1"], "materials": ["M1"]},
+            "P2": {"type": "process", "tools": [], "materials": []},
+            "P3": {"type": "process", "tools": [], "materials": []},
+            "O": {"type": "ultimate_output", "tools": [], "materials": []},
+            "T1": {"type": "tool_resource"},
+            "T2": {"type": "tool_resource"},
+            "M1": {"type": "material_resource"},
+        }
+        graph = {"P1": ["P2"], "P2": ["O"], "P3": ["O"]}
+        country_provision = {
+            "Japan": {"T2": 80.0, "M1": 40.0},
+            "Taiwan": {"T2": 20.0, "M1": 30.0},
+            "United States": {"M1": 30.0, "P3": MINOR_PROVISION},
+        }
+        org_provision = {"P9": {"T2": MAJOR_PROVISION}, "P10": {"P3": MAJOR_PROVISION}}
+        provider_to_meta = {
+            "P9": {"name": "Canon", "type": "organization"},
+            "P10": {"name": "Acme", "type": "organization"},
+            "P11": {"name": "Idle Corp", "type": "organization"},
+        }
+        self.engine = ScenarioEngine(
+            country_provision,
+            org_provision,
+            provider_to_meta,
+            graph,
+            node_to_meta,
+            {"T2": ["T1"]},
+        )
+
+    def test_baseline(self):
+        self.assertEqual({"T2": 1, "M1": 3}, self.engine.baseline)
+        self.assertEqual(
+            {"concentration": {}, "unprovided": [], "affectedProcesses": []},
+            self.engine.run({}),
+        )
+
+    def test_remove_country(self):
+        self.assertEqual(
+            {"concentration": {"M1": 2}, "unprovided": [], "affectedProcesses": []},
+            self.engine.run({"remove": ["Japan"]}),
+        )
+
+    def test_remove_all_providers(self):
+        result = self.engine.run({"remove": ["Japan", "Taiwan", "Canon"]})
+        self.assertEqual({"T2": None, "M1": 1}, result["concentration"])
+        self.assertEqual(["T2"], result["unprovided"])
+        # T2 is a variant of T1, which P1 uses
+        self.assertEqual(["P1", "P2", "O"], result["affectedProcesses"])
+
+    def test_remove_some_providers(self):
+        # T2 is still provided by Canon, and P3 only by a negligible country
+        result = self.engine.run({"remove": ["Japan", "Taiwan"]})
+        self.assertEqual([], result["unprovided"])
+        result = self.engine.run({"remove": ["Canon", "Canon"]})
+        self.assertEqual([], result["unprovided"])
+
+    def test_remove_org(self):
+        # Orgs can be named by id or name, and negligible providers don't count
+        for org in ["P10", "Acme"]:
+            result = self.engine.run({"remove": [org]})
+            self.assertEqual(["P3"], result["unprovided"])
+            self.assertEqual(["P3", "O"], result["affectedProcesses"])
+        self.assertEqual([], self.engine.run({"remove": ["Idle Corp"]})["unprovided"])
+
+    def test_cap(self):
+        self.assertEqual(
+            {"T2": 2}, self.engine.run({"cap": {"Japan": 50}})["concentration"]
+        )
+        with self.assertRaisesRegex(ValueError, "Only country shares"):
+            self.engine.run({"cap": {"Canon": 30}})
+
+    def test_run_all(self):
+        results = self.engine.run_all(
+            [{"name": "no Japan", "remove": ["Japan"]}, {"name": "none"}]
+        )
+        self.assertEqual(SCENARIO_FORMAT_VERSION, results["version"])
+        self.assertEqual(self.engine.baseline, results["baseline"])
+        self.assertEqual(["no Japan", "none"], list(results["scenarios"]))
+        with self.assertRaisesRegex(
+            ValueError, "Unknown provider in scenario: Atlantis"
+        ):
+            self.engine.run_all([{"name": "a", "remove": ["Atlantis"]}])
+        with self.assertRaisesRegex(ValueError, "unique names"):
+            self.engine.run_all([{"name": "a"}, {"name": "a"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
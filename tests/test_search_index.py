@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+
+from scripts.search_index import (
+    OTHER_SHARD,
+    SearchIndexBuilder,
+    get_shard,
+    search,
+    tokenize,
+    write_search_index,
+)
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        builder = SearchIndexBuilder()
+        builder.add(
+            "N1",
+            "tool_resource",
+            "EUV lithography tools",
+            {
+                "name": "EUV lithography tools",
+                "description": "Made by [ASML](https://example.com/asml).",
+            },
+        )
+        builder.add(
+            "N2",
+            "process",
+            "Photolithography",
+            {"name": "Photolithography", "description": "Uses lithography tools."},
+        )
+        # Providers are listed once per alias
+        for alias in ["Netherlands", "Holland"]:
+            builder.add(
+                "P1",
+                "country",
+                "NLD",
+                {"name": "NLD", "alias": alias, "country": "Netherlands"},
+            )
+        builder.add(
+            "P2", "organization", "ASML", {"name": "ASML", "country": "Netherlands"}
+        )
+        self.index, self.shards = builder.build()
+
+    def test_tokenize(self):
+        self.assertEqual(
+            ["euv", "lithography", "tools", "see", "asml", "sao", "paulo"],
+            tokenize(
+                "EUV lithography tools, <b>see</b> [ASML](https://example.com/a) and "
+                "https://example.com/b. São Paulo, a"
+            ),
+        )
+
+    def test_get_shard(self):
+        self.assertEqual("e", get_shard("euv"))
+        self.assertEqual("3", get_shard("3d"))
+        self.assertEqual(OTHER_SHARD, get_shard("élan"))
+
+    def test_build(self):
+        self.assertEqual(
+            [
+                ["N1", "tool_resource", "EUV lithography tools"],
+                ["N2", "process", "Photolithography"],
+                ["P1", "country", "NLD"],
+                ["P2", "organization", "ASML"],
+            ],
+            self.index["docs"],
+        )
+        self.assertEqual(
+            ["a", "e", "h", "l", "m", "n", "p", "t", "u"], self.index["shards"]
+        )
+        self.assertEqual(["lithography"], self.shards["l"]["terms"])
+        # Names count for more than descriptions
+        self.assertEqual([[0, 8, 1, 1]], self.shards["l"]["postings"])
+        # Terms repeated between a provider's alias rows are only counted once
+        self.assertEqual(["netherlands", "nld"], self.shards["n"]["terms"])
+        self.assertEqual([[2, 9, 3, 3], [2, 8]], self.shards["n"]["postings"])
+
+    def test_search(self):
+        self.assertEqual(
+            ["N1", "N2"], [doc[0] for doc in search(self.index, self.shards, "lith")]
+        )
+        self.assertEqual(
+            ["N2"], [doc[0] for doc in search(self.index, self.shards, "photolith")]
+        )
+        self.assertEqual(
+            ["P2", "N1"], [doc[0] for doc in search(self.index, self.shards, "asml")]
+        )
+        self.assertEqual(
+            ["N1"],
+            [doc[0] for doc in search(self.index, self.shards, "lithography euv")],
+        )
+        self.assertEqual(
+            ["P1"], [doc[0] for doc in search(self.index, self.shards, "holl", 1)]
+        )
+        self.assertEqual([], search(self.index, self.shards, "xyz"))
+        self.assertEqual([], search(self.index, self.shards, "the"))
+
+    def test_write_search_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_search_index(self.index, self.shards, tmp_dir)
+            with open(os.path.join(tmp_dir, "search", "index.json")) as f:
+                self.assertEqual(self.index, json.load(f))
+            self.assertEqual(
+                sorted(f"{key}.json" for key in self.shards),
+                sorted(os.listdir(os.path.join(tmp_dir, "search", "shards"))),
+            )
+            with open(os.path.join(tmp_dir, "search", "shards", "l.json")) as f:
+                self.assertEqual(self.shards["l"], json.load(f))
+
+
+if __name__ == "__main__":
+    unittest.main()
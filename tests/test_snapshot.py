@@ -0,0 +1,52 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from scripts.snapshot import SNAPSHOT_VERSION, load_snapshot, save_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_fi = os.path.join(self.tmp_dir.name, "cache", "snapshot.pickle")
+        self.state = {"node_to_meta": {"N1": {"name": "CPUs"}}, "variants": {}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        save_snapshot(self.snapshot_fi, self.state, {"inputs.csv": "abc"})
+        self.assertEqual(
+            self.state, load_snapshot(self.snapshot_fi, {"inputs.csv": "abc"})
+        )
+        self.assertEqual(
+            ["snapshot.pickle"], os.listdir(os.path.dirname(self.snapshot_fi))
+        )
+
+    def test_missing(self):
+        with self.assertRaisesRegex(ValueError, "No snapshot"):
+            load_snapshot(self.snapshot_fi, {})
+
+    def test_changed_inputs(self):
+        save_snapshot(
+            self.snapshot_fi, self.state, {"inputs.csv": "abc", "stages.csv": "def"}
+        )
+        with self.assertRaisesRegex(ValueError, "changed inputs: inputs.csv$"):
+            load_snapshot(self.snapshot_fi, {"inputs.csv": "xyz", "stages.csv": "def"})
+        with self.assertRaisesRegex(ValueError, "changed inputs: stages.csv$"):
+            load_snapshot(self.snapshot_fi, {"inputs.csv": "abc"})
+
+    def test_version(self):
+        save_snapshot(self.snapshot_fi, self.state, {})
+        with open(self.snapshot_fi, mode="rb") as f:
+            snapshot = pickle.load(f)
+        snapshot["version"] = SNAPSHOT_VERSION - 1
+        with open(self.snapshot_fi, mode="wb") as f:
+            pickle.dump(snapshot, f)
+        with self.assertRaisesRegex(ValueError, "has version"):
+            load_snapshot(self.snapshot_fi, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from scripts.tables import CsvFormatError, Table, TableStore, stream_rows
+
+
+class TestTables(unittest.TestCase):
+    def test_read(self):
+        table = Table.read("./tests/test_provision.csv")
+        with open("./tests/test_provision.csv") as f:
+            expected_rows = list(csv.DictReader(f))
+        self.assertEqual(len(expected_rows), len(table))
+        self.assertEqual(expected_rows, list(table.rows()))
+        self.assertEqual(
+            [row["provider_id"] for row in expected_rows], table.column("provider_id")
+        )
+
+    def test_read_types(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_fi = os.path.join(tmp_dir, "provision.csv")
+            with open(csv_fi, mode="w", encoding="utf-8-sig") as f:
+                f.write("provided_id,year,share_provided\nN1,2021,50\nN2,2022\n")
+            table = Table.read(csv_fi, {"year": int})
+            self.assertEqual(
+                ["provided_id", "year", "share_provided"], table.fieldnames
+            )
+            self.assertEqual([2021, 2022], table.column("year"))
+            self.assertEqual(["50", ""], table.column("share_provided"))
+
+    def test_read_malformed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_fi = os.path.join(tmp_dir, "provision.csv")
+            with open(csv_fi, mode="w", encoding="utf-8-sig") as f:
+                f.write("a,b,a\n1,2,3\n4\n")
+            with self.assertRaisesRegex(CsvFormatError, "row 1: duplicate columns: a"):
+                Table.read(csv_fi)
+            with open(csv_fi, mode="w", encoding="utf-8-sig") as f:
+                f.write("a,b\n1,2,\n\n3,4,5\n")
+            with self.assertRaises(CsvFormatError) as context:
+                Table.read(csv_fi)
+            self.assertEqual(4, context.exception.row)
+            with open(csv_fi, mode="w", encoding="utf-8-sig") as f:
+                f.write("a,b\n1,2,\n3\n")
+            self.assertEqual(
+                [{"a": "1", "b": "2"}, {"a": "3", "b": ""}],
+                list(Table.read(csv_fi).rows()),
+            )
+
+    def test_rows_are_copies(self):
+        table = Table.read("./tests/test_providers.csv")
+        row = next(table.rows())
+        row["country"] = "changed"
+        self.assertNotEqual("changed", next(table.rows())["country"])
+
+    def test_table_store(self):
+        store = TableStore()
+        table = store.get("./tests/test_input.csv")
+        self.assertIs(table, store.get("tests/test_input.csv"))
+        self.assertEqual(list(table.rows()), list(store.rows("./tests/test_input.csv")))
+        self.assertEqual(len(table), store.rows_read)
+        store.invalidate("./tests/test_input.csv")
+        self.assertIsNot(table, store.get("./tests/test_input.csv"))
+
+    def test_table_store_streaming(self):
+        store = TableStore(streaming=True)
+        self.assertEqual(
+            list(stream_rows("./tests/test_input.csv")),
+            list(store.rows("./tests/test_input.csv")),
+        )
+        self.assertEqual({}, store.tables)
@@ -0,0 +1,90 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from scripts.tracing import StageTracer, get_peak_rss
+
+
+class TestStageTracer(unittest.TestCase):
+    def setUp(self):
+        self.rows = 0
+        self.tracer = StageTracer(counters={"rows": lambda: self.rows})
+
+    def test_stage(self):
+        with self.tracer.stage("read"):
+            self.rows += 3
+            with redirect_stdout(StringIO()) as out:
+                self.tracer.warn("unexpected_type", "unexpected type: x")
+                self.tracer.warn("unexpected_type", "unexpected type: y")
+        with self.tracer.stage("write"):
+            self.rows += 1
+        self.assertEqual("unexpected type: x\nunexpected type: y\n", out.getvalue())
+        read, write = self.tracer.stages
+        self.assertEqual("read", read["name"])
+        self.assertEqual(3, read["rows"])
+        self.assertEqual({"unexpected_type": 2}, read["warnings"])
+        self.assertEqual(1, write["rows"])
+        self.assertEqual({}, write["warnings"])
+        self.assertGreaterEqual(write["start_seconds"], read["start_seconds"])
+        for key in [
+            "wall_seconds",
+            "cpu_seconds",
+            "process_peak_rss_bytes",
+            "peak_rss_increase_bytes",
+        ]:
+            self.assertIn(key, read)
+        self.assertIn("read: ", self.tracer.report())
+        self.assertIn("3 rows, 2 unexpected_type warnings", self.tracer.report())
+
+    @unittest.skipIf(
+        get_peak_rss() is None, "peak RSS can't be measured on this platform"
+    )
+    def test_peak_rss_increase(self):
+        with self.tracer.stage("small"):
+            pass
+        with self.tracer.stage("large"):
+            data = bytearray(64 * 2**20)
+            data[:: 2**12] = b"x" * len(data[:: 2**12])
+        with self.tracer.stage("after"):
+            pass
+        small, large, after = self.tracer.stages
+        self.assertGreater(large["peak_rss_increase_bytes"], 32 * 2**20)
+        # Later stages share the process's high-water mark, but did not raise it
+        self.assertEqual(0, after["peak_rss_increase_bytes"])
+        self.assertGreaterEqual(
+            after["process_peak_rss_bytes"], large["process_peak_rss_bytes"]
+        )
+        self.assertIn("peak rss +", self.tracer.report())
+
+    def test_stage_error(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.stage("fail"):
+                raise ValueError("bad data")
+        self.assertEqual("ValueError('bad data')", self.tracer.stages[0]["error"])
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tracer = StageTracer(profile_dir=os.path.join(tmp_dir, "profiles"))
+            with tracer.stage("sort"):
+                sorted(range(1000), key=lambda i: -i)
+            trace_fi = os.path.join(tmp_dir, "trace.json")
+            tracer.save(trace_fi)
+            with open(trace_fi) as f:
+                trace = json.load(f)
+            (stage,) = trace["stages"]
+            self.assertEqual("sort", stage["name"])
+            self.assertTrue(os.path.exists(stage["profile"]["file"]))
+            self.assertTrue(stage["profile"]["top"])
+            self.assertIn("wall_seconds", trace)
+
+    def test_pickle(self):
+        tracer = pickle.loads(pickle.dumps(self.tracer))
+        self.assertEqual({}, tracer.counters)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import tempfile
+import unittest
+
+from scripts.preprocess import (
+    BASE_NODE_TYPES,
+    EXPECTED_TYPES,
+    VALID_COUNTRY_PROVISION_TYPES,
+)
+from scripts.tables import TableStore
+from scripts.validate import Validator
+
+CSVS = {
+    "inputs.csv": [
+        "input_id,input_name,type,stage_id",
+        "N1,Final,ultimate_output,",
+        "N2,Fab,process,S1",
+        "N3,Assembly,process,S9",
+        "N4,Tool,tool_resource,",
+        "N4,Tool again,tool_resource,",
+        "N5,Widget,widget,",
+        "N6,Tool variant,tool_resource,",
+        "N7,Other variant,tool_resource,",
+    ],
+    "stages.csv": ["stage_id,stage_name", "S1,Fabrication"],
+    "sequence.csv": [
+        "input_id,goes_into_id,is_type_of_id",
+        "N2,N1,",
+        "N3,N2,",
+        "N2,N3,",
+        "N2,N4,",
+        "N4,N9,",
+        ",,",
+        "N4,,",
+        "N6,,N7",
+        "N7,,N6",
+    ],
+    "providers.csv": [
+        "provider_id,provider_name,provider_type,country",
+        "P1,USA,country,",
+        "P2,Acme,organization,USA",
+        "P2,Acme,organization,USA",
+        "P2,Acme Corp,organization,USA",
+        "P3,Somewhere,planet,",
+    ],
+    "provision.csv": [
+        "provider_id,provided_id,share_provided,year",
+        "P1,N4,60%,2021",
+        "P1,N4,50,2021",
+        "P1,N2,,",
+        "P9,N4,,",
+        "P2,N99,,",
+        "P2,N4,lots,",
+        "P2,N4,120,",
+        "P2,N4,,next year",
+    ],
+}
+
+
+class TestValidator(unittest.TestCase):
+    def validate(self, csvs: dict) -> list:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for name, lines in csvs.items():
+                files.append(os.path.join(tmp_dir, name))
+                with open(files[-1], mode="w") as f:
+                    f.write("\n".join(lines) + "\n")
+            issues = Validator(
+                TableStore(),
+                EXPECTED_TYPES,
+                BASE_NODE_TYPES,
+                VALID_COUNTRY_PROVISION_TYPES,
+            ).validate(*files)
+        return [
+            (os.path.basename(i["file"]), i["row"], i["severity"], i["message"])
+            for i in issues
+        ]
+
+    def test_validate(self):
+        expected = [
+            ("inputs.csv", 6, "error", "duplicate input_id N4 (first seen in "),
+            ("inputs.csv", 4, "error", "process N3 has unknown stage 'S9'"),
+            ("inputs.csv", 7, "error", "unexpected type 'widget'"),
+            ("sequence.csv", 5, "error", "process N2 goes into N4, which is a "),
+            ("sequence.csv", 6, "error", "unknown goes_into_id N9"),
+            ("sequence.csv", 8, "error", "N4 has no goes_into_id or is_type_of_id"),
+            ("sequence.csv", None, "error", "cycle in process graph: N"),
+            ("sequence.csv", None, "error", "Cycle in node variants: N"),
+            ("providers.csv", 5, "error", "provider_id P2 has a different name, "),
+            ("providers.csv", 6, "error", "unexpected type 'planet'"),
+            ("provision.csv", 4, "warning", "country P1 provides N2, which is a "),
+            ("provision.csv", 5, "error", "unknown provider_id P9"),
+            ("provision.csv", 6, "error", "unknown provided_id N99"),
+            ("provision.csv", 7, "error", "invalid share_provided 'lots'"),
+            ("provision.csv", 8, "error", "share_provided 120 is not between 0 "),
+            ("provision.csv", 9, "error", "invalid year 'next year'"),
+            ("provision.csv", 2, "warning", "country shares of N4 in 2021 add up "),
+        ]
+        issues = self.validate(CSVS)
+        self.assertEqual(
+            expected,
+            [
+                (fi, row, severity, message[: len(expected_message)])
+                for (fi, row, severity, message), (*_, expected_message) in zip(
+                    issues, expected
+                )
+            ],
+        )
+        self.assertEqual(len(expected), len(issues))
+
+    def test_validate_data(self):
+        tables = TableStore()
+        issues = Validator(
+            tables, EXPECTED_TYPES, BASE_NODE_TYPES, VALID_COUNTRY_PROVISION_TYPES
+        ).validate(
+            os.path.join("data", "inputs.csv"),
+            os.path.join("data", "stages.csv"),
+            os.path.join("data", "sequence.csv"),
+            os.path.join("data", "providers.csv"),
+            os.path.join("data", "provision.csv"),
+        )
+        self.assertEqual([], issues)
+
+    def test_missing_columns(self):
+        csvs = dict(CSVS, **{"stages.csv": ["stage_id", "S1"]})
+        self.assertIn(
+            ("stages.csv", 1, "error", "missing columns: stage_name"),
+            self.validate(csvs),
+        )
+
+    def test_malformed_csv(self):
+        csvs = dict(
+            CSVS,
+            **{
+                "stages.csv": ["stage_id,stage_name,stage_id", "S1,Fab,S1"],
+                "providers.csv": CSVS["providers.csv"] + ["P9,Extra,country,USA,value"],
+            },
+        )
+        issues = self.validate(csvs)
+        self.assertIn(("stages.csv", 1, "error", "duplicate columns: stage_id"), issues)
+        self.assertIn(
+            (
+                "providers.csv",
+                len(CSVS["providers.csv"]) + 1,
+                "error",
+                "5 values, but the header only has 4 columns",
+            ),
+            issues,
+        )
+
+    def test_report(self):
+        self.assertEqual(
+            "a.csv:2: error: bad\nb.csv: warning: odd\nvalidation: 1 errors, 1 warnings",
+            Validator.report(
+                [
+                    {"severity": "error", "file": "a.csv", "row": 2, "message": "bad"},
+                    {
+                        "severity": "warning",
+                        "file": "b.csv",
+                        "row": None,
+                        "message": "odd",
+                    },
+                ]
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
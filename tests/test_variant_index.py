@@ -0,0 +1,52 @@
+import unittest
+
+from scripts.variant_index import build_variant_index
+
+
+class TestVariantIndex(unittest.TestCase):
+    def test_build_variant_index(self):
+        # N2 is listed before its own variants are, and N5 is a variant of both N3 and N4
+        variants = {
+            "N1": ["N2", "N3"],
+            "N2": ["N4"],
+            "N4": ["N5", "N6"],
+            "N3": ["N5"],
+        }
+        index = build_variant_index(variants)
+        self.assertEqual(
+            {
+                "N1": ["N2", "N3", "N4", "N5", "N6"],
+                "N2": ["N4", "N5", "N6"],
+                "N4": ["N5", "N6"],
+                "N3": ["N5"],
+            },
+            index["descendants"],
+        )
+        self.assertEqual(
+            {
+                "N2": ["N1"],
+                "N3": ["N1"],
+                "N4": ["N2", "N1"],
+                "N5": ["N3", "N4", "N1", "N2"],
+                "N6": ["N4", "N2", "N1"],
+            },
+            index["ancestors"],
+        )
+        self.assertEqual(["N2", "N3", "N4", "N5", "N6"], list(index["ancestors"]))
+
+    def test_cycle(self):
+        with self.assertRaisesRegex(ValueError, "N2 -> N3 -> N2"):
+            build_variant_index({"N1": ["N2"], "N2": ["N3"], "N3": ["N2"]})
+        with self.assertRaisesRegex(ValueError, "N1 -> N1"):
+            build_variant_index({"N1": ["N1"]})
+
+    def test_deep_chain(self):
+        # Long chains don't hit the recursion limit
+        variants = {f"N{i}": [f"N{i + 1}"] for i in range(1500)}
+        index = build_variant_index(variants)
+        self.assertEqual(1500, len(index["descendants"]["N0"]))
+        self.assertEqual("N0", index["ancestors"]["N1500"][-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
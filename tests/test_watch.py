@@ -0,0 +1,145 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from scripts.preprocess import BuildManifest, Preprocess
+from scripts.tables import Table
+from scripts.watch import Watcher, get_changed_columns, get_stages
+
+
+class TestWatch(unittest.TestCase):
+    def test_get_changed_columns(self):
+        old = Table(["id", "name"], {"id": ["N1", "N2"], "name": ["a", "b"]})
+        self.assertEqual(
+            set(),
+            get_changed_columns(
+                old, Table(["id", "name"], {"id": ["N1", "N2"], "name": ["a", "b"]})
+            ),
+        )
+        self.assertEqual(
+            {"name"},
+            get_changed_columns(
+                old, Table(["id", "name"], {"id": ["N1", "N2"], "name": ["a", "c"]})
+            ),
+        )
+        self.assertEqual(
+            {"id", "name"},
+            get_changed_columns(
+                old, Table(["id", "name"], {"id": ["N1"], "name": ["a"]})
+            ),
+        )
+        self.assertEqual({"id"}, get_changed_columns(None, Table(["id"], {"id": []})))
+
+    def test_get_stages(self):
+        self.assertEqual(
+            ["write_descriptions", "write_search_index"],
+            get_stages({"nodes": {"description"}}),
+        )
+        self.assertEqual(
+            [
+                "mk_metadata",
+                "write_descriptions",
+                "mk_images",
+                "mk_image_derivatives",
+                "write_graphs",
+                "write_provision",
+                "write_search_index",
+                "write_chunks",
+            ],
+            get_stages({"nodes": {"input_name", "description"}}),
+        )
+        self.assertEqual(
+            ["write_provision"],
+            get_stages(
+                {"provision": {"share_provided"}},
+                ["mk_metadata", "write_provision"],
+            ),
+        )
+        self.assertEqual([], get_stages({"nodes": set()}))
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ["inputs", "stages", "sequence", "providers", "provision"]:
+            shutil.copy(os.path.join("data", f"{name}.csv"), self.tmp_dir)
+        self.args = argparse.Namespace(
+            nodes=os.path.join(self.tmp_dir, "inputs.csv"),
+            stages=os.path.join(self.tmp_dir, "stages.csv"),
+            sequence=os.path.join(self.tmp_dir, "sequence.csv"),
+            providers=os.path.join(self.tmp_dir, "providers.csv"),
+            provision=os.path.join(self.tmp_dir, "provision.csv"),
+            images_file=os.path.join("data", "site_artifacts", "images.csv"),
+            output_dir=self.tmp_dir,
+            output_text_dir=self.tmp_dir,
+            output_images_dir=self.tmp_dir,
+            image_cache_dir=self.tmp_dir,
+            image_derivatives=False,
+            chunked_output=False,
+            search_index=True,
+        )
+        self.preprocess = Preprocess(self.args, is_test=True)
+        self.preprocess.manifest = BuildManifest()
+        self.watcher = Watcher(self.preprocess, self.args)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for stage in self.watcher.stages:
+                self.watcher.run_stage(stage)
+        self.preprocess.manifest.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.tmp_dir, name), encoding="utf-8") as f:
+            return f.read()
+
+    def edit(self, name: str, old: str, new: str) -> None:
+        content = self.read(name)
+        self.assertIn(old, content)
+        with open(os.path.join(self.tmp_dir, name), mode="w", encoding="utf-8") as f:
+            f.write(content.replace(old, new, 1))
+
+    def apply(self) -> list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.watcher.apply(self.watcher.poll())
+
+    def test_description_change(self):
+        graph = self.read("graph.js")
+        self.edit("inputs.csv", "Central processing units", "Zorblax processing units")
+        bytes_written = self.preprocess.bytes_written
+        self.assertEqual(["write_descriptions", "write_search_index"], self.apply())
+        self.assertIn("Zorblax", self.read("N1.mdx"))
+        self.assertIn(
+            '"zorblax"', self.read(os.path.join("search", "shards", "z.json"))
+        )
+        self.assertEqual(graph, self.read("graph.js"))
+        # Only the changed description and search shard are rewritten
+        self.assertLess(self.preprocess.bytes_written - bytes_written, 20000)
+        self.assertEqual([], self.apply())
+
+    def test_sequence_change(self):
+        graph = self.read("graph.js")
+        sequence = self.read("sequence.csv")
+        first_edge = sequence.splitlines()[1]
+        self.edit("sequence.csv", first_edge + "\n", "")
+        self.assertIn("write_graphs", self.apply())
+        self.assertNotEqual(graph, self.read("graph.js"))
+        # Metadata is rebuilt rather than added to, so restoring the file restores the output
+        with open(self.args.sequence, mode="w", encoding="utf-8") as f:
+            f.write(sequence)
+        self.assertIn("write_graphs", self.apply())
+        self.assertEqual(graph, self.read("graph.js"))
+
+    def test_invalid_change(self):
+        provision = self.read("provision.js")
+        self.edit("provision.csv", ",P1,", ",P99999,")
+        self.assertEqual([], self.apply())
+        self.assertEqual(provision, self.read("provision.js"))
+
+
+if __name__ == "__main__":
+    unittest.main()